@@ -1,17 +1,29 @@
-from .trade import Trade
-from .signal_generator import SignalGenerator
-from .portfolio_manager import PortfolioManager
-from .performance import calculate_trade_based_metrics
-from .backtest_engine import BacktestEngine
-from .grid_search import run_hyperparameter_grid_search
-from .main import run_backtest
+import importlib
 
-__all__ = [
-    'Trade',
-    'SignalGenerator',
-    'PortfolioManager',
-    'calculate_trade_based_metrics',
-    'BacktestEngine',
-    'run_hyperparameter_grid_search',
-    'run_backtest'
-]
\ No newline at end of file
+# Public names and their modules, imported on first access so `python -m backtest` and light
+# submodules start without loading pandas, scipy and the engine
+_EXPORTS = {
+    'Trade': 'trade',
+    'SignalGenerator': 'signal_generator',
+    'PortfolioManager': 'portfolio_manager',
+    'calculate_trade_based_metrics': 'performance',
+    'BacktestEngine': 'backtest_engine',
+    'BacktestSession': 'session',
+    'SignalQuality': 'signal_quality',
+    'run_hyperparameter_grid_search': 'grid_search',
+    'run_backtest': 'main',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,189 @@
+import numpy as np
+
+# Capital allocation modes for new entries (the ALLOCATION hyperparameter)
+ALLOCATION_MODES = ('inverse_vol', 'water_fill')
+
+# Share of a stock's 20-day average volume a single leg may trade
+ADV_PARTICIPATION = 0.1
+
+
+def _truncate(values):
+    """int() of every value (truncation toward zero) as int64"""
+    return np.trunc(values).astype(np.int64)
+
+
+def _liquidity_shares(adv):
+    """Per-leg ADV cap in whole shares (0 where ADV20 is unusable) and whether ADV20 is usable"""
+    liquid = np.isfinite(adv) & (adv > 0)
+    return _truncate(np.where(liquid, adv, 0.0) * ADV_PARTICIPATION), liquid
+
+
+def _max_shares(capital_shares, adv):
+    """Vectorized PortfolioManager._calculate_max_shares for positive prices"""
+    liquidity_shares, liquid = _liquidity_shares(adv)
+    capped = np.where(capital_shares > 0, np.maximum(1, np.minimum(capital_shares, liquidity_shares)), 0)
+    return np.where(liquid, capped, np.maximum(1, capital_shares))
+
+
+def _leg_caps(adv):
+    """Per-leg ADV cap in whole shares, inf where ADV20 is unusable"""
+    liquidity_shares, liquid = _liquidity_shares(adv)
+    return np.where(liquid, liquidity_shares, np.inf)
+
+
+def _liquidity_capacity(px_b, px_w, caps_b, caps_w):
+    """Pair capital beyond which neither leg can grow (both at their share caps; inf if a leg has no cap)"""
+    # Capital is split equally between the legs
+    return np.maximum(2 * caps_b * px_b, 2 * caps_w * px_w)
+
+
+def water_fill(weights, capital, capacity, max_iterations=10):
+    """
+    Split capital in proportion to weights, with every allocation capped at its capacity.
+
+    Capital above a pair's capacity is redistributed over the pairs still
+    below theirs, in proportion to their weights, until no allocation
+    exceeds its capacity (or max_iterations rounds). Each round is a few
+    array operations.
+    """
+    allocation = weights / weights.sum() * capital
+    free = np.ones(len(weights), dtype=bool)
+    for _ in range(max_iterations):
+        over = free & (allocation > capacity)
+        if not over.any():
+            break
+        allocation[over] = capacity[over]
+        free &= ~over
+        remaining = capital - allocation[~free].sum()
+        if remaining <= 0 or not free.any():
+            break
+        allocation[free] = weights[free] / weights[free].sum() * remaining
+    return allocation
+
+
+def allocate_entries(px_b, px_w, vol_b, vol_w, adv_b, adv_w, available_capital, cost_per_share,
+                     mode='inverse_vol', leg_caps=None):
+    """
+    Size a day's candidate pair entries with array operations.
+
+    Inputs are one float array per quantity, aligned with the day's signals
+    (NaN where the market data is missing). In 'inverse_vol' mode each pair
+    gets capital in proportion to 1 / mean GARCH volatility of its legs,
+    split equally between the legs. Each leg is capped at 10% of ADV20.
+    This is the same arithmetic, in the same order, as sizing the signals
+    one by one. 'water_fill' instead hands capital that the ADV caps would
+    leave idle to the pairs that can still absorb it (see water_fill).
+    `leg_caps` optionally gives the (black, white) share counts water_fill
+    fills each leg up to instead of the ADV caps (inf where uncapped), such
+    as the per-stock budget headroom when orders are netted.
+
+    Returns:
+    --------
+    dict of arrays aligned with the inputs: 'status' (0 sized, 1 missing
+    volatility, 2 missing price, 3 zero shares), 'allocation', 'shares_black',
+    'shares_white', 'investment_black', 'investment_white', 'entry_cost',
+    'total_cost' and 'liquidity_bound'; or None if no pair has a usable
+    volatility. NaN ADV20 values disable the per-leg cap (as used when
+    orders are netted against per-stock budgets instead, see netting.py).
+    """
+    if mode not in ALLOCATION_MODES:
+        raise ValueError(f"Unknown allocation mode: {mode}. Use one of {ALLOCATION_MODES}.")
+    n = len(px_b)
+    status = np.zeros(n, dtype=np.int8)
+
+    valid_vol = np.isfinite(vol_b) & np.isfinite(vol_w) & (vol_b != 0) & (vol_w != 0)
+    status[~valid_vol] = 1
+    inv_vol = np.zeros(n)
+    inv_vol[valid_vol] = 1 / ((vol_b[valid_vol] + vol_w[valid_vol]) / 2)
+    # Accumulated in signal order, like the scalar loop
+    total_inv_vol = np.cumsum(inv_vol[valid_vol])[-1] if valid_vol.any() else 0
+    if total_inv_vol == 0:
+        return None
+
+    valid_price = np.isfinite(px_b) & np.isfinite(px_w) & (px_b > 0) & (px_w > 0)
+    status[valid_vol & ~valid_price] = 2
+    sized = valid_vol & valid_price
+    # Placeholder prices keep the arithmetic finite for rows that are not sized
+    px_b = np.where(sized, px_b, 1.0)
+    px_w = np.where(sized, px_w, 1.0)
+
+    # Pairs filled up to their liquidity capacity are liquidity-bound whatever their share counts
+    filled = np.zeros(n, dtype=bool)
+    if mode == 'water_fill':
+        # Pairs without prices cannot use capital, so it is shared among the sized ones
+        allocation = np.zeros(n)
+        caps_b, caps_w = leg_caps if leg_caps is not None else (_leg_caps(adv_b), _leg_caps(adv_w))
+        capacity = _liquidity_capacity(px_b[sized], px_w[sized], caps_b[sized], caps_w[sized])
+        if sized.any():
+            allocation[sized] = water_fill(inv_vol[sized], available_capital, capacity)
+            filled[sized] = allocation[sized] >= capacity
+    else:
+        allocation = (inv_vol / total_inv_vol) * available_capital
+
+    leg_capital = allocation / 2
+    capital_shares_b = _truncate(leg_capital / px_b)
+    capital_shares_w = _truncate(leg_capital / px_w)
+    if filled.any():
+        # A pair filled to capacity holds both legs at their caps (both are finite, or the capacity would
+        # be infinite); dividing the capacity back by the price can truncate a share short of the cap
+        capital_shares_b = np.where(filled, np.maximum(capital_shares_b, caps_b), capital_shares_b).astype(np.int64)
+        capital_shares_w = np.where(filled, np.maximum(capital_shares_w, caps_w), capital_shares_w).astype(np.int64)
+    max_shares_b = _max_shares(capital_shares_b, adv_b)
+    max_shares_w = _max_shares(capital_shares_w, adv_w)
+    shares_b = np.where(max_shares_b > 0, np.minimum(capital_shares_b, max_shares_b), capital_shares_b)
+    shares_w = np.where(max_shares_w > 0, np.minimum(capital_shares_w, max_shares_w), capital_shares_w)
+
+    zero_shares = sized & ((shares_b == 0) | (shares_w == 0))
+    status[zero_shares] = 3
+
+    return {
+        'status': status,
+        'allocation': np.where(sized, allocation, 0.0),
+        'liquidity_bound': ((max_shares_b < capital_shares_b) & (max_shares_w < capital_shares_w)) | filled,
+        **entry_costs(shares_b, shares_w, px_b, px_w, cost_per_share),
+    }
+
+
+def entry_costs(shares_b, shares_w, px_b, px_w, cost_per_share):
+    """Share counts with the investments, transaction cost and total capital they require"""
+    investment_black = shares_b * px_b
+    investment_white = shares_w * px_w
+    entry_cost = cost_per_share * (shares_b + shares_w)
+    return {
+        'shares_black': shares_b,
+        'shares_white': shares_w,
+        'investment_black': investment_black,
+        'investment_white': investment_white,
+        'entry_cost': entry_cost,
+        'total_cost': investment_black + investment_white + entry_cost,
+    }
+
+
+def fund_in_order(total_cost, available_capital):
+    """
+    Accept entries in order while their cost fits in the capital left.
+
+    An entry that does not fit is skipped and later, cheaper ones may still
+    be accepted. The running total is a cumulative sum; only entries after
+    the first rejection are checked one by one.
+
+    Returns (accepted mask, capital used).
+    """
+    accepted = np.zeros(len(total_cost), dtype=bool)
+    if len(total_cost) == 0:
+        return accepted, 0
+    used_before = np.concatenate([[0.0], np.cumsum(total_cost)[:-1]])
+    rejected = np.flatnonzero(total_cost > available_capital - used_before)
+    if len(rejected) == 0:
+        accepted[:] = True
+        return accepted, used_before[-1] + total_cost[-1]
+
+    first = rejected[0]
+    accepted[:first] = True
+    capital_used = used_before[first]
+    for i in range(first + 1, len(total_cost)):
+        if total_cost[i] > available_capital - capital_used:
+            continue
+        capital_used += total_cost[i]
+        accepted[i] = True
+    return accepted, capital_used
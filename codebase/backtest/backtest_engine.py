@@ -1,106 +1,274 @@
 import gc
+import logging
+import os
+import time
+from functools import partial
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
-from tqdm import tqdm
 
 from .signal_generator import SignalGenerator
 from .portfolio_manager import PortfolioManager
 from .performance import calculate_trade_based_metrics
+from .schema import compact_frame, memory_report, quarter_codes, quarter_label
+from .pair_universe import PairUniverse
+from .results_sink import run_hash
+from .checkpoint import QuarterCheckpoint
+from .scheduler import MemoryScheduler, estimate_frame_bytes
 
-def _process_quarter_parallel(quarter, df_main, filtered_pairs, signal_generator, initial_capital, max_holding_days):
-    """Process a single quarter in parallel"""
+logger = logging.getLogger(__name__)
+
+def filter_pairs(df_pairs, corr_threshold, coint_threshold):
+    """Filter pairs on correlation and cointegration p-value thresholds
+
+    A threshold of None, or a missing statistic column, disables that filter.
+    """
+    # Apply filters if thresholds are provided AND columns exist
+    filter_condition = pd.Series(True, index=df_pairs.index)
+    
+    # Check correlation columns
+    if corr_threshold is not None:
+        if 'corr' in df_pairs.columns:
+            filter_condition &= df_pairs['corr'] >= corr_threshold
+        elif 'correlation' in df_pairs.columns:
+            filter_condition &= df_pairs['correlation'] >= corr_threshold
+        else:
+            logger.warning("No correlation column found in pairs data, skipping correlation filter")
+    
+    # Check cointegration columns
+    if coint_threshold is not None:
+        if 'coint_pval' in df_pairs.columns:
+            filter_condition &= df_pairs['coint_pval'] <= coint_threshold
+        elif 'pval' in df_pairs.columns:
+            filter_condition &= df_pairs['pval'] <= coint_threshold
+        elif 'p_value' in df_pairs.columns:
+            filter_condition &= df_pairs['p_value'] <= coint_threshold
+        else:
+            logger.warning("No cointegration p-value column found in pairs data, skipping cointegration filter")
+    
+    return df_pairs[filter_condition]
+
+def combine_equity_curves(quarter_curves, initial_capital):
+    """Chain per-quarter equity curves into one portfolio-level daily series
+
+    Every quarter starts from the initial capital, so each quarter's PnL
+    is stacked on top of the cumulative PnL of the quarters before it.
+    Curves must be given in chronological order.
+    """
+    columns = ['date', 'equity', 'realized_pnl', 'unrealized_pnl', 'daily_pnl', 'return']
+    if not quarter_curves:
+        return pd.DataFrame(columns=columns)
+    
+    chained = []
+    realized_offset = 0.0
+    for curve in quarter_curves:
+        curve = curve.copy()
+        # Days without an update (e.g. a failed day) carry the previous values
+        curve[['realized_pnl', 'unrealized_pnl']] = curve[['realized_pnl', 'unrealized_pnl']].ffill().fillna(0.0)
+        curve['realized_pnl'] += realized_offset
+        realized_offset = curve['realized_pnl'].iloc[-1]
+        chained.append(curve)
+    
+    combined = pd.concat(chained, ignore_index=True)
+    combined['equity'] = initial_capital + combined['realized_pnl'] + combined['unrealized_pnl']
+    previous_equity = combined['equity'].shift(1).fillna(initial_capital)
+    combined['daily_pnl'] = combined['equity'] - previous_equity
+    combined['return'] = combined['daily_pnl'] / previous_equity
+    return combined[columns]
+
+def _process_quarter_batch(quarter, df_main, pair_universe, signal_generator, configs):
+    """Process a single quarter for several simulation configurations in lockstep
+
+    `configs` is a list of (initial_capital, max_holding_days, zscore_threshold,
+    allocation, netting) tuples. The signal generator must use the loosest (smallest) threshold;
+    stricter configurations get the subset of its signals that pass their
+    threshold. Every configuration has its own
+    PortfolioManager (capital, open positions, exit rule) but the quarter's
+    data, market lookups and daily signals are read once per date.
+    """
     # Filter data for this quarter
     quarter_data = df_main[df_main['quarter'] == quarter]
     if quarter_data.empty:
-        print(f"Warning: No data found for quarter {quarter}")
-        return {'quarter': quarter, 'trade_log': [], 'performance': {}}
-    
-    print(f"Processing calendar quarter {quarter}")
+        logger.warning("No data found for quarter %s", quarter_label(quarter))
+        return [{'quarter': quarter_label(quarter), 'trade_log': [], 'performance': {}, 'equity_curve': None,
+                 'allocation_log': None, 'order_log': None} for _ in configs]
     
     # Extract quarter start and end dates for better reporting
     quarter_dates = sorted(quarter_data['date'].unique())
-    quarter_start = quarter_dates[0]
-    quarter_end = quarter_dates[-1]
-    print(f"Quarter period: {quarter_start.strftime('%Y-%m-%d')} to {quarter_end.strftime('%Y-%m-%d')}")
-    
-    # Create portfolio manager for this quarter
-    portfolio_manager = PortfolioManager(
-        quarter_data, 
-        initial_capital,
-        max_holding_days=max_holding_days
-    )
+    logger.debug("Processing calendar quarter %s: %s to %s (%d configurations)", quarter_label(quarter),
+                 quarter_dates[0].strftime('%Y-%m-%d'), quarter_dates[-1].strftime('%Y-%m-%d'), len(configs))
     
-    # Reset capital
-    portfolio_manager.reset_capital(initial_capital)
+    # One portfolio manager per configuration; all but the first reuse its lookups
+    portfolio_managers = []
+    for initial_capital, max_holding_days, _, allocation, netting in configs:
+        portfolio_manager = PortfolioManager(
+            quarter_data, 
+            initial_capital,
+            max_holding_days=max_holding_days,
+            trading_dates=quarter_dates,
+            pair_universe=pair_universe,
+            shared_lookups=portfolio_managers[0] if portfolio_managers else None,
+            allocation=allocation,
+            netting=netting
+        )
+        
+        # Reset capital
+        portfolio_manager.reset_capital(initial_capital)
+        portfolio_managers.append(portfolio_manager)
     
     # Group data by date for faster access
     date_grouped_data = {date: group for date, group in quarter_data.groupby('date')}
     
     # Process each trading day
-    trade_log = []
+    trade_logs = [[] for _ in configs]
     signals_count = 0
     trades_count = 0
     
+    thresholds = [config[2] for config in configs]
+    
     # Process each trading day in the quarter
     for current_date in quarter_dates:
-        # Get signals for the current date
+        # Get signals for the current date; stricter thresholds get a subset of the loosest ones
         try:
-            signals = signal_generator.generate_signals(current_date)
-            signals_count += len(signals)
+            config_signals = signal_generator.generate_signals_for_thresholds(current_date, thresholds)
+            signals_count += max(len(signals) for signals in config_signals)
         except Exception as e:
-            print(f"Error generating signals for date {current_date}: {str(e)}")
-            signals = []
-        
-        # Process the trading day
-        try:
-            day_results = portfolio_manager.process_trading_day(
-                current_date, 
-                signals,
-                date_grouped_data[current_date]
-            )
-            
-            if day_results:
-                trade_log.extend(day_results)
-                trades_count += len(day_results)
+            logger.error("Error generating signals for date %s: %s", current_date, e)
+            config_signals = [[] for _ in configs]
+        
+        for k, (portfolio_manager, signals) in enumerate(zip(portfolio_managers, config_signals)):
+            # Process the trading day
+            try:
+                day_results = portfolio_manager.process_trading_day(
+                    current_date, 
+                    signals,
+                    date_grouped_data[current_date]
+                )
                 
-        except Exception as e:
-            print(f"Error processing trading day {current_date}: {str(e)}")
-    
-    print(f"Quarter {quarter} summary: {signals_count} signals generated, {trades_count} trades executed")
+                if day_results:
+                    for trade in day_results:
+                        trade['quarter'] = quarter_label(quarter)
+                    trade_logs[k].extend(day_results)
+                    trades_count += len(day_results)
+                    
+            except Exception as e:
+                logger.error("Error processing trading day %s: %s", current_date, e)
+
+    # The last trading day liquidates open positions; any left (e.g. that day failed) are closed here
+    for trade_log, portfolio_manager in zip(trade_logs, portfolio_managers):
+        liquidated = portfolio_manager.mark_to_market_open_positions(quarter_dates[-1])
+        for trade in liquidated:
+            trade_dict = trade.to_dict()
+            trade_dict['quarter'] = quarter_label(quarter)
+            trade_log.append(trade_dict)
+        trades_count += len(liquidated)
+
+    logger.debug("Quarter %s summary: %d signals generated, %d trades executed",
+                 quarter_label(quarter), signals_count, trades_count)
     
-    # Return the trade log for this quarter
-    return {
-        'quarter': quarter,
+    # Return the trade log of every configuration for this quarter
+    return [{
+        'quarter': quarter_label(quarter),
         'trade_log': trade_log,
-        'performance': {}  # We'll calculate this later from the trade log
-    }
+        'performance': {},  # We'll calculate this later from the trade log
+        'equity_curve': portfolio_manager.get_equity_curve(),
+        'allocation_log': portfolio_manager.get_allocation_log(),
+        'order_log': portfolio_manager.get_order_log() if portfolio_manager.netting else None
+    } for trade_log, portfolio_manager in zip(trade_logs, portfolio_managers)]
+
+def _run_quarter_task(quarter, df_main, pair_universe, signal_generator, configs, checkpoint):
+    """Process a quarter and checkpoint it; exceptions are returned so the rest of the batch completes"""
+    try:
+        results = _process_quarter_batch(quarter, df_main, pair_universe, signal_generator, configs)
+        if checkpoint is not None:
+            checkpoint.save(quarter_label(quarter), results)
+        return results
+    except Exception as e:
+        return e
+
+def simulation_config(hyperparams):
+    """(initial_capital, max_holding_days, zscore_threshold, allocation, netting) of a hyperparameter set"""
+    return (hyperparams['INITIAL_CAPITAL'], hyperparams['MAX_HOLDING_DAYS'], hyperparams['ZSCORE_THRESHOLD'],
+            hyperparams.get('ALLOCATION', 'inverse_vol'), bool(hyperparams.get('NETTING', False)))
+
+# Hyperparameters that only affect the portfolio simulation, not the signal columns or the pair filter
+SIMULATION_PARAMS = ('ZSCORE_THRESHOLD', 'MAX_HOLDING_DAYS', 'INITIAL_CAPITAL', 'ALLOCATION', 'NETTING')
+
+# Columns the rows of every working frame must be complete in, besides the run's z-score column
+BASE_COLUMNS = ['date', 'permno', 'trading_start', 'group_id', 'adj_prc', 'fed_funds_rate', 'adv20', 'vwretd',
+                'garch_vol']
+
+def zscore_column(hyperparams):
+    """Z-score column of a hyperparameter set, e.g. z_classical_10d_lb10"""
+    return f"z_{hyperparams['ZSCORE_METHOD']}_{hyperparams['HORIZON']}d_lb{hyperparams['LOOKBACK_PERIOD']}"
+
+def prepare_working_frame(df_main, hyperparams):
+    """
+    Rows and columns of df_main a run needs, in the compact schema with quarter codes, sorted by (date, permno).
+
+    Only the run's z-score column (and the base columns) are kept, and
+    rows must be complete and finite in all of them. The frame depends on
+    the z-score column only, so runs sharing ZSCORE_METHOD, HORIZON and
+    LOOKBACK_PERIOD can share it.
+    """
+    z_col = zscore_column(hyperparams)
+    future_return_col = f"future_cumret_{hyperparams['HORIZON']}d"
+    
+    # Select only required columns; rows must be complete in all of them
+    needed_cols = BASE_COLUMNS + [z_col]
+    if future_return_col in df_main.columns:
+        needed_cols.append(future_return_col)
+        
+    needed_cols = [col for col in needed_cols if col in df_main.columns]
+    
+    # Clean data with a single row mask instead of replace/dropna copies
+    df = df_main[needed_cols]
+    valid = df.notna().all(axis=1)
+    numeric_cols = df.select_dtypes(include='number').columns
+    if len(numeric_cols) > 0:
+        valid &= np.isfinite(df[numeric_cols]).all(axis=1)
+    
+    # Columns only used for row filtering are not kept in the working frame
+    working_cols = [col for col in needed_cols if col not in ('trading_start', future_return_col)]
+    df = df.loc[valid, working_cols]
+    
+    # Compact schema: int32 permno, int16 quarter codes, categorical group_id,
+    # float32 z-scores and float64 money and sizing columns
+    compact_frame(df)
+    
+    # Create a quarter code column based on date
+    df['quarter'] = quarter_codes(df['date'])
+    
+    # Pre-sort once; every later stage works on this frame without copying it
+    df.sort_values(['date', 'permno'], inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    return df
     
 class BacktestEngine:
-    def __init__(self, df_main, df_pairs, hyperparams):
+    def __init__(self, df_main, df_pairs, hyperparams, quiet=False, pair_universe=None, sink=None,
+                 checkpoint_dir=None, max_retries=2, retry_backoff=1.0, memory_limit=None, max_workers=None,
+                 prepared=False, save_daily_returns=True, output_dir='.'):
         self.hyperparams = hyperparams
         self.initial_capital = hyperparams['INITIAL_CAPITAL']
-        
-        # Select specific columns directly instead of filtering
-        zscore_method = hyperparams['ZSCORE_METHOD']
-        lookback_period = hyperparams['LOOKBACK_PERIOD']
-        horizon = hyperparams['HORIZON']
-        
-        z_col = f'z_{zscore_method}_{horizon}d_lb{lookback_period}'
-        base_cols = ['date', 'permno', 'trading_start', 'group_id', 'adj_prc', 'fed_funds_rate', 'adv20', 'vwretd', 'garch_vol']
-        future_return_col = f'future_cumret_{horizon}d'
-        
-        # Select only required columns
-        needed_cols = base_cols + [z_col]
-        if future_return_col in df_main.columns:
-            needed_cols.append(future_return_col)
-            
-        needed_cols = [col for col in needed_cols if col in df_main.columns]
-        
-        # Clean data
-        self.df_main = df_main[needed_cols].copy()
-        self.df_main = self.df_main.replace([np.inf, -np.inf], np.nan)
-        self.df_main = self.df_main.dropna()
+        # Quiet mode skips diagnostic scans and progress bars (for large sweeps)
+        self.quiet = quiet
+        # Optional PairUniverse already filtered with this run's thresholds (shared by the grid search)
+        self.pair_universe = pair_universe
+        # Optional ResultsSink receiving daily returns instead of per-run CSV files
+        self.sink = sink
+        # Without a sink, daily returns go to output_dir/daily_returns_<run_hash>.csv unless disabled (partial runs)
+        self.save_daily_returns = save_daily_returns
+        self.output_dir = output_dir
+        # Optional directory of per-quarter checkpoints; failed quarters are retried with backoff
+        self.checkpoint_dir = checkpoint_dir
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # Worker concurrency adapts to this RSS ceiling in bytes (default: most of the available memory)
+        self.memory_limit = memory_limit
+        self.max_workers = max_workers
+        
+        # Working frame: only the needed rows and columns, compacted and sorted (see prepare_working_frame),
+        # unless the caller passes one already prepared (e.g. a period view of a BacktestSession)
+        self.df_main = df_main if prepared else prepare_working_frame(df_main, hyperparams)
         
         # Keep a copy of the pairs data
         self.df_pairs = df_pairs
@@ -110,139 +278,204 @@ class BacktestEngine:
     
     def _preprocess_data(self):
         """Preprocess data for efficient backtest execution"""
-        # Clean data by replacing infinites with NaN and dropping NaN values
-        self.df_main = self.df_main.replace([np.inf, -np.inf], np.nan)
-        self.df_main = self.df_main.dropna()
-        
-        # Make sure date is datetime
-        if not pd.api.types.is_datetime64_dtype(self.df_main['date']):
-            self.df_main['date'] = pd.to_datetime(self.df_main['date'])
-        
-        # Create a quarter column based on date
-        self.df_main['quarter'] = self.df_main['date'].dt.to_period('Q').astype(str)
-        
         # Get unique quarters for processing
         self.quarters = sorted(self.df_main['quarter'].unique())
         
-        print(f"Identified {len(self.quarters)} calendar quarters for processing")
-        
-        # Filter pairs based on correlation and cointegration thresholds
-        corr_threshold = self.hyperparams['CORRELATION_THRESHOLD']
-        coint_threshold = self.hyperparams['COINTEGRATION_THRESHOLD']
-        
-        # Apply filters if thresholds are provided AND columns exist
-        filter_condition = True  # Default to include all pairs
-        
-        # Check correlation columns
-        if corr_threshold is not None:
-            if 'corr' in self.df_pairs.columns:
-                filter_condition = filter_condition & (self.df_pairs['corr'] >= corr_threshold)
-            elif 'correlation' in self.df_pairs.columns:
-                filter_condition = filter_condition & (self.df_pairs['correlation'] >= corr_threshold)
-            else:
-                print("Warning: No correlation column found in pairs data, skipping correlation filter")
-        
-        # Check cointegration columns
-        if coint_threshold is not None:
-            if 'coint_pval' in self.df_pairs.columns:
-                filter_condition = filter_condition & (self.df_pairs['coint_pval'] <= coint_threshold)
-            elif 'pval' in self.df_pairs.columns:
-                filter_condition = filter_condition & (self.df_pairs['pval'] <= coint_threshold)
-            elif 'p_value' in self.df_pairs.columns:
-                filter_condition = filter_condition & (self.df_pairs['p_value'] <= coint_threshold)
-            else:
-                print("Warning: No cointegration p-value column found in pairs data, skipping cointegration filter")
-        
-        # Apply the filter
-        self.filtered_pairs = self.df_pairs[filter_condition].copy()
+        logger.info("Identified %d calendar quarters for processing", len(self.quarters))
+        
+        # Filter pairs based on correlation and cointegration thresholds and index them,
+        # unless a shared universe for these thresholds was handed in
+        if self.pair_universe is None:
+            self.pair_universe = PairUniverse(filter_pairs(
+                self.df_pairs,
+                self.hyperparams['CORRELATION_THRESHOLD'],
+                self.hyperparams['COINTEGRATION_THRESHOLD']
+            ))
+        self.filtered_pairs = self.pair_universe.pairs
         
         # Log preprocessing results
-        print(f"Preprocessing complete: {len(self.filtered_pairs)} pairs after filtering")
+        logger.info("Preprocessing complete: %d pairs after filtering", len(self.filtered_pairs))
     
     def run_backtest(self):
         """Run the full backtest using the specified hyperparameters"""
-        print("Running pre-backtest diagnostics...")
-        self.run_diagnostics()
+        return self.run_backtest_batch([{}])[0]
+    
+    def run_backtest_batch(self, configs, signal_generator=None, quarters=None):
+        """
+        Run several simulation configurations in one pass over the data.
+        
+        Configurations may only differ in SIMULATION_PARAMS (ZSCORE_THRESHOLD,
+        MAX_HOLDING_DAYS, INITIAL_CAPITAL, ALLOCATION, NETTING). Signals are precomputed
+        once at the loosest z-score threshold and every quarter's dates are
+        walked once, advancing all configurations together.
+        
+        Parameters:
+        -----------
+        configs : list of dict
+            Overrides of this engine's hyperparameters, one dict per configuration
+        signal_generator : SignalGenerator or None
+            Signals already precomputed for this engine's pair universe (e.g. via
+            SignalGenerator.subset) at a threshold no stricter than any config's;
+            computed here when None
+        quarters : list of int or None
+            Quarter codes to simulate (e.g. a subset evaluated by successive
+            halving); all quarters of the working frame when None
+        
+        Returns:
+        --------
+        list of dict : one run_backtest-style result per configuration, identical
+            to running each configuration on its own
+        
+        With a checkpoint_dir, every quarter is checkpointed as soon as it
+        completes and quarters already checkpointed for the same run are
+        loaded instead of simulated. A quarter that raises is retried as a
+        new task after retry_backoff * 2**(attempt - 1) seconds, up to
+        max_retries times; a RuntimeError is raised if it still fails (the
+        completed quarters stay checkpointed for the next attempt).
+        """
+        for config in configs:
+            invalid = [key for key in config if key not in SIMULATION_PARAMS]
+            if invalid:
+                raise ValueError(f"Batch configurations may only override {SIMULATION_PARAMS}, got {invalid}")
+        hyperparams_list = [{**self.hyperparams, **config} for config in configs]
+        sim_configs = [simulation_config(params) for params in hyperparams_list]
+        
+        if not self.quiet:
+            self.run_diagnostics()
+        
+        zscore_threshold = min(params['ZSCORE_THRESHOLD'] for params in hyperparams_list)
+        if signal_generator is not None and signal_generator.zscore_threshold > zscore_threshold:
+            raise ValueError(f"Signals were generated at threshold {signal_generator.zscore_threshold}, "
+                             f"stricter than the batch threshold {zscore_threshold}")
+        
+        if quarters is None:
+            quarters = self.quarters
+        else:
+            wanted = set(quarters)
+            quarters = [quarter for quarter in self.quarters if quarter in wanted]
         
-        # Initialize signal generator with the selected parameters
-        zscore_method = self.hyperparams['ZSCORE_METHOD']
-        zscore_threshold = self.hyperparams['ZSCORE_THRESHOLD']
-        lookback_period = self.hyperparams['LOOKBACK_PERIOD']
+        # Check if we have any quarters to process
+        if len(quarters) == 0:
+            logger.warning("No quarters found to process! Check data filtering.")
+            # Return empty results
+            return [{
+                'trade_log': pd.DataFrame(),
+                'performance': {},
+                'hyperparams': params,
+                'quarterly_results': {},
+                'equity_curve': combine_equity_curves([], params['INITIAL_CAPITAL'])
+            } for params in hyperparams_list]
+        
+        # Quarters already checkpointed for this run are loaded rather than simulated
+        checkpoint = None
+        completed = {}
+        if self.checkpoint_dir is not None:
+            checkpoint = QuarterCheckpoint(self.checkpoint_dir, {'hyperparams': hyperparams_list,
+                                                                 'data': self._data_fingerprint()})
+            done = checkpoint.completed()
+            completed = {quarter: checkpoint.load(quarter_label(quarter))
+                         for quarter in quarters if quarter_label(quarter) in done}
+            if completed:
+                logger.info("Resuming from %s: %d of %d quarters already done", checkpoint.path,
+                            len(completed), len(quarters))
+        pending = [quarter for quarter in quarters if quarter not in completed]
+        
+        # Signals are computed once, at the loosest threshold of the batch (only if anything is left to run)
+        if pending and signal_generator is None:
+            signal_generator = self.create_signal_generator(zscore_threshold)
+        
+        # Quarters run concurrently as far as the memory ceiling allows (see MemoryScheduler)
+        scheduler = MemoryScheduler(self.memory_limit, self.max_workers)
+        quarter_rows = self.df_main['quarter'].value_counts()
+        run_quarter = partial(_run_quarter_task, df_main=self.df_main, pair_universe=self.pair_universe,
+                              signal_generator=signal_generator, configs=sim_configs, checkpoint=checkpoint)
+        attempt = 0
+        while pending:
+            failed = []
+            estimates = [estimate_frame_bytes(quarter_rows.get(quarter, 0), self.df_main.dtypes)
+                         for quarter in pending]
+            pending_results = scheduler.map(run_quarter, pending, estimates, desc="Processing Quarters",
+                                            disable=self.quiet)
+            
+            for quarter, quarter_results in zip(pending, pending_results):
+                if isinstance(quarter_results, Exception):
+                    logger.warning("Quarter %s failed (attempt %d): %s", quarter_label(quarter), attempt + 1,
+                                   quarter_results)
+                    if checkpoint is not None:
+                        checkpoint.record_failure(quarter_label(quarter), quarter_results, attempt + 1)
+                    failed.append((quarter, quarter_results))
+                else:
+                    completed[quarter] = quarter_results
+            del pending_results
+            gc.collect()
+            
+            if not failed:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                labels = [quarter_label(quarter) for quarter, _ in failed]
+                raise RuntimeError(f"Quarters {labels} still failing after {self.max_retries} retries") \
+                    from failed[0][1]
+            # Retry the failed quarters as new tasks after an exponential backoff
+            delay = self.retry_backoff * 2 ** (attempt - 1)
+            logger.warning("Retrying %d failed quarters in %.1fs", len(failed), delay)
+            time.sleep(delay)
+            pending = [quarter for quarter, _ in failed]
+        
+        # Collect results in calendar order
+        all_closed_trades = [[] for _ in configs]
+        quarterly_results = [{} for _ in configs]
+        quarter_equity_curves = [{} for _ in configs]
+        for quarter in quarters:
+            for k, result in enumerate(completed.pop(quarter)):
+                all_closed_trades[k].extend(result['trade_log'])
+                quarterly_results[k][result['quarter']] = {
+                    'num_trades': len(result['trade_log']),
+                    'equity_curve': result['equity_curve'],
+                    'allocation_log': result.get('allocation_log'),
+                    'order_log': result.get('order_log')
+                }
+                if result['equity_curve'] is not None:
+                    quarter_equity_curves[k][result['quarter']] = result['equity_curve']
+        
+        return [self._collect_results(params, closed_trades, quarter_results, equity_curves)
+                for params, closed_trades, quarter_results, equity_curves
+                in zip(hyperparams_list, all_closed_trades, quarterly_results, quarter_equity_curves)]
+    
+    def create_signal_generator(self, zscore_threshold=None):
+        """Create a SignalGenerator over the working frame and precompute its signals"""
+        if zscore_threshold is None:
+            zscore_threshold = self.hyperparams['ZSCORE_THRESHOLD']
         horizon = self.hyperparams['HORIZON']
-        max_holding_days = self.hyperparams['MAX_HOLDING_DAYS']
         
-        # Create optimized dataset with only needed columns
-        z_col = f'z_{zscore_method}_{horizon}d_lb{lookback_period}'
-        needed_cols = ['date', 'permno', 'quarter', 'group_id', 'adj_prc', 'fed_funds_rate', 
-                      'adv20', 'vwretd', 'garch_vol', z_col]
-        
-        # Check if all needed columns exist
-        needed_cols = [col for col in needed_cols if col in self.df_main.columns]
-        
-        # Only keep needed columns in memory
-        self.optimized_df = self.df_main[needed_cols].copy()
-        
-        # Pre-sort data for faster operations
-        self.optimized_df.sort_values(['date', 'permno'], inplace=True)
+        # The working frame already holds only the needed columns, sorted by (date, permno)
+        self.optimized_df = self.df_main
         
         # Create signal generator with optimized dataset
         signal_generator = SignalGenerator(
             self.optimized_df, 
             self.filtered_pairs,
-            zscore_method=zscore_method,
+            zscore_method=self.hyperparams['ZSCORE_METHOD'],
             zscore_threshold=zscore_threshold,
             horizon=horizon,
-            lookback_period=lookback_period
+            lookback_period=self.hyperparams['LOOKBACK_PERIOD'],
+            quiet=self.quiet,
+            pair_universe=self.pair_universe
         )
         
-        # Use fixed n_jobs=4 for parallel processing
-        n_jobs = 4
-        
-        # Precompute signals with progress bar
-        signal_generator.precompute_signals_parallel(horizon=horizon, n_jobs=n_jobs)
-        
-        # Check if we have any quarters to process
-        if len(self.quarters) == 0:
-            print("No quarters found to process! Check data filtering.")
-            # Return empty results
-            return {
-                'trade_log': pd.DataFrame(),
-                'performance': {},
-                'hyperparams': self.hyperparams,
-                'quarterly_results': {}
-            }
-        
-        # Process quarters in batches to reduce memory pressure
-        batch_size = 4  # Adjust based on your system's memory
-        all_closed_trades = []
-        quarterly_results = {}
-        
-        for i in range(0, len(self.quarters), batch_size):
-            batch_quarters = self.quarters[i:i+batch_size]
-            
-            # Process quarters in parallel
-            n_jobs = 4
-            batch_results = Parallel(n_jobs=n_jobs, prefer="threads")(
-                delayed(_process_quarter_parallel)(
-                    quarter,
-                    self.optimized_df,
-                    self.filtered_pairs,
-                    signal_generator,
-                    self.initial_capital,
-                    max_holding_days
-                )
-                for quarter in tqdm(batch_quarters, desc=f"Processing Quarters Batch {i//batch_size+1}")
-            )
-            
-            # Collect results
-            for result in batch_results:
-                all_closed_trades.extend(result['trade_log'])
-                quarterly_results[result['quarter']] = result['performance']
-            
-            # Force garbage collection after each batch
-            gc.collect()
+        # Precompute signals, one task per group under the memory ceiling
+        scheduler = MemoryScheduler(self.memory_limit, self.max_workers)
+        signal_generator.precompute_signals_parallel(horizon=horizon, scheduler=scheduler)
+        return signal_generator
+    
+    def _collect_results(self, hyperparams, all_closed_trades, quarterly_results, quarter_equity_curves):
+        """Build the result dictionary of one configuration from its per-quarter output"""
+        initial_capital = hyperparams['INITIAL_CAPITAL']
+        logger.info("Collected %d closed trades across all quarters", len(all_closed_trades))
         
-        print(f"\nCollected {len(all_closed_trades)} closed trades across all quarters")
+        # Portfolio-level dense daily equity (realized plus mark-to-market PnL)
+        equity_curve = combine_equity_curves(
+            [quarter_equity_curves[q] for q in sorted(quarter_equity_curves)], initial_capital)
         
         # Calculate performance metrics from trade log
         performance_metrics = {}
@@ -263,74 +496,140 @@ class BacktestEngine:
                     trade_df=trade_df,
                     market_returns=market_return_lookup,
                     ffr_lookup=ffr_lookup,
-                    initial_capital=self.initial_capital
+                    initial_capital=initial_capital,
+                    equity_curve=equity_curve.set_index('date')['equity']
                 )
                 
-                # Save daily returns data to file for graphing
-                if 'daily_returns' in performance_metrics:
+                # Save daily returns data for graphing (to the sink when one is attached)
+                if 'daily_returns' in performance_metrics and self.sink is not None:
+                    self.sink.write('daily_returns', performance_metrics['daily_returns'], run_hash(hyperparams))
+                elif 'daily_returns' in performance_metrics and self.save_daily_returns:
                     daily_returns_df = performance_metrics['daily_returns']
-                    timestamp = time.strftime("%Y%m%d_%H%M%S")
-                    daily_returns_file = f'daily_returns_{timestamp}.csv'
+                    # Named by the run hash, so runs finishing in the same second do not overwrite each other
+                    os.makedirs(self.output_dir, exist_ok=True)
+                    daily_returns_file = os.path.join(self.output_dir, f'daily_returns_{run_hash(hyperparams)}.csv')
                     daily_returns_df.to_csv(daily_returns_file, index=False)
-                    print(f"Daily returns data saved to {daily_returns_file}")
+                    logger.info("Daily returns data saved to %s", daily_returns_file)
                 
-                # Print metrics
-                print(f"\nCalculated metrics from trade data:")
-                print(f"Number of trades: {performance_metrics['num_trades']}")
-                print(f"Number of unique trading days: {performance_metrics['num_trading_days']}")
-                print(f"Average Fed Funds Rate: {performance_metrics['avg_fed_funds_rate']*100:.2f}%")
-                print(f"Hit rate: {performance_metrics['hit_rate']*100:.2f}%")
-                print(f"Average trade PnL: ${performance_metrics['avg_trade_pnl']:,.2f}")
-                print(f"Average holding period: {performance_metrics['avg_holding_period']:.2f} days")
-                print(f"Sharpe ratio (based on trading days): {performance_metrics['sharpe_ratio']:.4f}")
-                print(f"Sortino ratio (based on trading days): {performance_metrics['sortino_ratio']:.4f}")
-                print(f"CAPM Alpha: {performance_metrics['alpha']:.6f}")
-                print(f"CAPM Beta: {performance_metrics['beta']:.4f}")
-                print(f"Max drawdown: {performance_metrics['max_drawdown']*100:.2f}%")
+                # Log metrics
+                self._log_metrics(performance_metrics)
         else:
-            print("No closed trades found, using empty metrics")
+            logger.info("No closed trades found, using empty metrics")
             
+        # Daily entry sizing summaries, including capital utilization
+        allocation_logs = [quarterly_results[q]['allocation_log'].assign(quarter=q) for q in sorted(quarterly_results)
+                           if quarterly_results[q].get('allocation_log') is not None]
+        allocation_log = pd.concat(allocation_logs, ignore_index=True) if allocation_logs else pd.DataFrame()
+        if len(allocation_log) > 0:
+            logger.info("Mean capital utilization on entry days: %.2f%%",
+                        100 * allocation_log['capital_utilization'].mean())
+        
+        # Daily orders before and after netting (NETTING=True only)
+        order_logs = [quarterly_results[q]['order_log'].assign(quarter=q) for q in sorted(quarterly_results)
+                      if quarterly_results[q].get('order_log') is not None]
+        order_log = pd.concat(order_logs, ignore_index=True) if order_logs else pd.DataFrame()
+        if len(order_log) > 0:
+            logger.info("Netting: %d leg orders became %d stock orders, transaction costs %.2f -> %.2f",
+                        order_log['leg_orders'].sum(), order_log['netted_orders'].sum(),
+                        order_log['gross_cost'].sum(), order_log['netted_cost'].sum())
+        
         # Return combined results
         results = {
             'trade_log': pd.DataFrame(all_closed_trades) if all_closed_trades else pd.DataFrame(),
             'performance': performance_metrics,
-            'hyperparams': self.hyperparams,
-            'quarterly_results': quarterly_results
+            'hyperparams': hyperparams,
+            'quarterly_results': quarterly_results,
+            'equity_curve': equity_curve,
+            'allocation_log': allocation_log,
+            'order_log': order_log
         }
         
         return results
         
+    def _data_fingerprint(self):
+        """Cheap identity of the working data, so checkpoints are not reused across datasets"""
+        return {
+            'rows': len(self.df_main),
+            'start': str(self.df_main['date'].min()),
+            'end': str(self.df_main['date'].max()),
+            'pairs': len(self.pair_universe.pairs),
+            'price_sum': float(self.df_main['adj_prc'].sum()),
+        }
+    
+    def memory_report(self):
+        """Report per-column memory usage of the working frame and the pairs data"""
+        report = pd.concat([
+            memory_report(self.df_main, 'df_main'),
+            memory_report(self.filtered_pairs, 'filtered_pairs'),
+        ], ignore_index=True)
+        if logger.isEnabledFor(logging.INFO):
+            totals = report[report['column'] == 'TOTAL']
+            logger.info("Memory usage: %s", ", ".join(
+                f"{row.frame}={row.megabytes:.1f} MB" for row in totals.itertuples()))
+        return report
+
+    def _log_metrics(self, performance_metrics):
+        """Log the headline performance metrics of a run"""
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        logger.info(
+            "Calculated metrics from trade data: trades=%d, trading days=%d, avg FFR=%.2f%%, "
+            "hit rate=%.2f%%, avg trade PnL=$%s, avg holding=%.2f days, Sharpe=%.4f, "
+            "Sortino=%.4f, alpha=%.6f, beta=%.4f, max drawdown=%.2f%%",
+            performance_metrics['num_trades'],
+            performance_metrics['num_trading_days'],
+            performance_metrics['avg_fed_funds_rate'] * 100,
+            performance_metrics['hit_rate'] * 100,
+            f"{performance_metrics['avg_trade_pnl']:,.2f}",
+            performance_metrics['avg_holding_period'],
+            performance_metrics['sharpe_ratio'],
+            performance_metrics['sortino_ratio'],
+            performance_metrics['alpha'],
+            performance_metrics['beta'],
+            performance_metrics['max_drawdown'] * 100
+        )
+
     def run_diagnostics(self):
-        """Run diagnostic checks to identify potential issues"""
-        print("\n=== DIAGNOSTIC REPORT ===\n")
+        """Run diagnostic checks to identify potential issues
+
+        Cheap structural checks (no pairs left, missing columns) are always
+        reported as warnings. Column statistics and NaN scans are only
+        computed when DEBUG logging is enabled.
+        """
+        verbose = logger.isEnabledFor(logging.DEBUG)
         
         # 1. Check for pairs after filtering
         if hasattr(self, "filtered_pairs"):
-            print(f"Filtered pairs: {len(self.filtered_pairs)} of {len(self.df_pairs)} original pairs")
+            logger.debug("Filtered pairs: %d of %d original pairs", len(self.filtered_pairs), len(self.df_pairs))
             if len(self.filtered_pairs) == 0:
-                print("CRITICAL ERROR: No pairs remain after correlation/cointegration filtering!")
-                
-                # Check correlation threshold
-                corr_threshold = self.hyperparams.get('CORRELATION_THRESHOLD')
-                if corr_threshold is not None:
-                    for corr_col in ['corr', 'correlation']:
-                        if corr_col in self.df_pairs.columns:
-                            corr_values = self.df_pairs[corr_col].dropna()
-                            print(f"{corr_col} stats: min={corr_values.min():.4f}, max={corr_values.max():.4f}, mean={corr_values.mean():.4f}")
-                            above_threshold = (corr_values >= corr_threshold).sum()
-                            print(f"Values >= {corr_threshold}: {above_threshold} ({above_threshold/len(corr_values)*100:.2f}%)")
-                            break
+                logger.error("No pairs remain after correlation/cointegration filtering!")
                 
-                # Check cointegration threshold
-                coint_threshold = self.hyperparams.get('COINTEGRATION_THRESHOLD')
-                if coint_threshold is not None:
-                    for coint_col in ['coint_pval', 'pval', 'p_value']:
-                        if coint_col in self.df_pairs.columns:
-                            coint_values = self.df_pairs[coint_col].dropna()
-                            print(f"{coint_col} stats: min={coint_values.min():.4f}, max={coint_values.max():.4f}, mean={coint_values.mean():.4f}")
-                            below_threshold = (coint_values <= coint_threshold).sum()
-                            print(f"Values <= {coint_threshold}: {below_threshold} ({below_threshold/len(coint_values)*100:.2f}%)")
-                            break
+                if verbose:
+                    # Check correlation threshold
+                    corr_threshold = self.hyperparams.get('CORRELATION_THRESHOLD')
+                    if corr_threshold is not None:
+                        for corr_col in ['corr', 'correlation']:
+                            if corr_col in self.df_pairs.columns:
+                                corr_values = self.df_pairs[corr_col].dropna()
+                                above_threshold = (corr_values >= corr_threshold).sum()
+                                logger.debug("%s stats: min=%.4f, max=%.4f, mean=%.4f; values >= %s: %d (%.2f%%)",
+                                             corr_col, corr_values.min(), corr_values.max(), corr_values.mean(),
+                                             corr_threshold, above_threshold,
+                                             above_threshold / len(corr_values) * 100)
+                                break
+                    
+                    # Check cointegration threshold
+                    coint_threshold = self.hyperparams.get('COINTEGRATION_THRESHOLD')
+                    if coint_threshold is not None:
+                        for coint_col in ['coint_pval', 'pval', 'p_value']:
+                            if coint_col in self.df_pairs.columns:
+                                coint_values = self.df_pairs[coint_col].dropna()
+                                below_threshold = (coint_values <= coint_threshold).sum()
+                                logger.debug("%s stats: min=%.4f, max=%.4f, mean=%.4f; values <= %s: %d (%.2f%%)",
+                                             coint_col, coint_values.min(), coint_values.max(), coint_values.mean(),
+                                             coint_threshold, below_threshold,
+                                             below_threshold / len(coint_values) * 100)
+                                break
         
         # 2. Check for z-score columns
         zscore_method = self.hyperparams['ZSCORE_METHOD']
@@ -338,39 +637,33 @@ class BacktestEngine:
         horizon = self.hyperparams['HORIZON']
         
         z_col = f'z_{zscore_method}_{horizon}d_lb{lookback_period}'
-        print(f"\nChecking for z-score column: {z_col}")
         
         if z_col in self.df_main.columns:
-            z_values = self.df_main[z_col].dropna()
-            z_threshold = self.hyperparams['ZSCORE_THRESHOLD']
-            
-            print(f"Z-score column stats:")
-            print(f"  - Non-null values: {len(z_values)} out of {len(self.df_main)} ({len(z_values)/len(self.df_main)*100:.2f}%)")
-            print(f"  - Range: {z_values.min():.4f} to {z_values.max():.4f}")
-            print(f"  - Values exceeding threshold {z_threshold}: {(abs(z_values) >= z_threshold).sum()} ({(abs(z_values) >= z_threshold).sum()/len(z_values)*100:.2f}%)")
+            if verbose:
+                z_values = self.df_main[z_col].dropna()
+                z_threshold = self.hyperparams['ZSCORE_THRESHOLD']
+                exceeding = (abs(z_values) >= z_threshold).sum()
+                logger.debug("Z-score column '%s': %d non-null of %d (%.2f%%), range %.4f to %.4f, "
+                             "%d (%.2f%%) exceeding threshold %s",
+                             z_col, len(z_values), len(self.df_main),
+                             len(z_values) / max(len(self.df_main), 1) * 100,
+                             z_values.min(), z_values.max(), exceeding,
+                             exceeding / max(len(z_values), 1) * 100, z_threshold)
         else:
-            print(f"CRITICAL ERROR: Z-score column '{z_col}' not found in data!")
             z_cols = [col for col in self.df_main.columns if col.startswith('z_')]
-            if z_cols:
-                print(f"Available z-score columns: {z_cols}")
-            else:
-                print("No z-score columns found in data!")
+            logger.error("Z-score column '%s' not found in data! Available z-score columns: %s", z_col, z_cols)
         
         # 3. Check for essential columns
         required_cols = ['date', 'permno', 'group_id', 'adj_prc', 'fed_funds_rate', 'adv20', 'vwretd', 'garch_vol']
         missing_cols = [col for col in required_cols if col not in self.df_main.columns]
         
         if missing_cols:
-            print(f"\nMISSING REQUIRED COLUMNS: {missing_cols}")
-        else:
-            print("\nAll required base columns are present")
+            logger.error("Missing required columns: %s", missing_cols)
         
         # 4. Check for NaN values in essential columns
-        print("\nNaN check for essential columns:")
-        for col in required_cols:
-            if col in self.df_main.columns:
-                null_count = self.df_main[col].isna().sum()
-                null_pct = null_count / len(self.df_main) * 100
-                print(f"  - {col}: {null_count} NaN values ({null_pct:.2f}%)")
-        
-        print("\n=== END OF DIAGNOSTIC REPORT ===\n")
\ No newline at end of file
+        if verbose:
+            for col in required_cols:
+                if col in self.df_main.columns:
+                    null_count = self.df_main[col].isna().sum()
+                    null_pct = null_count / max(len(self.df_main), 1) * 100
+                    logger.debug("NaN check - %s: %d NaN values (%.2f%%)", col, null_count, null_pct)
@@ -0,0 +1,260 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .synthetic import SCALES, generate_scaled_data
+from .signal_generator import SignalGenerator
+from .portfolio_manager import PortfolioManager
+from .performance import calculate_trade_based_metrics
+from .backtest_engine import BacktestEngine
+
+# Hyperparameters used for every benchmark run
+BENCHMARK_PARAMS = {
+    'COINTEGRATION_THRESHOLD': 0.05,
+    'CORRELATION_THRESHOLD': 0.5,
+    'ZSCORE_METHOD': 'classical',
+    'ZSCORE_THRESHOLD': 1,
+    'LOOKBACK_PERIOD': 10,
+    'HORIZON': 10,
+    'MAX_HOLDING_DAYS': 10,
+    'INITIAL_CAPITAL': 1_000_000_000
+}
+
+# Default location of the benchmark history, one JSON record per line
+DEFAULT_HISTORY_FILE = 'benchmark_history.jsonl'
+
+
+@contextlib.contextmanager
+def _silenced():
+    """Swallow console output and keep stray files out of the working directory"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                yield
+        finally:
+            os.chdir(cwd)
+
+
+def _current_commit():
+    """Return the current git commit hash, or 'unknown' outside a git checkout"""
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+
+class BenchmarkContext:
+    """Synthetic inputs and derived fixtures shared by all benchmarks of one scale"""
+
+    def __init__(self, scale='small', seed=0, params=None):
+        self.scale = scale
+        self.params = dict(BENCHMARK_PARAMS if params is None else params)
+        self.df_main, df_pairs = generate_scaled_data(scale, seed=seed)
+        self.df_pairs = df_pairs.rename(columns={'permno_1': 'permno_black', 'permno_2': 'permno_white'})
+
+        with _silenced():
+            self.engine = BacktestEngine(self.df_main, self.df_pairs, self.params, quiet=True)
+            self.signal_generator = self.new_signal_generator()
+            self.signal_generator.precompute_signals_parallel(horizon=self.params['HORIZON'])
+            self.trade_log = self.engine.run_backtest()['trade_log']
+
+        self.dates = sorted(self.engine.df_main['date'].unique())
+        first_quarter = self.engine.quarters[0]
+        self.quarter_data = self.engine.df_main[self.engine.df_main['quarter'] == first_quarter]
+        self.quarter_dates = sorted(self.quarter_data['date'].unique())
+        self.quarter_day_data = {date: group for date, group in self.quarter_data.groupby('date')}
+        self.quarter_signals = {date: self.signal_generator.generate_signals(date) for date in self.quarter_dates}
+
+        date_indexed = self.engine.df_main.drop_duplicates('date').set_index('date')
+        self.market_returns = date_indexed['vwretd'].to_dict()
+        self.ffr_lookup = date_indexed['fed_funds_rate'].to_dict()
+
+    def new_signal_generator(self):
+        """Create a fresh SignalGenerator over the engine's working frame"""
+        return SignalGenerator(
+            self.engine.df_main,
+            self.engine.filtered_pairs,
+            zscore_method=self.params['ZSCORE_METHOD'],
+            zscore_threshold=self.params['ZSCORE_THRESHOLD'],
+            horizon=self.params['HORIZON'],
+            lookback_period=self.params['LOOKBACK_PERIOD'],
+            quiet=True
+        )
+
+
+def bench_precompute_signals(ctx):
+    """SignalGenerator.precompute_signals_parallel over the whole period"""
+    signal_generator = ctx.new_signal_generator()
+    signal_generator.precompute_signals_parallel(horizon=ctx.params['HORIZON'])
+
+
+def bench_generate_signals(ctx):
+    """SignalGenerator.generate_signals for every trading day"""
+    for date in ctx.dates:
+        ctx.signal_generator.generate_signals(date)
+
+
+def bench_process_trading_day(ctx):
+    """PortfolioManager.process_trading_day for every day of the first quarter"""
+    portfolio_manager = PortfolioManager(ctx.quarter_data, ctx.params['INITIAL_CAPITAL'],
+                                         max_holding_days=ctx.params['MAX_HOLDING_DAYS'])
+    for date in ctx.quarter_dates:
+        portfolio_manager.process_trading_day(date, ctx.quarter_signals[date], ctx.quarter_day_data[date])
+
+
+def bench_trade_metrics(ctx):
+    """calculate_trade_based_metrics on the full-run trade log"""
+    calculate_trade_based_metrics(ctx.trade_log.copy(), ctx.market_returns, ctx.ffr_lookup,
+                                  ctx.params['INITIAL_CAPITAL'])
+
+
+def bench_run_backtest(ctx):
+    """BacktestEngine construction plus a full run_backtest"""
+    BacktestEngine(ctx.df_main, ctx.df_pairs, ctx.params, quiet=True).run_backtest()
+
+
+def bench_run_backtest_batch(ctx):
+    """run_backtest_batch over 3 thresholds x 2 holding periods in one pass"""
+    configs = [{'ZSCORE_THRESHOLD': threshold, 'MAX_HOLDING_DAYS': holding}
+               for threshold in (1, 1.5, 2) for holding in (5, 10)]
+    BacktestEngine(ctx.df_main, ctx.df_pairs, ctx.params, quiet=True).run_backtest_batch(configs)
+
+
+BENCHMARKS = {
+    'precompute_signals_parallel': bench_precompute_signals,
+    'generate_signals': bench_generate_signals,
+    'process_trading_day': bench_process_trading_day,
+    'calculate_trade_based_metrics': bench_trade_metrics,
+    'run_backtest': bench_run_backtest,
+    'run_backtest_batch': bench_run_backtest_batch,
+}
+
+
+def run_benchmarks(scale='small', names=None, repeat=3, seed=0):
+    """
+    Time the core backtest stages on synthetic data.
+
+    Parameters:
+    -----------
+    scale : str
+        One of the synthetic.SCALES presets
+    names : list or None
+        Subset of BENCHMARKS to run; all by default
+    repeat : int
+        Number of timed repetitions per benchmark
+    seed : int
+        Seed for the synthetic data generator
+
+    Returns:
+    --------
+    pandas DataFrame : one row per benchmark with min/median/mean seconds
+    """
+    names = list(BENCHMARKS) if names is None else names
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {unknown}. Use any of {list(BENCHMARKS)}.")
+
+    ctx = BenchmarkContext(scale, seed=seed)
+    commit = _current_commit()
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    rows = []
+    for name in names:
+        timings = []
+        for _ in range(repeat):
+            with _silenced():
+                start = time.perf_counter()
+                BENCHMARKS[name](ctx)
+                timings.append(time.perf_counter() - start)
+        rows.append({
+            'commit': commit,
+            'timestamp': timestamp,
+            'scale': scale,
+            'benchmark': name,
+            'repeat': repeat,
+            'min_s': float(np.min(timings)),
+            'median_s': float(np.median(timings)),
+            'mean_s': float(np.mean(timings)),
+        })
+    return pd.DataFrame(rows)
+
+
+def load_history(history_file=DEFAULT_HISTORY_FILE):
+    """Load all recorded benchmark runs"""
+    if not os.path.exists(history_file):
+        return pd.DataFrame()
+    with open(history_file) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return pd.DataFrame(records)
+
+
+def save_results(results, history_file=DEFAULT_HISTORY_FILE):
+    """Append benchmark results to the history file"""
+    with open(history_file, 'a') as f:
+        for record in results.to_dict('records'):
+            f.write(json.dumps(record) + '\n')
+
+
+def compare_to_history(results, history, tolerance=0.2):
+    """
+    Compare results against the most recent run of a different commit.
+
+    A benchmark counts as a regression when its min time exceeds the baseline
+    min time by more than `tolerance` (relative).
+    """
+    comparison = results[['scale', 'benchmark', 'min_s']].copy()
+    comparison['baseline_commit'] = None
+    comparison['baseline_min_s'] = np.nan
+
+    if not history.empty:
+        commit = results['commit'].iloc[0]
+        previous = history[history['commit'] != commit]
+        for idx, row in comparison.iterrows():
+            match = previous[(previous['scale'] == row['scale']) & (previous['benchmark'] == row['benchmark'])]
+            if not match.empty:
+                latest = match.iloc[-1]
+                comparison.at[idx, 'baseline_commit'] = latest['commit']
+                comparison.at[idx, 'baseline_min_s'] = latest['min_s']
+
+    comparison['ratio'] = comparison['min_s'] / comparison['baseline_min_s']
+    comparison['regression'] = comparison['ratio'] > 1 + tolerance
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backtest on synthetic data")
+    parser.add_argument('--scale', default='small', choices=list(SCALES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bench', action='append', choices=list(BENCHMARKS),
+                        help="Benchmark to run (repeatable); all by default")
+    parser.add_argument('--history', default=DEFAULT_HISTORY_FILE)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--no-save', action='store_true', help="Do not append results to the history")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scale, names=args.bench, repeat=args.repeat, seed=args.seed)
+    comparison = compare_to_history(results, load_history(args.history), tolerance=args.tolerance)
+    print(comparison.to_string(index=False))
+
+    if not args.no_save:
+        save_results(results, args.history)
+
+    # Non-zero exit code lets CI fail on regressions
+    return 1 if comparison['regression'].any() else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,71 @@
+import glob
+import json
+import logging
+import os
+import pickle
+
+from .results_sink import run_hash
+
+logger = logging.getLogger(__name__)
+
+
+def _atomic_write(path, payload):
+    """Write bytes to path via a temporary file and rename, so readers never see partial files"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class QuarterCheckpoint:
+    """
+    Crash-safe store of per-quarter results of one backtest run.
+
+    Every completed quarter is pickled to `<root>/<key>/<quarter>.pkl` as
+    soon as it finishes (written to a temporary file, fsynced and renamed),
+    so a run killed in quarter 25 of 28 resumes from quarter 25. The key is
+    a hash of the run's hyperparameters and a fingerprint of its data, so
+    several runs (e.g. a whole grid search) can share one root directory.
+    Failed quarters leave a `<quarter>.failed.json` note with the error and
+    attempt count, removed once the quarter succeeds.
+    """
+
+    def __init__(self, root, run_spec):
+        self.key = run_hash(run_spec)
+        self.path = os.path.join(root, self.key)
+        os.makedirs(self.path, exist_ok=True)
+        spec_file = os.path.join(self.path, 'run.json')
+        if not os.path.exists(spec_file):
+            _atomic_write(spec_file, json.dumps(run_spec, sort_keys=True, default=str, indent=2).encode('utf-8'))
+
+    def _file(self, label, suffix='.pkl'):
+        return os.path.join(self.path, f"{label}{suffix}")
+
+    def completed(self):
+        """Labels of the quarters with a stored result"""
+        return {os.path.basename(path)[:-len('.pkl')] for path in glob.glob(os.path.join(self.path, '*.pkl'))}
+
+    def failed(self):
+        """Failure notes of quarters that have not succeeded yet, by label"""
+        notes = {}
+        for path in glob.glob(os.path.join(self.path, '*.failed.json')):
+            with open(path) as f:
+                notes[os.path.basename(path)[:-len('.failed.json')]] = json.load(f)
+        return notes
+
+    def load(self, label):
+        with open(self._file(label), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, label, results):
+        _atomic_write(self._file(label), pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL))
+        failed_file = self._file(label, '.failed.json')
+        if os.path.exists(failed_file):
+            os.remove(failed_file)
+        logger.debug("Checkpointed quarter %s to %s", label, self.path)
+
+    def record_failure(self, label, error, attempt):
+        note = {'error': repr(error), 'attempt': attempt}
+        _atomic_write(self._file(label, '.failed.json'), json.dumps(note).encode('utf-8'))
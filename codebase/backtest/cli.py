@@ -0,0 +1,328 @@
+import argparse
+import copy
+import glob
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Settings of a config file (JSON); missing keys take these values. None means the library default
+# (main.PERIODS, main.DEFAULT_PARAM_GRID, the first combination of the grid for `run`).
+DEFAULT_CONFIG = {
+    'data': {
+        'main': 'final_backtest_data.csv',
+        'pairs': 'corr_coin.csv',
+        # Quarter store directory (see `convert`); `run` streams from it instead of loading data.main
+        'store': None,
+    },
+    'period': 'train',
+    'periods': None,
+    'param_grid': None,
+    'params': None,
+    'search': 'grid',
+    # Settings of `search: "halving"` (see grid_search.run_successive_halving_search)
+    'halving': {
+        'min_quarters': 2,
+        'eta': 3,
+        'metric': 'sharpe_ratio',
+        'seed': 0,
+    },
+    'output_dir': '.',
+    'sink': None,
+    'checkpoint_dir': None,
+    'quiet': False,
+    'log_level': 'INFO',
+}
+
+SEARCH_METHODS = ('grid', 'halving')
+
+# Config sections merged key by key with a config file
+CONFIG_SECTIONS = ('data', 'halving')
+
+
+def load_config(path=None):
+    """DEFAULT_CONFIG updated with a JSON config file (CONFIG_SECTIONS are merged key by key)"""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path is None:
+        return config
+    with open(path) as f:
+        overrides = json.load(f)
+    unknown = set(overrides) - set(config)
+    if unknown:
+        raise ValueError(f"Unknown config keys in {path}: {sorted(unknown)}. Use any of {list(config)}.")
+    for section in CONFIG_SECTIONS:
+        config[section].update(overrides.pop(section, {}))
+    config.update(overrides)
+    return config
+
+
+def _parse_params(assignments):
+    """NAME=VALUE pairs of --param, with VALUE parsed as JSON when possible"""
+    params = {}
+    for assignment in assignments or []:
+        name, sep, value = assignment.partition('=')
+        if not sep:
+            raise ValueError(f"--param expects NAME=VALUE, got {assignment!r}")
+        try:
+            params[name] = json.loads(value)
+        except json.JSONDecodeError:
+            params[name] = value
+    return params
+
+
+def _apply_overrides(config, args):
+    """Command-line options take precedence over the config file"""
+    for option, key in (('period', 'period'), ('output_dir', 'output_dir'), ('sink', 'sink'),
+                        ('checkpoint_dir', 'checkpoint_dir'), ('search', 'search')):
+        if getattr(args, option, None) is not None:
+            config[key] = getattr(args, option)
+    for option in ('main', 'pairs', 'store'):
+        if getattr(args, option, None) is not None:
+            config['data'][option] = getattr(args, option)
+    for option in ('min_quarters', 'eta', 'seed'):
+        if getattr(args, option, None) is not None:
+            config['halving'][option] = getattr(args, option)
+    if getattr(args, 'halving_metric', None) is not None:
+        config['halving']['metric'] = args.halving_metric
+    if getattr(args, 'quiet', False):
+        config['quiet'] = True
+    return config
+
+
+def _cmd_run(args, config):
+    """One backtest of one hyperparameter combination"""
+    from .grid_search import RESULT_METRICS, _expand_param_grid
+    from .main import DEFAULT_PARAM_GRID, PERIODS, load_backtest_data, load_pairs
+
+    hyperparams = config['params'] or _expand_param_grid(config['param_grid'] or DEFAULT_PARAM_GRID)[0]
+    hyperparams = {**hyperparams, **_parse_params(args.param)}
+    periods = config['periods'] or PERIODS
+    os.makedirs(config['output_dir'], exist_ok=True)
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+
+    if config['data']['store']:
+        from .pair_universe import pairs_formed_between
+        from .streaming import QuarterStore, run_streaming_backtest
+
+        store = QuarterStore(config['data']['store'])
+        start_date, end_date = periods[config['period'].lower()][:2]
+        # Only pairs formed in the period, as load_backtest_data selects them
+        df_pairs = pairs_formed_between(load_pairs(config['data']['pairs']), start_date, end_date)
+        results = run_streaming_backtest(store, df_pairs, hyperparams,
+                                         output_dir=os.path.join(config['output_dir'], f'trades_{timestamp}'),
+                                         quarters=store.quarters_between(start_date, end_date),
+                                         quiet=config['quiet'])
+    else:
+        from .backtest_engine import BacktestEngine
+
+        df_main, df_pairs = load_backtest_data(config['data']['main'], config['data']['pairs'], config['period'],
+                                               periods, config['quiet'])
+        engine = BacktestEngine(df_main, df_pairs, hyperparams, quiet=config['quiet'],
+                                checkpoint_dir=config['checkpoint_dir'], output_dir=config['output_dir'])
+        results = engine.run_backtest()
+        trade_file = os.path.join(config['output_dir'], f"trades_{config['period']}_{timestamp}.csv")
+        results['trade_log'].to_csv(trade_file, index=False)
+        logger.info("Trade log saved to %s", trade_file)
+
+    print(json.dumps(hyperparams, default=str))
+    for metric in RESULT_METRICS:
+        print(f"{metric:>20}: {results['performance'].get(metric, 0)}")
+    return 0
+
+
+def _cmd_sweep(args, config):
+    """Grid search or successive halving over the config's param_grid"""
+    from .main import DEFAULT_PARAM_GRID, run_backtest
+
+    param_grid = dict(config['param_grid'] or DEFAULT_PARAM_GRID)
+    for name, value in _parse_params(args.param).items():
+        param_grid[name] = value if isinstance(value, list) or name == 'INITIAL_CAPITAL' else [value]
+
+    if config['search'] not in SEARCH_METHODS:
+        raise ValueError(f"Unknown search: {config['search']}. Use one of {SEARCH_METHODS}.")
+    sink = None
+    if config['sink']:
+        from .results_sink import ResultsSink
+
+        sink = ResultsSink(config['sink'])
+    try:
+        if config['search'] == 'halving':
+            from .grid_search import run_successive_halving_search
+            from .main import load_backtest_data
+
+            df_main, df_pairs = load_backtest_data(config['data']['main'], config['data']['pairs'],
+                                                   config['period'], config['periods'], config['quiet'])
+            os.makedirs(config['output_dir'], exist_ok=True)
+            output_file = os.path.join(config['output_dir'], f"successive_halving_results_{config['period']}.csv")
+            results = run_successive_halving_search(df_main, df_pairs, param_grid, output_file,
+                                                    **config['halving'], quiet=config['quiet'], sink=sink,
+                                                    checkpoint_dir=config['checkpoint_dir'])
+        else:
+            results = run_backtest(config['data']['main'], config['data']['pairs'], config['period'],
+                                   quiet=config['quiet'], param_grid=param_grid, periods=config['periods'],
+                                   output_dir=config['output_dir'], sink=sink,
+                                   checkpoint_dir=config['checkpoint_dir'])
+    finally:
+        if sink is not None:
+            sink.close()
+    return 0 if results is not None and not results.empty else 1
+
+
+def _cmd_screen(args, config):
+    """Rank the z-score columns by signal quality (IC, hit rates) without running the simulator"""
+    from .backtest_engine import filter_pairs
+    from .main import load_backtest_data
+    from .signal_quality import DEFAULT_THRESHOLDS, SignalQuality
+
+    params = {**(config['params'] or {}), **_parse_params(args.param)}
+    df_main, df_pairs = load_backtest_data(config['data']['main'], config['data']['pairs'], config['period'],
+                                           config['periods'], config['quiet'])
+    df_pairs = filter_pairs(df_pairs, params.get('CORRELATION_THRESHOLD'), params.get('COINTEGRATION_THRESHOLD'))
+    screen = SignalQuality(df_main, df_pairs, max_holding_days=params.get('MAX_HOLDING_DAYS', 10),
+                           thresholds=args.thresholds or DEFAULT_THRESHOLDS)
+    ranking = screen.rank(metric=args.metric)
+
+    os.makedirs(config['output_dir'], exist_ok=True)
+    output_file = os.path.join(config['output_dir'], f"signal_quality_{config['period']}.csv")
+    ranking.to_csv(output_file, index=False)
+    logger.info("Signal quality of %d z-score columns saved to %s", len(ranking), output_file)
+    print(ranking.head(args.top).to_string(index=False))
+    return 0 if not ranking.empty else 1
+
+
+def _cmd_convert(args, config):
+    """CSV to quarter-partitioned Parquet store"""
+    from .streaming import convert_csv_to_store
+
+    store = convert_csv_to_store(args.csv or config['data']['main'], args.store, chunksize=args.chunksize,
+                                 overwrite=args.overwrite)
+    print(f"{store.store_dir}: {len(store.quarters)} quarters "
+          f"({', '.join(store.quarters[:1] + store.quarters[-1:])})")
+    return 0
+
+
+def _cmd_bench(args, config, extra):
+    """Forward to the benchmark suite's own options (see benchmark.py)"""
+    from .benchmark import main as bench_main
+
+    return bench_main(extra)
+
+
+def _checkpoint_runs(root):
+    """Runs of a checkpoint directory with their hyperparameters and quarter counts (stdlib only, fast)"""
+    runs = []
+    for spec_file in sorted(glob.glob(os.path.join(root, '*', 'run.json'))):
+        run_dir = os.path.dirname(spec_file)
+        with open(spec_file) as f:
+            spec = json.load(f)
+        runs.append({
+            'run': os.path.basename(run_dir),
+            'quarters': len(glob.glob(os.path.join(run_dir, '*.pkl'))),
+            'failed': len(glob.glob(os.path.join(run_dir, '*.failed.json'))),
+            # Batched runs checkpoint all their configurations under one key
+            'configs': spec.get('hyperparams') if isinstance(spec.get('hyperparams'), list) else [spec],
+        })
+    return runs
+
+
+def _cmd_report(args, config):
+    """List cached runs of a checkpoint directory, or summarize a results sink"""
+    root = args.root
+    if not os.path.isdir(os.path.join(root, 'results')):
+        runs = _checkpoint_runs(root)
+        if not runs:
+            print(f"No checkpointed runs or results sink in {root}")
+            return 1
+        for run in runs:
+            params = {key: value for key, value in run['configs'][0].items() if key != 'INITIAL_CAPITAL'}
+            print(f"{run['run']}  quarters={run['quarters']:<3} failed={run['failed']:<2} "
+                  f"configs={len(run['configs']):<3} {json.dumps(params, default=str)}")
+        return 0
+
+    import pandas as pd
+
+    from .query import ResultsQuery
+
+    with ResultsQuery(root) as query, pd.option_context('display.width', 200, 'display.max_columns', 30):
+        print(query.top_runs(args.top, metric=args.metric).to_string(index=False))
+        if args.pnl_by:
+            print()
+            print(query.pnl_by(args.pnl_by, limit=args.top).to_string(index=False))
+    return 0
+
+
+def _add_data_options(parser):
+    parser.add_argument('--config', help="JSON config file (see DEFAULT_CONFIG)")
+    parser.add_argument('--period', help="Period name, e.g. train or test")
+    parser.add_argument('--main', help="Backtest data (CSV or Parquet)")
+    parser.add_argument('--pairs', help="Pair table (CSV or Parquet)")
+    parser.add_argument('--output-dir')
+    parser.add_argument('--checkpoint-dir')
+    parser.add_argument('--param', action='append', metavar='NAME=VALUE',
+                        help="Hyperparameter override, VALUE in JSON (repeatable)")
+    parser.add_argument('--quiet', action='store_true', help="Skip diagnostics and progress bars")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m backtest', description="Pairs-trading backtest")
+    parser.add_argument('--log-level', help="Logging level (default from config, INFO)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Backtest one hyperparameter combination")
+    _add_data_options(run)
+    run.add_argument('--store', help="Quarter store to stream from instead of --main")
+
+    sweep = commands.add_parser('sweep', help="Search the config's param_grid")
+    _add_data_options(sweep)
+    sweep.add_argument('--search', choices=SEARCH_METHODS)
+    sweep.add_argument('--sink', help="ResultsSink directory for results, trades and daily returns")
+    sweep.add_argument('--min-quarters', type=int, help="Quarters of the first halving rung")
+    sweep.add_argument('--eta', type=int, help="Halving reduction factor")
+    sweep.add_argument('--halving-metric', help="Ranking metric of the halving rungs, e.g. sortino_ratio")
+    sweep.add_argument('--seed', type=int, help="Seed of the halving quarter order")
+
+    screen = commands.add_parser('screen', help="Rank z-score columns by IC and forward spread hit rates")
+    _add_data_options(screen)
+    screen.add_argument('--thresholds', type=float, nargs='+', help="Z-score thresholds of the hit rates")
+    screen.add_argument('--metric', default='ic', help="Ranking column, e.g. ic or hit_rate_2")
+    screen.add_argument('--top', type=int, default=20)
+
+    convert = commands.add_parser('convert', help="Convert a backtest CSV to a quarter store")
+    convert.add_argument('store', help="Output store directory")
+    convert.add_argument('--csv', help="Input CSV (default: data.main of the config)")
+    convert.add_argument('--config')
+    convert.add_argument('--chunksize', type=int, default=1_000_000)
+    convert.add_argument('--overwrite', action='store_true')
+
+    commands.add_parser('bench', help="Run the benchmark suite (takes benchmark.py's options)", add_help=False)
+
+    report = commands.add_parser('report', help="List checkpointed runs or summarize a results sink")
+    report.add_argument('root', help="Checkpoint directory or ResultsSink directory")
+    report.add_argument('--config')
+    report.add_argument('--top', type=int, default=10)
+    report.add_argument('--metric', default='sharpe_ratio')
+    report.add_argument('--pnl-by', help="PnL view of the sink, e.g. pair_pnl or quarter_pnl")
+    return parser
+
+
+COMMANDS = {'run': _cmd_run, 'sweep': _cmd_sweep, 'screen': _cmd_screen, 'convert': _cmd_convert,
+            'report': _cmd_report}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command != 'bench':
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    config = _apply_overrides(load_config(getattr(args, 'config', None)), args)
+    logging.basicConfig(level=(args.log_level or config['log_level']).upper(),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if args.command == 'bench':
+        return _cmd_bench(args, config, extra)
+    return COMMANDS[args.command](args, config)
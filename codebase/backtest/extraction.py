@@ -0,0 +1,249 @@
+import glob
+import io
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from .checkpoint import _atomic_write
+from .results_sink import run_hash
+
+logger = logging.getLogger(__name__)
+
+# Cached partitions are named like Hive partitions, e.g. year=2014.parquet
+YEAR_PREFIX = 'year='
+
+# Per-year queries of the data notebooks. {start} and {end} are the first and last day of the year.
+QUERIES = {
+    # market_data(CRSP).ipynb
+    'crsp_daily': {
+        'sql': """
+            SELECT
+                dsf.date, dsf.permno, names.ticker, dsf.prc, dsf.vol, dsf.ret, dsf.retx, dsf.bidlo,
+                dsf.askhi, dsf.openprc, dsf.shrout, dsf.cfacpr, dsf.cfacshr
+            FROM crsp.dsf AS dsf
+            LEFT JOIN crsp.msenames AS names
+                ON dsf.permno = names.permno
+                AND dsf.date BETWEEN names.namedt AND names.nameendt
+            WHERE dsf.date BETWEEN '{start}' AND '{end}'
+        """,
+        'date_cols': ['date'],
+    },
+    'crsp_market': {
+        'sql': """
+            SELECT date, vwretd, vwretx
+            FROM crsp.dsi
+            WHERE date BETWEEN '{start}' AND '{end}'
+        """,
+        'date_cols': ['date'],
+    },
+    # fed_rates_data(FRB WRDS).ipynb
+    'fed_rates': {
+        'sql': """
+            SELECT date, dff, effr
+            FROM frb.rates_daily
+            WHERE date BETWEEN '{start}' AND '{end}'
+                AND (dff IS NOT NULL OR effr IS NOT NULL)
+            ORDER BY date
+        """,
+        'date_cols': ['date'],
+    },
+    # value&growth_quaterly(compustat).ipynb (a date range instead of EXTRACT(YEAR ...), same rows)
+    'compustat_fundq': {
+        'sql': """
+            SELECT *
+            FROM comp_na_daily_all.fundq
+            WHERE indfmt = 'INDL'
+                AND datafmt = 'STD'
+                AND popsrc = 'D'
+                AND consol = 'C'
+                AND datadate BETWEEN '{start}' AND '{end}'
+        """,
+        'date_cols': ['datadate'],
+    },
+}
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections made by `factory`.
+
+    Connections are created on demand, at most `max_size` of them, and are
+    handed out one thread at a time.
+    """
+
+    def __init__(self, factory, max_size):
+        self.factory = factory
+        self.max_size = max_size
+        self._idle = queue.Queue()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.max_size:
+                connection = self.factory()
+                self._all.append(connection)
+                return connection
+        return self._idle.get()
+
+    def release(self, connection):
+        self._idle.put(connection)
+
+    def close(self):
+        for connection in self._all:
+            connection.close()
+        self._all = []
+        self._idle = queue.Queue()
+
+
+def sqlite_source(directory):
+    """
+    Connection factory of a local WRDS stand-in: every <schema>.db file of directory is attached as <schema>.
+
+    The notebooks' queries (crsp.dsf, frb.rates_daily, ...) then run
+    unchanged; see synthetic.write_wrds_fixture.
+    """
+    databases = sorted(glob.glob(os.path.join(directory, '*.db')))
+    if not databases:
+        raise FileNotFoundError(f"No .db files in {directory}")
+
+    def connect():
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        for path in databases:
+            schema = os.path.splitext(os.path.basename(path))[0]
+            connection.execute('ATTACH DATABASE ? AS "{}"'.format(schema), (path,))
+        return connection
+    return connect
+
+
+def _query_engine(source):
+    """SQLAlchemy engine of a source, if it is one or wraps one (wrds.Connection)"""
+    if hasattr(source, 'dialect') and hasattr(source, 'connect'):
+        return source
+    engine = getattr(source, 'engine', None)
+    return engine if hasattr(engine, 'dialect') else None
+
+
+class YearlyExtractor:
+    """
+    Concurrent, cached extraction of per-year query partitions.
+
+    Every (query, year) is fetched on its own thread and written to
+    `<cache_dir>/<name>-<sql hash>/year=<year>.parquet` (atomically) as
+    soon as it arrives, so a rerun, or a run resumed after a failure, only
+    queries the years not cached yet. Changing a query's SQL changes its
+    hash and hence its cache.
+
+    Parameters:
+    -----------
+    source : SQLAlchemy engine, wrds.Connection or callable
+        SQLAlchemy engines (and objects wrapping one in `.engine`) bring
+        their own connection pool. A callable is a DB-API connection factory
+        (e.g. sqlite_source(directory)), pooled here.
+    cache_dir : str
+        Root directory of the cached partitions
+    max_workers : int
+        Concurrent queries (and pooled connections)
+    """
+
+    def __init__(self, source, cache_dir, max_workers=4):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self._engine = _query_engine(source)
+        if self._engine is None and not callable(source):
+            raise TypeError("source must be a SQLAlchemy engine, a wrds.Connection or a DB-API connection factory")
+        self._pool = None if self._engine is not None else ConnectionPool(source, max_workers)
+
+    def partition_dir(self, name, sql):
+        return os.path.join(self.cache_dir, f"{name}-{run_hash({'sql': sql})[:8]}")
+
+    def cached_years(self, name, sql=None):
+        """Years of a query already in the cache"""
+        sql = QUERIES[name]['sql'] if sql is None else sql
+        files = glob.glob(os.path.join(self.partition_dir(name, sql), f"{YEAR_PREFIX}*.parquet"))
+        return sorted(int(os.path.basename(path)[len(YEAR_PREFIX):-len('.parquet')]) for path in files)
+
+    def _fetch(self, sql, date_cols, year):
+        query = sql.format(start=f"{year}-01-01", end=f"{year}-12-31", year=year)
+        if self._engine is not None:
+            with self._engine.connect() as connection:
+                return pd.read_sql(query, connection, parse_dates=date_cols)
+        connection = self._pool.acquire()
+        try:
+            return pd.read_sql(query, connection, parse_dates=date_cols)
+        finally:
+            self._pool.release(connection)
+
+    def extract(self, name, years, sql=None, date_cols=None, refresh=False):
+        """
+        Fetch the missing years of a query and return all requested years as one frame.
+
+        `name` is a key of QUERIES, or any name when `sql` (with {start},
+        {end} and/or {year} placeholders) is given. `refresh` re-queries
+        cached years. Years that fail are logged and raised after the others
+        are cached, so the next call retries only those.
+        """
+        if sql is None:
+            sql, date_cols = QUERIES[name]['sql'], QUERIES[name]['date_cols']
+        directory = self.partition_dir(name, sql)
+        os.makedirs(directory, exist_ok=True)
+        years = sorted(set(years))
+        cached = set() if refresh else set(self.cached_years(name, sql))
+        missing = [year for year in years if year not in cached]
+        logger.info("%s: %d of %d years cached, querying %d", name, len(years) - len(missing), len(years),
+                    len(missing))
+
+        failed = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._fetch, sql, date_cols or [], year): year for year in missing}
+            for future in as_completed(futures):
+                year = futures[future]
+                try:
+                    df_year = future.result()
+                except Exception as e:
+                    logger.error("%s %d failed: %s", name, year, e)
+                    failed[year] = e
+                    continue
+                buffer = io.BytesIO()
+                df_year.to_parquet(buffer, index=False)
+                _atomic_write(os.path.join(directory, f"{YEAR_PREFIX}{year}.parquet"), buffer.getvalue())
+                logger.info("%s %d: %d rows", name, year, len(df_year))
+        if failed:
+            raise RuntimeError(f"{name}: years {sorted(failed)} failed; rerun to retry them") \
+                from next(iter(failed.values()))
+        return self.load(name, years, sql)
+
+    def load(self, name, years=None, sql=None):
+        """Cached years of a query (all when years is None) as one frame"""
+        sql = QUERIES[name]['sql'] if sql is None else sql
+        years = self.cached_years(name, sql) if years is None else sorted(set(years))
+        directory = self.partition_dir(name, sql)
+        frames = [pd.read_parquet(os.path.join(directory, f"{YEAR_PREFIX}{year}.parquet")) for year in years]
+        # Empty years carry no dtypes worth keeping
+        frames = [frame for frame in frames if len(frame)] or frames[:1]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def extract_years(source, name, years, cache_dir, max_workers=4, refresh=False):
+    """One query's years (e.g. extract_years(conn, 'crsp_daily', range(2014, 2025), 'wrds_cache')) in one call"""
+    with YearlyExtractor(source, cache_dir, max_workers) as extractor:
+        return extractor.extract(name, years, refresh=refresh)
@@ -0,0 +1,191 @@
+import logging
+import pickle
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .checkpoint import _atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Year-to-date and balance-sheet items whose quarterly changes feed the features
+DIFF_COLUMNS = ['capxy', 'actq', 'cheq', 'lctq', 'dd1q', 'txpq']
+
+# Ratios the feature engine produces (winsorized at the 1st/99th percentiles, as in the notebook)
+RATIO_COLUMNS = ['roa', 'operating_margin', 'gross_margin', 'sloan_accruals', 'revenue_growth',
+                 'r_and_d_intensity', 'capex_intensity', 'roa_stability', 'revenue_growth_stability']
+
+# Ratios whose rolling standard deviation measures their stability, and the window in quarters
+STABILITY_COLUMNS = {'roa': 'roa_stability', 'revenue_growth': 'revenue_growth_stability'}
+STABILITY_WINDOW = 8
+
+WINSOR_QUANTILES = (0.01, 0.99)
+
+
+def _group_starts(keys):
+    """Index of the first row of each row's group, for rows sorted by key"""
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return np.maximum.accumulate(np.where(first, np.arange(len(keys)), 0))
+
+
+def _shift(values, starts, lag=1):
+    """Row values `lag` rows earlier within the group (NaN at the start of each group)"""
+    shifted = np.full_like(values, np.nan)
+    shifted[lag:] = values[:-lag]
+    shifted[np.arange(len(values)) - lag < starts] = np.nan
+    return shifted
+
+
+def _ffill(values, starts):
+    """Forward-fill NaNs within each group"""
+    rows = np.arange(len(values))[:, None]
+    last_valid = np.maximum.accumulate(np.where(np.isnan(values), -1, rows), axis=0)
+    filled = np.take_along_axis(values, np.maximum(last_valid, 0), axis=0)
+    filled[last_valid < starts[:, None]] = np.nan
+    return filled
+
+
+def _rolling_std(values, starts, window):
+    """Rolling sample std over `window` rows of the same group (NaN unless all are present)"""
+    result = np.full_like(values, np.nan)
+    if len(values) < window:
+        return result
+    with np.errstate(invalid='ignore'):
+        std = sliding_window_view(values, window, axis=0).std(axis=-1, ddof=1)
+    complete = np.arange(window - 1, len(values)) - (window - 1) >= starts[window - 1:]
+    result[window - 1:] = np.where(complete[:, None], std, np.nan)
+    return result
+
+
+def compute_features(df_comp):
+    """
+    Quarterly fundamentals ratios, changes and stability of a Compustat fundq panel (not winsorized).
+
+    The panel is sorted by (gvkey, datadate) once and the group boundaries
+    computed once. Every lag, diff and rolling std is then taken over all
+    its columns at once on the underlying arrays, with the notebook's
+    definitions: quarterly capex from year-to-date capxy, revenue growth as
+    pct_change of saleq (forward-filled, as pandas does), Sloan accruals and
+    8-quarter rolling std of roa and revenue growth.
+    """
+    df = df_comp.sort_values(['gvkey', 'datadate'], kind='stable').reset_index(drop=True)
+    starts = _group_starts(df['gvkey'].to_numpy())
+    column = lambda name: df[name].to_numpy(dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw = df[DIFF_COLUMNS].to_numpy(dtype=np.float64)
+        diffs = dict(zip(DIFF_COLUMNS, (raw - _shift(raw, starts)).T))
+
+        fqtr = df['fqtr'].fillna(pd.to_datetime(df['datadate']).dt.quarter)
+        capxq = np.where(fqtr.to_numpy() == 1, column('capxy'), diffs['capxy'])
+        atq, saleq = column('atq'), column('saleq')
+        sales_filled = _ffill(saleq[:, None], starts)
+        atq_lag = _shift(atq[:, None], starts)[:, 0]
+
+        features = {
+            'fqtr': fqtr,
+            'capxq': capxq,
+            'roa': column('niq') / atq,
+            'operating_margin': column('oiadpq') / saleq,
+            'gross_margin': (saleq - column('cogsq')) / saleq,
+            'revenue_growth': (sales_filled / _shift(sales_filled, starts))[:, 0] - 1,
+            'r_and_d_intensity': column('xrdq') / atq,
+            'capex_intensity': capxq / atq,
+            'atq_lag': atq_lag,
+            **{f'd_{name}': diffs[name] for name in DIFF_COLUMNS[1:]},
+        }
+        features['sloan_accruals'] = ((diffs['actq'] - diffs['cheq'])
+                                      - (diffs['lctq'] - diffs['dd1q'] - diffs['txpq'])
+                                      - column('dpq')) / atq_lag
+
+    stability = _rolling_std(np.column_stack([features[name] for name in STABILITY_COLUMNS]), starts,
+                             STABILITY_WINDOW)
+    for k, name in enumerate(STABILITY_COLUMNS.values()):
+        features[name] = stability[:, k]
+
+    for name, values in features.items():
+        df[name] = values
+    return df
+
+
+def winsor_bounds(df, columns=RATIO_COLUMNS, quantiles=WINSOR_QUANTILES):
+    """Lower and upper clip bounds of every column (pandas quantiles, NaNs ignored)"""
+    bounds = df[columns].quantile(list(quantiles))
+    return {col: (bounds[col].iloc[0], bounds[col].iloc[1]) for col in columns}
+
+
+def winsorize(df, bounds):
+    """Clip columns to their bounds in place"""
+    for col, (lower, upper) in bounds.items():
+        df[col] = df[col].clip(lower=lower, upper=upper)
+    return df
+
+
+class FundamentalsFeatureEngine:
+    """
+    Incremental Compustat feature table.
+
+    The first `update` computes the features of the whole panel and the
+    winsorization bounds (1st/99th percentiles over the panel, as in the
+    notebook). Later updates only take quarters newer than each gvkey's last
+    one. Their lags, diffs and 8-quarter stability come from the last
+    STABILITY_WINDOW + 1 quarters kept per gvkey, and they are clipped to the
+    stored bounds, so rows already computed never change. `rebuild` starts
+    over from a full panel.
+    """
+
+    def __init__(self):
+        self.features = pd.DataFrame()
+        self.bounds = None
+        # Last STABILITY_WINDOW + 1 quarters of every gvkey (the lag of the oldest stability input)
+        self.tail = pd.DataFrame()
+
+    def update(self, df_comp):
+        """Add new quarters of a fundq panel and return their feature rows"""
+        df_comp = df_comp.copy()
+        df_comp['datadate'] = pd.to_datetime(df_comp['datadate'])
+        if not self.tail.empty:
+            last_dates = self.tail.groupby('gvkey')['datadate'].max()
+            known = df_comp['gvkey'].map(last_dates)
+            df_comp = df_comp[known.isna() | (df_comp['datadate'] > known)]
+        if df_comp.empty:
+            return df_comp
+
+        # Tail rows only provide the lags and stability windows of the new ones
+        history = df_comp.assign(_new=True)
+        if not self.tail.empty:
+            history = pd.concat([self.tail.assign(_new=False), history], ignore_index=True)
+        computed = compute_features(history)
+        new_rows = computed[computed['_new'].to_numpy(dtype=bool)].drop(columns='_new')
+        if self.bounds is None:
+            self.bounds = winsor_bounds(new_rows)
+        new_rows = winsorize(new_rows.copy(), self.bounds)
+
+        # Forward-filled sales, so revenue growth never needs quarters older than the tail
+        history = history.drop(columns='_new').sort_values(['gvkey', 'datadate'], kind='stable')
+        history['saleq'] = history.groupby('gvkey')['saleq'].ffill()
+        self.tail = history.groupby('gvkey').tail(STABILITY_WINDOW + 1).reset_index(drop=True)
+        self.features = pd.concat([self.features, new_rows], ignore_index=True)
+        logger.info("Fundamentals: %d new rows for %d gvkeys", len(new_rows), new_rows['gvkey'].nunique())
+        return new_rows
+
+    def rebuild(self, df_comp):
+        """Recompute every feature and the winsorization bounds from a full panel"""
+        self.__init__()
+        return self.update(df_comp)
+
+    def save(self, path):
+        """Persist the engine (features, bounds and per-gvkey tails) for later updates"""
+        _atomic_write(path, pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def build_fundamental_features(df_comp):
+    """Winsorized features of a full fundq panel in one call (the notebook's ratio cell)"""
+    return FundamentalsFeatureEngine().update(df_comp).reset_index(drop=True)
@@ -1,148 +1,231 @@
+import logging
 import os
 import pickle
-import time
-import traceback
 import numpy as np
 import pandas as pd
 from itertools import product
 
-from .backtest_engine import BacktestEngine
+from .backtest_engine import SIMULATION_PARAMS, combine_equity_curves
+from .pair_universe import PairScreen
+from .results_sink import run_hash
+from .session import BacktestSession
+from .performance import calculate_trade_based_metrics
+from .schema import quarter_codes, quarter_label
 
-def run_hyperparameter_grid_search(df_main, df_pairs, param_grid, output_file='backtest_results.csv'):
-    """Run backtest with different hyperparameter combinations"""
-    results = []
-    
-    # Generate parameter combinations more efficiently
-    keys = list(param_grid.keys())
-    values = list(param_grid.values())
-    param_combinations = []
-    
+logger = logging.getLogger(__name__)
+
+# Hyperparameters selecting the traded pairs
+PAIR_FILTER_PARAMS = ('CORRELATION_THRESHOLD', 'COINTEGRATION_THRESHOLD')
+
+# Metrics copied from a run's performance dictionary into its results row
+RESULT_METRICS = ['sharpe_ratio', 'sortino_ratio', 'alpha', 'beta', 'max_drawdown', 'hit_rate',
+                  'num_trades', 'avg_trade_pnl', 'avg_holding_period', 'num_trading_days']
+
+def _expand_param_grid(param_grid):
+    """Expand a parameter grid into the list of combinations (INITIAL_CAPITAL is a scalar)"""
     # Get all parameter combinations except INITIAL_CAPITAL
-    non_capital_keys = [k for k in keys if k != 'INITIAL_CAPITAL']
+    non_capital_keys = [k for k in param_grid if k != 'INITIAL_CAPITAL']
     non_capital_values = [param_grid[k] for k in non_capital_keys]
     
     # Generate combinations with product
+    param_combinations = []
     for combination in product(*non_capital_values):
         params = dict(zip(non_capital_keys, combination))
         params['INITIAL_CAPITAL'] = param_grid['INITIAL_CAPITAL']
         param_combinations.append(params)
+    return param_combinations
+
+def _run_key(params, sink):
+    """Identifier of a combination in the checkpoint (pickle) or in the sink (run hash)"""
+    return run_hash(params) if sink is not None else str(params)
+
+def _signal_groups(indexed_params):
+    """
+    Group (index, params) combinations as signal key -> pair filter -> batch.
+
+    Combinations that only differ in simulation parameters are simulated in
+    lockstep (one batch), and batches that only differ in the pair filter
+    share signals computed for the loosest filter.
+    """
+    signal_groups = {}
+    for i, params in indexed_params:
+        signal_key = tuple((key, params[key]) for key in params
+                           if key not in SIMULATION_PARAMS + PAIR_FILTER_PARAMS)
+        pair_filter = tuple(params[key] for key in PAIR_FILTER_PARAMS)
+        signal_groups.setdefault(signal_key, {}).setdefault(pair_filter, []).append((i, params))
+    return signal_groups
+
+def _precompute_shared_signals(session, period, batches):
+    """Precompute a signal group's signals once, for its loosest pair filter and z-score threshold"""
+    # The session derives every stricter batch's signals from them
+    try:
+        loose_filter = PairScreen.loosest(list(batches))
+        loose_threshold = min(params['ZSCORE_THRESHOLD'] for batch in batches.values() for _, params in batch)
+        session.signal_generator(next(iter(batches.values()))[0][1], period, loose_filter, loose_threshold)
+    except Exception:
+        logger.exception("Error precomputing shared signals, computing them per batch instead")
+
+def _batch_configs(batch):
+    """SIMULATION_PARAMS overrides of a batch's combinations, for BacktestEngine.run_backtest_batch"""
+    return [{key: params[key] for key in SIMULATION_PARAMS if key in params} for _, params in batch]
+
+def _result_row(params, performance):
+    """Combine parameters and performance metrics into one output row"""
+    row = {key: params[key] for key in ['CORRELATION_THRESHOLD', 'COINTEGRATION_THRESHOLD', 'ZSCORE_METHOD',
+                                        'ZSCORE_THRESHOLD', 'LOOKBACK_PERIOD', 'HORIZON', 'MAX_HOLDING_DAYS']}
+    for metric in RESULT_METRICS:
+        row[metric] = performance.get(metric, 0)
+    return row
+
+def run_hyperparameter_grid_search(df_main, df_pairs, param_grid, output_file='backtest_results.csv', quiet=False,
+                                   sink=None, checkpoint_dir=None, session=None, period=None, output_dir='.'):
+    """Run backtest with different hyperparameter combinations
+
+    Combinations that differ only in ZSCORE_THRESHOLD, MAX_HOLDING_DAYS or
+    INITIAL_CAPITAL are run as one lockstep batch (see
+    BacktestEngine.run_backtest_batch), and batches that differ only in the
+    pair filter reuse signals precomputed for the loosest filter. With
+    quiet=True every BacktestEngine skips its diagnostic scans and progress
+    bars, which matters for sweeps over hundreds of combinations.
+
+    With a ResultsSink, trade logs, daily returns and result rows go to its
+    compressed datasets (keyed by run_hash) from a background thread instead
+    of per-run CSV files in output_dir and a pickle checkpoint, and completed
+    runs found in the sink are skipped. output_file is still written once at
+    the end.
+
+    With a checkpoint_dir, every engine also checkpoints each completed
+    quarter there (see BacktestEngine), so a combination interrupted midway
+    resumes from its last finished quarter.
+
+    Engines and signals come from a BacktestSession, so working frames are
+    prepared once per z-score column. Pass `session` (and a `period` of it)
+    to reuse one across searches and periods; df_main and df_pairs are then
+    ignored.
+    """
+    results = []
     
-    print(f"Running {len(param_combinations)} parameter combinations")
+    # Generate parameter combinations more efficiently
+    param_combinations = _expand_param_grid(param_grid)
     
-    # Use a checkpointing mechanism
-    checkpoint_file = f"checkpoint_{os.path.basename(output_file)}.pkl"
+    logger.info("Running %d parameter combinations", len(param_combinations))
+    
+    # Use a checkpointing mechanism, next to output_file
+    checkpoint_file = os.path.join(os.path.dirname(output_file), f"checkpoint_{os.path.basename(output_file)}.pkl")
     completed_runs = set()
     try:
-        if os.path.exists(checkpoint_file):
+        if sink is not None:
+            # Resume from the sink: runs are identified by their hyperparameter hash
+            completed_runs = sink.completed_runs()
+            previous = sink.read('results')
+            if not previous.empty:
+                results = previous[previous['run_id'].isin(completed_runs)].to_dict('records')
+                logger.info("Loaded %d previous results from %s", len(results), sink.root)
+        elif os.path.exists(checkpoint_file):
             with open(checkpoint_file, 'rb') as f:
                 checkpoint_data = pickle.load(f)
                 results = checkpoint_data.get('results', [])
                 completed_runs = set(checkpoint_data.get('completed', []))
-                print(f"Loaded {len(results)} previous results from checkpoint")
+                logger.info("Loaded %d previous results from checkpoint", len(results))
     except Exception as e:
-        print(f"Error loading checkpoint: {str(e)}. Starting fresh.")
+        logger.warning("Error loading checkpoint: %s. Starting fresh.", e)
         results = []
         completed_runs = set()
     
-    # Run backtest for each combination
+    # Prepared frames, the pair screen (every pair filter a prefix slice plus a mask) and signals are shared
+    if session is None:
+        session = BacktestSession(df_main, df_pairs, quiet=quiet)
+    
+    # Skip already completed runs
+    pending = []
     for i, params in enumerate(param_combinations):
-        # Skip already completed runs
-        params_str = str(params)
-        if params_str in completed_runs:
-            print(f"Skipping combination {i+1}/{len(param_combinations)}: already completed")
+        if _run_key(params, sink) in completed_runs:
+            logger.debug("Skipping combination %d/%d: already completed", i + 1, len(param_combinations))
             continue
-            
-        print(f"Running combination {i+1}/{len(param_combinations)}: {params}")
+        pending.append((i, params))
+    
+    for batches in _signal_groups(pending).values():
+        _precompute_shared_signals(session, period, batches)
         
-        try:
-            # Create a different random seed for each run for reproducibility
-            seed = hash(params_str) % 10000
-            np.random.seed(seed)
-            
-            backtest = BacktestEngine(df_main, df_pairs, params)
-            result = backtest.run_backtest()
-            
-            # Extract performance metrics
-            performance = result['performance']
-
-            # Save trade log to file with timestamp
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            if not result['trade_log'].empty:
-                trade_log_file = f"trade_log_{params['ZSCORE_METHOD']}_{params['ZSCORE_THRESHOLD']}_{params['LOOKBACK_PERIOD']}_{params['HORIZON']}_{params['MAX_HOLDING_DAYS']}_{timestamp}.csv"
-                result['trade_log'].to_csv(trade_log_file, index=False)
-                print(f"Saved {len(result['trade_log'])} trades to {trade_log_file}")
-            else:
-                print("No trades to save!")
-            
-            # Combine parameters and performance metrics for output
-            result_row = {
-                'CORRELATION_THRESHOLD': params['CORRELATION_THRESHOLD'],
-                'COINTEGRATION_THRESHOLD': params['COINTEGRATION_THRESHOLD'],
-                'ZSCORE_METHOD': params['ZSCORE_METHOD'],
-                'ZSCORE_THRESHOLD': params['ZSCORE_THRESHOLD'],
-                'LOOKBACK_PERIOD': params['LOOKBACK_PERIOD'],
-                'HORIZON': params['HORIZON'],
-                'MAX_HOLDING_DAYS': params['MAX_HOLDING_DAYS'],
-                'sharpe_ratio': performance.get('sharpe_ratio', 0),
-                'sortino_ratio': performance.get('sortino_ratio', 0),
-                'alpha': performance.get('alpha', 0),
-                'beta': performance.get('beta', 0),
-                'max_drawdown': performance.get('max_drawdown', 0),
-                'hit_rate': performance.get('hit_rate', 0),
-                'num_trades': performance.get('num_trades', 0),
-                'avg_trade_pnl': performance.get('avg_trade_pnl', 0),
-                'avg_holding_period': performance.get('avg_holding_period', 0),
-                'num_trading_days': performance.get('num_trading_days', 0)
-            }
-            
-            results.append(result_row)
-            completed_runs.add(params_str)
+        # Run backtest for each batch of combinations
+        for pair_filter, batch in batches.items():
+            base_params = batch[0][1]
+            logger.info("Running combinations %s/%d in one batch: %s",
+                        ", ".join(str(i + 1) for i, _ in batch), len(param_combinations), base_params)
             
-            # Save checkpoint after each successful run
             try:
-                with open(checkpoint_file, 'wb') as f:
-                    pickle.dump({'results': results, 'completed': list(completed_runs)}, f)
+                # Create a different random seed for each batch for reproducibility
+                seed = hash(str(base_params)) % 10000
+                np.random.seed(seed)
                 
-                # Save to CSV as well
-                pd.DataFrame(results).to_csv(output_file, index=False)
-            except Exception as save_err:
-                print(f"Error saving checkpoint: {str(save_err)}")
-            
-        except Exception as e:
-            print(f"Error running combination {i+1}: {params}")
-            print(f"Error details: {str(e)}")
-            traceback.print_exc()
-            
-            # Add a row with error information
-            error_row = {
-                'CORRELATION_THRESHOLD': params['CORRELATION_THRESHOLD'],
-                'COINTEGRATION_THRESHOLD': params['COINTEGRATION_THRESHOLD'],
-                'ZSCORE_METHOD': params['ZSCORE_METHOD'],
-                'ZSCORE_THRESHOLD': params['ZSCORE_THRESHOLD'],
-                'LOOKBACK_PERIOD': params['LOOKBACK_PERIOD'],
-                'HORIZON': params['HORIZON'],
-                'MAX_HOLDING_DAYS': params['MAX_HOLDING_DAYS'],
-                'error': str(e),
-                'sharpe_ratio': 0,
-                'sortino_ratio': 0,
-                'alpha': 0,
-                'beta': 0,
-                'max_drawdown': 0,
-                'hit_rate': 0,
-                'num_trades': 0,
-                'avg_trade_pnl': 0,
-                'avg_holding_period': 0,
-                'num_trading_days': 0
-            }
-            results.append(error_row)
+                backtest = session.engine(base_params, period, sink=sink, checkpoint_dir=checkpoint_dir,
+                                          output_dir=output_dir)
+                
+                # Shared signals masked down to this batch's pairs and threshold
+                signal_generator = session.signal_generator(
+                    base_params, period, pair_filter, min(params['ZSCORE_THRESHOLD'] for _, params in batch))
+                
+                batch_results = backtest.run_backtest_batch(_batch_configs(batch), signal_generator=signal_generator)
+            except Exception as e:
+                logger.exception("Error running batch of %d combinations: %s", len(batch), base_params)
+                batch_results = [e] * len(batch)
             
-            # Save checkpoint and CSV after error
-            try:
-                with open(checkpoint_file, 'wb') as f:
-                    pickle.dump({'results': results, 'completed': list(completed_runs)}, f)
-                pd.DataFrame(results).to_csv(output_file, index=False)
-            except Exception as save_err:
-                print(f"Error saving checkpoint after error: {str(save_err)}")
+            for (i, params), result in zip(batch, batch_results):
+                run_key = _run_key(params, sink)
+                
+                if isinstance(result, Exception):
+                    # Add a row with error information
+                    error_row = _result_row(params, {})
+                    error_row['error'] = str(result)
+                    # Like success rows, so a failed combination links to its checkpoint and hash
+                    error_row['run_id'] = run_hash(params)
+                    results.append(error_row)
+                    if sink is not None:
+                        sink.write('results', pd.DataFrame([error_row]), run_key)
+                        continue
+                
+                    # Save checkpoint and CSV after error
+                    try:
+                        with open(checkpoint_file, 'wb') as f:
+                            pickle.dump({'results': results, 'completed': list(completed_runs)}, f)
+                        pd.DataFrame(results).to_csv(output_file, index=False)
+                    except Exception as save_err:
+                        logger.error("Error saving checkpoint after error: %s", save_err)
+                    continue
+                
+                # Extract performance metrics
+                performance = result['performance']
+
+                # Save trade log to the sink, or to a file named by the run hash (like its daily returns file)
+                if sink is not None:
+                    sink.write('trades', result['trade_log'], run_key)
+                elif not result['trade_log'].empty:
+                    os.makedirs(output_dir, exist_ok=True)
+                    trade_log_file = os.path.join(output_dir, f"trade_log_{run_hash(params)}.csv")
+                    result['trade_log'].to_csv(trade_log_file, index=False)
+                    logger.info("Saved %d trades to %s", len(result['trade_log']), trade_log_file)
+                else:
+                    logger.info("No trades to save!")
+                
+                # Combine parameters and performance metrics for output; run_id links the row to its files
+                result_row = _result_row(params, performance)
+                result_row['run_id'] = run_hash(params)
+                
+                results.append(result_row)
+                completed_runs.add(run_key)
+                if sink is not None:
+                    sink.write('results', pd.DataFrame([result_row]), run_key)
+                    continue
+                
+                # Save checkpoint after each successful run
+                try:
+                    with open(checkpoint_file, 'wb') as f:
+                        pickle.dump({'results': results, 'completed': list(completed_runs)}, f)
+                
+                    # Save to CSV as well
+                    pd.DataFrame(results).to_csv(output_file, index=False)
+                except Exception as save_err:
+                    logger.error("Error saving checkpoint: %s", save_err)
     
     # Final save and return
     try:
@@ -150,5 +233,206 @@ def run_hyperparameter_grid_search(df_main, df_pairs, param_grid, output_file='b
         results_df.to_csv(output_file, index=False)
         return results_df
     except Exception as final_err:
-        print(f"Error saving final results: {str(final_err)}")
-        return pd.DataFrame(results)
\ No newline at end of file
+        logger.error("Error saving final results: %s", final_err)
+        return pd.DataFrame(results)
+
+def _run_rung(session, period, indexed_params, quarters, checkpoint_dir, n_combinations):
+    """
+    Simulate some quarters of (index, params) combinations in lockstep batches with shared signals.
+
+    Returns index -> run_backtest result, or the exception its batch raised.
+    """
+    outcomes = {}
+    for batches in _signal_groups(indexed_params).values():
+        _precompute_shared_signals(session, period, batches)
+        for pair_filter, batch in batches.items():
+            base_params = batch[0][1]
+            logger.info("Running combinations %s/%d on %d quarters in one batch: %s",
+                        ", ".join(str(i + 1) for i, _ in batch), n_combinations, len(quarters), base_params)
+            try:
+                # Partial runs write no daily returns files; the search reports its own results
+                backtest = session.engine(base_params, period, checkpoint_dir=checkpoint_dir,
+                                          save_daily_returns=False)
+                signal_generator = session.signal_generator(
+                    base_params, period, pair_filter, min(params['ZSCORE_THRESHOLD'] for _, params in batch))
+                batch_results = backtest.run_backtest_batch(_batch_configs(batch), signal_generator=signal_generator,
+                                                            quarters=quarters)
+            except Exception as e:
+                logger.exception("Error running batch of %d combinations: %s", len(batch), base_params)
+                batch_results = [e] * len(batch)
+            outcomes.update((i, result) for (i, _), result in zip(batch, batch_results))
+    return outcomes
+
+def run_successive_halving_search(df_main, df_pairs, param_grid, output_file='successive_halving_results.csv',
+                                  min_quarters=2, eta=3, metric='sharpe_ratio', seed=0, quiet=True, sink=None,
+                                  checkpoint_dir=None, session=None, period=None):
+    """
+    Adaptive multi-fidelity search over a parameter grid (successive halving).
+
+    Every combination is first evaluated on a small random subset of calendar
+    quarters. After each rung the combinations are ranked by `metric`, the
+    best 1/eta are promoted, and the promoted ones are evaluated on eta times
+    more quarters, until the survivors have seen the full period.
+
+    Quarters are simulated independently (capital resets every quarter), so
+    a promoted combination only runs the quarters it has not seen yet; its
+    earlier trade logs and equity curves are reused and metrics are computed
+    over everything it has accumulated. Each rung runs like the grid search:
+    combinations differing only in SIMULATION_PARAMS are one lockstep batch,
+    and signals come from a BacktestSession, shared across pair filters,
+    thresholds and rungs.
+
+    Parameters:
+    -----------
+    df_main, df_pairs : pandas DataFrame
+        Same inputs as run_hyperparameter_grid_search (ignored with a session)
+    param_grid : dict
+        Same format as run_hyperparameter_grid_search
+    output_file : str
+        CSV receiving one row per (combination, rung)
+    min_quarters : int
+        Number of quarters in the first rung
+    eta : int
+        Reduction factor: keep 1/eta of the combinations and grow the number
+        of quarters eta-fold at each rung
+    metric : str
+        Ranking metric, e.g. 'sharpe_ratio' or 'sortino_ratio' (higher is better)
+    seed : int
+        Seed for the quarter sampling order
+    quiet : bool
+        Skip diagnostics and progress bars in every BacktestEngine
+    sink : ResultsSink or None
+        Receives the final rung (the combinations evaluated on the full
+        period): their results rows, trade logs and daily returns, keyed by
+        run_hash like grid search runs
+    checkpoint_dir : str or None
+        Per-quarter checkpoints of every batch (see BacktestEngine)
+    session : BacktestSession or None
+        Session to run on (with `period`), e.g. shared with other searches
+
+    Returns:
+    --------
+    pandas DataFrame : all rung results, with a 'promoted' flag and a
+        'winner' flag on the best combination of the final rung
+    """
+    if eta < 2:
+        raise ValueError(f"eta must be at least 2, got {eta}")
+    
+    param_combinations = _expand_param_grid(param_grid)
+    if session is None:
+        session = BacktestSession(df_main, df_pairs, quiet=quiet)
+    
+    # Nested quarter subsets: rung r uses the first n_r quarters of one random order
+    start, end = session.period_bounds(period)
+    dates = session.df_main['date']
+    df_period = session.df_main[(dates >= start) & (dates <= end)]
+    all_quarters = np.unique(quarter_codes(df_period['date']))
+    quarter_order = np.random.default_rng(seed).permutation(all_quarters)
+    rung_sizes = []
+    n_quarters = max(1, min(min_quarters, len(all_quarters)))
+    while True:
+        rung_sizes.append(n_quarters)
+        if n_quarters >= len(all_quarters):
+            break
+        n_quarters = min(len(all_quarters), n_quarters * eta)
+    
+    logger.info("Successive halving over %d combinations and %d quarters, rung sizes %s",
+                len(param_combinations), len(all_quarters), rung_sizes)
+    
+    # Market data lookups for the metrics
+    date_indexed = df_period.drop_duplicates('date').set_index('date')
+    market_return_lookup = date_indexed['vwretd'].to_dict()
+    ffr_lookup = date_indexed['fed_funds_rate'].to_dict()
+    
+    # Per combination: quarter label -> (trade log, raw quarter equity curve)
+    partial_results = {i: {} for i in range(len(param_combinations))}
+    survivors = list(range(len(param_combinations)))
+    rows = []
+    
+    for rung, rung_size in enumerate(rung_sizes):
+        rung_quarters = quarter_order[:rung_size]
+        # Survivors have seen every quarter of the previous rung, so only the new ones are simulated
+        seen_size = rung_sizes[rung - 1] if rung > 0 else 0
+        new_quarters = list(quarter_order[seen_size:rung_size])
+        outcomes = _run_rung(session, period, [(i, param_combinations[i]) for i in survivors], new_quarters,
+                             checkpoint_dir, len(param_combinations))
+        is_last = rung == len(rung_sizes) - 1
+        rung_rows = []
+        daily_returns = {}
+        
+        for i in survivors:
+            params = param_combinations[i]
+            seen = partial_results[i]
+            
+            try:
+                result = outcomes[i]
+                if isinstance(result, Exception):
+                    raise result
+                trade_log = result['trade_log']
+                for label, quarter_result in result['quarterly_results'].items():
+                    quarter_trades = trade_log[trade_log['quarter'] == label] if not trade_log.empty else trade_log
+                    seen[label] = (quarter_trades, quarter_result['equity_curve'])
+                # Quarters without any data still count as evaluated
+                for q in new_quarters:
+                    seen.setdefault(quarter_label(q), (pd.DataFrame(), None))
+                
+                # Metrics over every quarter this combination has seen so far
+                labels = sorted(quarter_label(q) for q in rung_quarters)
+                trade_logs = [seen[label][0] for label in labels if not seen[label][0].empty]
+                curves = [seen[label][1] for label in labels if seen[label][1] is not None]
+                trade_df = pd.concat(trade_logs, ignore_index=True) if trade_logs else pd.DataFrame()
+                equity_curve = combine_equity_curves(curves, params['INITIAL_CAPITAL'])
+                performance = calculate_trade_based_metrics(
+                    trade_df=trade_df,
+                    market_returns=market_return_lookup,
+                    ffr_lookup=ffr_lookup,
+                    initial_capital=params['INITIAL_CAPITAL'],
+                    equity_curve=equity_curve.set_index('date')['equity'] if not equity_curve.empty else None
+                )
+                row = _result_row(params, performance)
+                if is_last and sink is not None:
+                    sink.write('trades', trade_df, run_hash(params))
+                    daily_returns[i] = performance.get('daily_returns')
+            except Exception as e:
+                logger.exception("Error running combination %d at rung %d: %s", i + 1, rung, params)
+                row = _result_row(params, {})
+                row['error'] = str(e)
+                row[metric] = -np.inf
+            
+            row.update({'run_id': run_hash(params), 'combination': i, 'rung': rung, 'num_quarters': rung_size})
+            rung_rows.append(row)
+        
+        # Promote the best 1/eta to the next rung; the best of the last rung is the winner
+        rung_df = pd.DataFrame(rung_rows)
+        n_keep = 1 if is_last else max(1, int(np.ceil(len(survivors) / eta)))
+        ranked = rung_df.sort_values(metric, ascending=False, na_position='last')
+        promoted = set(ranked['combination'].head(n_keep))
+        rung_df['promoted'] = rung_df['combination'].isin(promoted) & (not is_last)
+        rung_df['winner'] = rung_df['combination'].isin(promoted) & is_last
+        rows.append(rung_df)
+        
+        logger.info("Rung %d: evaluated %d combinations on %d quarters, best %s=%.4f",
+                    rung, len(survivors), rung_size, metric, ranked[metric].iloc[0])
+        
+        # The final rung covers the full period, so its runs are complete and go to the sink
+        if is_last and sink is not None:
+            for i, frame in daily_returns.items():
+                sink.write('daily_returns', frame, run_hash(param_combinations[i]))
+            sink.write('results', rung_df, None)
+        
+        # Release partial results of pruned combinations
+        for i in survivors:
+            if i not in promoted:
+                partial_results[i] = {}
+        survivors = [i for i in survivors if i in promoted]
+        
+        results_df = pd.concat(rows, ignore_index=True)
+        try:
+            results_df.to_csv(output_file, index=False)
+        except Exception as save_err:
+            logger.error("Error saving successive halving results: %s", save_err)
+    
+    winner = results_df[results_df['winner']]
+    if not winner.empty:
+        logger.info("Successive halving winner: %s", param_combinations[int(winner['combination'].iloc[0])])
+    return results_df
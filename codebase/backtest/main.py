@@ -1,89 +1,118 @@
+import logging
+import os
 import pandas as pd
 import time
-import traceback
 
-from .grid_search import run_hyperparameter_grid_search  # Uncomment this import
+from .grid_search import run_hyperparameter_grid_search
+from .pair_universe import pairs_formed_between
+
+logger = logging.getLogger(__name__)
+
+# Date ranges of the named periods: name -> (start_date, end_date, description)
+PERIODS = {
+    'train': ('2015-01-01', '2021-12-31', 'in-sample'),
+    'test': ('2022-01-01', '2024-12-31', 'out-of-sample'),
+}
+
+# Hyperparameter grid of run_backtest unless one is passed
+DEFAULT_PARAM_GRID = {
+    'COINTEGRATION_THRESHOLD': [0.05],
+    'CORRELATION_THRESHOLD': [0.9], #0.5, 0.7, ],
+    'ZSCORE_METHOD': ['classical'], #'ou'],
+    'ZSCORE_THRESHOLD': [1],
+    'LOOKBACK_PERIOD': [10],
+    'HORIZON': [10],
+    'MAX_HOLDING_DAYS': [10],
+    'INITIAL_CAPITAL': 1_000_000_000
+}
+
+
+def _read_table(path):
+    """Read a CSV or Parquet file"""
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+
+
+def load_pairs(df_pairs_path='corr_coin.csv'):
+    """Load a pair table, renaming permno_1/permno_2 to permno_black/permno_white"""
+    try:
+        df_pairs = _read_table(df_pairs_path)
+        logger.info("Successfully loaded %s with columns %s", df_pairs_path, list(df_pairs.columns))
+    except Exception as e:
+        logger.error("Error loading %s: %s", df_pairs_path, e)
+        raise
+
+    # Rename column names if needed
+    if 'permno_1' in df_pairs.columns and 'permno_2' in df_pairs.columns:
+        df_pairs.rename(columns={'permno_1': 'permno_black', 'permno_2': 'permno_white'}, inplace=True)
+    return df_pairs
+
+
+def load_backtest_data(df_main_path='final_backtest_data.csv', df_pairs_path='corr_coin.csv', period='train',
+                       periods=None, quiet=False):
+    """Load the backtest inputs of a period, with pairs renamed to permno_black/permno_white"""
+    periods = PERIODS if periods is None else periods
+    if period.lower() not in periods:
+        raise ValueError(f"Invalid period: {period}. Use one of {list(periods)}.")
+    start_date, end_date, *description = periods[period.lower()]
+    period_name = description[0] if description else period.lower()
+
+    try:
+        df_merged_filtered = _read_table(df_main_path)
+        logger.info("Successfully loaded %s", df_main_path)
+    except Exception as e:
+        logger.error("Error loading %s: %s", df_main_path, e)
+        raise
+    df_pairs = load_pairs(df_pairs_path)
+    
+    # Convert date columns to datetime
+    df_merged_filtered['date'] = pd.to_datetime(df_merged_filtered['date'])
+    
+    # Filter main dataframe by date
+    date_mask = (df_merged_filtered['date'] >= start_date) & (df_merged_filtered['date'] <= end_date)
+    df_merged_filtered = df_merged_filtered[date_mask].copy()
+
+    # Define quarters based on calendar date
+    df_merged_filtered['quarter'] = df_merged_filtered['date'].dt.to_period('Q').astype(str)
+    
+    # Filter pairs by date range if formation_date exists
+    if 'formation_date' in df_pairs.columns:
+        df_pairs['formation_date'] = pd.to_datetime(df_pairs['formation_date'])
+        df_pairs = pairs_formed_between(df_pairs, start_date, end_date).copy()
+        logger.info("Filtered pairs: %d within date range", len(df_pairs))
+    
+    # Log data overview (skipped entirely in quiet mode)
+    if not quiet and logger.isEnabledFor(logging.INFO):
+        logger.info("Data overview for %s period (%s to %s): dates %s to %s, %d trading days, "
+                    "%d stocks, %d calendar quarters, %d pairs",
+                    period_name, start_date, end_date,
+                    df_merged_filtered['date'].min(), df_merged_filtered['date'].max(),
+                    df_merged_filtered['date'].nunique(), df_merged_filtered['permno'].nunique(),
+                    df_merged_filtered['quarter'].nunique(), len(df_pairs))
+    return df_merged_filtered, df_pairs
+
 
 def run_backtest(df_main_path='final_backtest_data.csv', 
                df_pairs_path='corr_coin.csv',
-               period='train'):
+               period='train',
+               quiet=False,
+               param_grid=None,
+               periods=None,
+               output_dir='.',
+               sink=None,
+               checkpoint_dir=None):
     """Main function to run the backtest"""
-    print("Loading data...")
+    logger.info("Loading data...")
     
     try:
-        # Load the datasets with the correct filenames
-        try:
-            df_merged_filtered = pd.read_csv(df_main_path)
-            print(f"Successfully loaded {df_main_path}")
-        except Exception as e:
-            print(f"Error loading {df_main_path}: {str(e)}")
-            raise
-            
-        try:
-            df_pairs = pd.read_csv(df_pairs_path)
-            print(f"Successfully loaded {df_pairs_path}")
-            print(f"Columns in df_pairs: {list(df_pairs.columns)}")
-        except Exception as e:
-            print(f"Error loading {df_pairs_path}: {str(e)}")
-            raise
-
-        # Rename column names if needed
-        if 'permno_1' in df_pairs.columns and 'permno_2' in df_pairs.columns:
-            df_pairs.rename(columns={'permno_1': 'permno_black', 'permno_2': 'permno_white'}, inplace=True)
-        
-        # Convert date columns to datetime
-        df_merged_filtered['date'] = pd.to_datetime(df_merged_filtered['date'])
-        
-        # Filter data based on period
-        if period.lower() == 'train':
-            start_date = '2015-01-01'
-            end_date = '2021-12-31'
-            period_name = "in-sample"
-        elif period.lower() == 'test':
-            start_date = '2022-01-01'
-            end_date = '2024-12-31'
-            period_name = "out-of-sample"
-        else:
-            raise ValueError(f"Invalid period: {period}. Use 'train' or 'test'.")
-        
-        # Filter main dataframe by date
-        date_mask = (df_merged_filtered['date'] >= start_date) & (df_merged_filtered['date'] <= end_date)
-        df_merged_filtered = df_merged_filtered[date_mask].copy()
-
-        # Define quarters based on calendar date
-        df_merged_filtered['quarter'] = df_merged_filtered['date'].dt.to_period('Q').astype(str)
-        
-        # Filter pairs by date range if formation_date exists
-        if 'formation_date' in df_pairs.columns:
-            df_pairs['formation_date'] = pd.to_datetime(df_pairs['formation_date'])
-            date_mask = (df_pairs['formation_date'] >= start_date) & (df_pairs['formation_date'] <= end_date)
-            df_pairs = df_pairs[date_mask].copy()
-            print(f"Filtered pairs: {len(df_pairs)} within date range")
-        
-        # Print data overview
-        quarters = df_merged_filtered['quarter'].unique()
-        print(f"\n=== Data overview for {period_name} period ({start_date} to {end_date}) ===")
-        print(f"Date range: {df_merged_filtered['date'].min()} to {df_merged_filtered['date'].max()}")
-        print(f"Number of trading days: {df_merged_filtered['date'].nunique()}")
-        print(f"Number of stocks: {df_merged_filtered['permno'].nunique()}")
-        print(f"Number of calendar quarters: {len(quarters)}")
-        print(f"Number of pairs: {len(df_pairs)}")
+        df_merged_filtered, df_pairs = load_backtest_data(df_main_path, df_pairs_path, period, periods, quiet)
         
-        # Define hyperparameter grid
-        param_grid = {
-            'COINTEGRATION_THRESHOLD': [0.05],
-            'CORRELATION_THRESHOLD': [0.9], #0.5, 0.7, ],
-            'ZSCORE_METHOD': ['classical'], #'ou'],
-            'ZSCORE_THRESHOLD': [1],
-            'LOOKBACK_PERIOD': [10],
-            'HORIZON': [10],
-            'MAX_HOLDING_DAYS': [10],
-            'INITIAL_CAPITAL': 1_000_000_000
-        }
+        # Hyperparameter grid
+        param_grid = DEFAULT_PARAM_GRID if param_grid is None else param_grid
         
         # Output file path
         timestamp = time.strftime("%Y%m%d_%H%M%S")
-        output_file = f'backtest_results_{period}_{timestamp}.csv'
+        os.makedirs(output_dir, exist_ok=True)
+        output_file = os.path.join(output_dir, f'backtest_results_{period}_{timestamp}.csv')
         
         # Calculate number of combinations
         num_combinations = 1
@@ -91,35 +120,36 @@ def run_backtest(df_main_path='final_backtest_data.csv',
             if isinstance(values, list):
                 num_combinations *= len(values)
         
-        print(f"Starting grid search with {num_combinations} combinations...")
+        logger.info("Starting grid search with %d combinations...", num_combinations)
         
         # Run grid search
-        results = run_hyperparameter_grid_search(df_merged_filtered, df_pairs, param_grid, output_file)
+        results = run_hyperparameter_grid_search(df_merged_filtered, df_pairs, param_grid, output_file, quiet=quiet,
+                                                 sink=sink, checkpoint_dir=checkpoint_dir, output_dir=output_dir)
         
-        # Print summary of best results
+        # Log summary of best results
         if not results.empty:
-            print("\nTop 5 parameter combinations by Sharpe ratio:")
             top_sharpe = results.sort_values('sharpe_ratio', ascending=False).head(5)
-            print(top_sharpe[['ZSCORE_METHOD', 'ZSCORE_THRESHOLD', 'LOOKBACK_PERIOD', 'HORIZON', 'MAX_HOLDING_DAYS', 'sharpe_ratio', 'sortino_ratio', 'alpha']])
+            logger.info("Top 5 parameter combinations by Sharpe ratio:\n%s",
+                        top_sharpe[['ZSCORE_METHOD', 'ZSCORE_THRESHOLD', 'LOOKBACK_PERIOD', 'HORIZON',
+                                    'MAX_HOLDING_DAYS', 'sharpe_ratio', 'sortino_ratio', 'alpha']])
             
             # Save the best performing parameters for future use
             try:
                 best_params_idx = results['sharpe_ratio'].idxmax()
                 best_params = results.loc[best_params_idx].to_dict()
-                with open(f'best_params_{period}_{timestamp}.txt', 'w') as f:
+                best_params_file = os.path.join(output_dir, f'best_params_{period}_{timestamp}.txt')
+                with open(best_params_file, 'w') as f:
                     for k, v in best_params.items():
                         f.write(f"{k}: {v}\n")
                 
-                print(f"\nResults saved to {output_file}")
-                print(f"Best parameters saved to best_params_{period}_{timestamp}.txt")
+                logger.info("Results saved to %s; best parameters saved to %s", output_file, best_params_file)
             except Exception as e:
-                print(f"Error saving best parameters: {str(e)}")
+                logger.error("Error saving best parameters: %s", e)
         else:
-            print("No valid results were generated. Check the error logs.")
+            logger.warning("No valid results were generated. Check the error logs.")
         
         return results
         
     except Exception as e:
-        print(f"Error in main execution: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in main execution: %s", e)
         return None
\ No newline at end of file
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Pair legs as rows of an (n_trades, 2) incidence: column 0 is the black leg, column 1 the white leg
+BLACK, WHITE = 0, 1
+
+
+def leg_flows(short_black, shares_black, shares_white):
+    """Signed share flows (n, 2) of opening pair positions: + buys, - sells"""
+    sign = np.where(short_black, -1, 1)
+    return np.column_stack([sign * np.asarray(shares_black), -sign * np.asarray(shares_white)]).astype(np.float64)
+
+
+def net_orders(codes, flows, n_stocks):
+    """
+    Aggregate leg flows into one order per stock.
+
+    `codes` (n, 2) are the stock codes of the legs, so (codes, flows) is a
+    sparse pair x stock incidence matrix in coordinate form. Returns the
+    netted (signed) and gross share flow of every stock.
+    """
+    net = np.bincount(codes.ravel(), weights=flows.ravel(), minlength=n_stocks)
+    gross = np.bincount(codes.ravel(), weights=np.abs(flows).ravel(), minlength=n_stocks)
+    return net, gross
+
+
+def netted_costs(codes, flows, net, gross, cost_per_share):
+    """
+    Transaction cost of every pair (sum of its legs) once orders are netted.
+
+    Each stock's netted order costs cost_per_share per share and is shared
+    among the legs that trade the stock in proportion to their gross flow.
+    """
+    stock_gross = gross[codes]
+    ratio = np.divide(np.abs(net[codes]), stock_gross, out=np.zeros_like(stock_gross), where=stock_gross > 0)
+    return (cost_per_share * np.abs(flows) * ratio).sum(axis=1)
+
+
+def fit_to_budget(codes, flows, exposure, budget, max_iterations=10):
+    """
+    Scale entering pairs so no stock's aggregate position exceeds its liquidity budget.
+
+    `exposure` is the signed net position of every stock across open pairs
+    and `budget` its limit (e.g. 10% of ADV20; inf where none applies).
+    Entering flows that push a stock's position beyond max(budget, current
+    exposure) are scaled down in proportion. A pair's legs keep their ratio,
+    so it takes the smallest factor of its legs. Scaling one leg also
+    scales the other, so the fit is repeated until no stock is over its
+    budget. Pairs still over after max_iterations rounds are dropped.
+
+    Returns the scale factor (0..1) of every entering pair.
+    """
+    n_stocks = len(exposure)
+    factors = np.ones(len(flows))
+    limit = np.maximum(budget, np.abs(exposure))
+    for iteration in range(max_iterations + 1):
+        scaled = flows * factors[:, None]
+        target = exposure + np.bincount(codes.ravel(), weights=scaled.ravel(), minlength=n_stocks)
+        over = np.abs(target) > limit
+        if not over.any():
+            return factors
+        # Legs pushing an over-budget stock further in the direction of its excess
+        pushing = over[codes] & (scaled * np.sign(target)[codes] > 0)
+        if iteration == max_iterations:
+            factors[pushing.any(axis=1)] = 0.0
+            return factors
+        pushing_gross = np.bincount(codes[pushing], weights=np.abs(scaled[pushing]), minlength=n_stocks)
+        excess = np.abs(target) - limit
+        stock_factor = np.clip(1 - np.divide(excess, pushing_gross, out=np.ones(n_stocks), where=pushing_gross > 0),
+                               0.0, 1.0)
+        factors *= np.where(pushing, stock_factor[codes], 1.0).min(axis=1)
@@ -0,0 +1,196 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Screening statistic columns, in order of preference (same as filter_pairs)
+CORRELATION_COLUMNS = ('corr', 'correlation')
+COINTEGRATION_COLUMNS = ('coint_pval', 'pval', 'p_value')
+
+
+def pairs_formed_between(df_pairs, start_date, end_date):
+    """Pairs whose formation_date falls within [start_date, end_date]; all pairs if there is no formation_date"""
+    if 'formation_date' not in df_pairs.columns:
+        return df_pairs
+    formation = pd.to_datetime(df_pairs['formation_date'])
+    return df_pairs[(formation >= pd.Timestamp(start_date)) & (formation <= pd.Timestamp(end_date))]
+
+
+def _offsets(counts):
+    """CSR offsets from per-bucket counts"""
+    return np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+
+class PairUniverse:
+    """
+    Integer-encoded index over a filtered pair table.
+
+    Built once from the filtered pairs and shared by SignalGenerator,
+    PortfolioManager and the grid search so that group and leg lookups are
+    array slices rather than DataFrame scans:
+
+    - pairs are stored grouped by group_id (groups and pairs keep their
+      original order), with CSR offsets group -> pair ids
+    - permnos are encoded as int32 codes into the sorted `permnos` array
+    - permno -> pair ids adjacency (either leg), CSR-style
+    - group -> member permnos (the distinct legs of the group's pairs)
+    """
+
+    def __init__(self, df_pairs):
+        group_codes, group_ids = pd.factorize(df_pairs['group_id'])
+        order = np.argsort(group_codes, kind='stable')
+        self.pairs = df_pairs.iloc[order].reset_index(drop=True)
+        # Row labels of each pair in the input frame, to map pairs between universes
+        self.source_index = df_pairs.index.to_numpy()[order]
+        self.group_ids = np.asarray(group_ids)
+        self._group_pos = {group_id: i for i, group_id in enumerate(self.group_ids)}
+
+        n_pairs = len(self.pairs)
+        n_groups = len(self.group_ids)
+        group_counts = np.bincount(group_codes, minlength=n_groups)
+        self.group_offsets = _offsets(group_counts)
+        self.pair_group_codes = np.repeat(np.arange(n_groups, dtype=np.int32), group_counts)
+
+        # Integer-encode both legs
+        black = self.pairs['permno_black'].to_numpy()
+        white = self.pairs['permno_white'].to_numpy()
+        self.permnos = np.unique(np.concatenate([black, white]))
+        self.black_codes = np.searchsorted(self.permnos, black).astype(np.int32)
+        self.white_codes = np.searchsorted(self.permnos, white).astype(np.int32)
+        n_permnos = len(self.permnos)
+
+        # permno -> pairs adjacency
+        leg_codes = np.concatenate([self.black_codes, self.white_codes])
+        leg_pairs = np.tile(np.arange(n_pairs, dtype=np.int32), 2)
+        leg_order = np.argsort(leg_codes, kind='stable')
+        self.permno_pair_ids = leg_pairs[leg_order]
+        self.permno_offsets = _offsets(np.bincount(leg_codes, minlength=n_permnos))
+
+        # group -> distinct member permnos
+        leg_groups = np.tile(self.pair_group_codes, 2).astype(np.int64)
+        member_keys = np.unique(leg_groups * max(n_permnos, 1) + leg_codes)
+        member_groups = member_keys // max(n_permnos, 1)
+        self.member_codes = (member_keys % max(n_permnos, 1)).astype(np.int32)
+        self.member_offsets = _offsets(np.bincount(member_groups, minlength=n_groups))
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def pair_ids_for_labels(self, labels):
+        """Map input-frame row labels to pair ids; labels not in the universe get -1"""
+        return pd.Index(self.source_index).get_indexer(labels)
+
+    @property
+    def n_groups(self):
+        return len(self.group_ids)
+
+    def group_slice(self, group_id):
+        """Slice of pair ids belonging to a group (empty if unknown)"""
+        pos = self._group_pos.get(group_id)
+        if pos is None:
+            return slice(0, 0)
+        return slice(self.group_offsets[pos], self.group_offsets[pos + 1])
+
+    def group_pairs(self, group_id):
+        """Pairs of a group as a DataFrame slice"""
+        return self.pairs.iloc[self.group_slice(group_id)]
+
+    def group_members(self, group_id):
+        """Distinct permnos traded in a group's pairs"""
+        pos = self._group_pos.get(group_id)
+        if pos is None:
+            return self.permnos[:0]
+        return self.permnos[self.member_codes[self.member_offsets[pos]:self.member_offsets[pos + 1]]]
+
+    def encode(self, permnos):
+        """Map permnos to int32 codes; permnos outside the universe get -1"""
+        permnos = np.asarray(permnos)
+        if len(self.permnos) == 0:
+            return np.full(permnos.shape, -1, dtype=np.int32)
+        codes = np.searchsorted(self.permnos, permnos)
+        codes = np.minimum(codes, len(self.permnos) - 1)
+        return np.where(self.permnos[codes] == permnos, codes, -1).astype(np.int32)
+
+    def contains(self, permnos):
+        """Boolean mask of permnos that appear as a leg of some pair"""
+        return self.encode(permnos) >= 0
+
+    def pairs_for_permno(self, permno):
+        """Ids of all pairs in which a permno is either leg"""
+        code = self.encode([permno])[0]
+        if code < 0:
+            return self.permno_pair_ids[:0]
+        return self.permno_pair_ids[self.permno_offsets[code]:self.permno_offsets[code + 1]]
+
+
+class PairScreen:
+    """
+    Pair table pre-sorted on correlation for fast threshold sweeps.
+
+    A correlation threshold selects a prefix of the descending correlation
+    order and the cointegration threshold is a mask over that prefix, so any
+    (CORRELATION_THRESHOLD, COINTEGRATION_THRESHOLD) selection costs one
+    binary search and one comparison. Selections return the same rows, in
+    the same order, as filter_pairs, and their PairUniverses are cached.
+    """
+
+    def __init__(self, df_pairs):
+        self.df_pairs = df_pairs
+        n_pairs = len(df_pairs)
+        self.corr_col = next((col for col in CORRELATION_COLUMNS if col in df_pairs.columns), None)
+        self.coint_col = next((col for col in COINTEGRATION_COLUMNS if col in df_pairs.columns), None)
+
+        # Descending correlation order (NaN last); without a correlation column keep the input order
+        if self.corr_col is not None:
+            corr = df_pairs[self.corr_col].to_numpy(dtype=np.float64)
+            self.order = np.argsort(-corr, kind='stable')
+            self._neg_sorted_corr = -corr[self.order]
+        else:
+            self.order = np.arange(n_pairs)
+            self._neg_sorted_corr = None
+        if self.coint_col is not None:
+            self._sorted_pval = df_pairs[self.coint_col].to_numpy(dtype=np.float64)[self.order]
+        else:
+            self._sorted_pval = None
+        self._universes = {}
+
+    def mask(self, corr_threshold, coint_threshold):
+        """Boolean mask over the input rows passing both thresholds (None disables a filter)"""
+        selected = self.order
+        if corr_threshold is not None:
+            if self._neg_sorted_corr is None:
+                logger.warning("No correlation column found in pairs data, skipping correlation filter")
+            else:
+                # corr >= threshold  <=>  -corr <= -threshold, a prefix of the ascending -corr
+                n_selected = np.searchsorted(self._neg_sorted_corr, -corr_threshold, side='right')
+                selected = selected[:n_selected]
+        if coint_threshold is not None:
+            if self._sorted_pval is None:
+                logger.warning("No cointegration p-value column found in pairs data, skipping cointegration filter")
+            else:
+                selected = selected[self._sorted_pval[:len(selected)] <= coint_threshold]
+
+        mask = np.zeros(len(self.df_pairs), dtype=bool)
+        mask[selected] = True
+        return mask
+
+    def select(self, corr_threshold, coint_threshold):
+        """Pairs passing both thresholds, in input order"""
+        return self.df_pairs[self.mask(corr_threshold, coint_threshold)]
+
+    def universe(self, corr_threshold, coint_threshold):
+        """Cached PairUniverse over the pairs passing both thresholds"""
+        key = (corr_threshold, coint_threshold)
+        if key not in self._universes:
+            self._universes[key] = PairUniverse(self.select(corr_threshold, coint_threshold))
+        return self._universes[key]
+
+    @staticmethod
+    def loosest(thresholds):
+        """Loosest (correlation, cointegration) filter covering all given thresholds"""
+        corr_values = [corr for corr, _ in thresholds]
+        coint_values = [coint for _, coint in thresholds]
+        corr = None if any(value is None for value in corr_values) else min(corr_values)
+        coint = None if any(value is None for value in coint_values) else max(coint_values)
+        return corr, coint
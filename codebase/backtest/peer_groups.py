@@ -0,0 +1,201 @@
+import logging
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from .checkpoint import _atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Features whose missing values are extrapolated from the previous quarter
+EXTRAPOLATED_FEATURES = ['operating_margin', 'gross_margin', 'revenue_growth']
+
+# Fundamentals the peer groups are clustered on
+CLUSTER_FEATURES = ['beme', 'roa', 'operating_margin', 'gross_margin', 'revenue_growth',
+                    'capex_intensity', 'roa_stability', 'revenue_growth_stability']
+
+# Clusters per quarter: one per GICS sector
+DEFAULT_CLUSTERS = 11
+
+CLUSTER_METHODS = ('kmeans', 'minibatch')
+
+_QUARTER_END = {'Q1': '-03-31', 'Q2': '-06-30', 'Q3': '-09-30', 'Q4': '-12-31'}
+
+
+def extrapolate_missing(df, features=EXTRAPOLATED_FEATURES):
+    """
+    Fill missing features with the previous quarter's value x (1 + the average change of the quarter).
+
+    The average change of a report date (jdate) is the relative change of
+    the cross-sectional mean from the previous quarters' values to the
+    current ones. Same result as the row-wise extrapolation of the
+    knn_clustering notebook, as column arithmetic.
+    """
+    df = df.sort_values(['permno', 'jdate'])
+    previous = df.groupby('permno')[features].shift(1)
+    # Series.mean per report date (a few hundred), so the means match the notebook's bit for bit
+    current_mean = df[features].groupby(df['jdate']).agg(lambda column: column.mean())
+    previous_mean = previous.groupby(df['jdate']).agg(lambda column: column.mean())
+    delta = ((current_mean - previous_mean) / previous_mean.where(previous_mean != 0)).reindex(df['jdate'])
+    df[features] = df[features].fillna(previous * (1 + delta.to_numpy()))
+    return df
+
+
+def cluster_quarter(features, k=DEFAULT_CLUSTERS, method='kmeans', random_state=0):
+    """
+    Cluster one quarter's stocks on their (standardized) features.
+
+    Returns (labels, centroids). Quarters with fewer than k stocks put every
+    stock in its own cluster.
+    """
+    if len(features) < k:
+        return np.arange(len(features)), features.copy()
+    if method == 'minibatch':
+        model = MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init='auto')
+    else:
+        model = KMeans(n_clusters=k, random_state=random_state, n_init='auto')
+    labels = model.fit_predict(features)
+    return labels, model.cluster_centers_
+
+
+def _cluster_task(task):
+    features, k, method, random_state = task
+    return cluster_quarter(features, k, method, random_state)
+
+
+class PeerGroupBuilder:
+    """
+    Quarterly peer groups of stocks, clustered on their fundamentals.
+
+    Every quarter (year, quarter of the report) is standardized and
+    clustered on its own, so quarters run in parallel across a process pool
+    and a quarter's groups never change once built. `update` takes new
+    fundamentals: missing features are extrapolated (see
+    extrapolate_missing, using the stored history for the previous quarter),
+    new quarters are clustered, and late reports in quarters already built
+    join the nearest centroid of that quarter (KD-tree query) without
+    re-clustering it.
+
+    The groups carry the `group_id` ('2020-Q2-07') and `trading_start`
+    (first day of the quarter after the report quarter) columns the
+    backtest data is keyed on.
+
+    Parameters:
+    -----------
+    k_clusters : int
+        Clusters per quarter
+    method : str
+        'kmeans' or 'minibatch' (MiniBatchKMeans, for large quarters)
+    features : list of str
+        Columns to cluster on (rows missing any are dropped)
+    n_jobs : int or None
+        Worker processes for clustering (default: number of CPUs; 1 runs in process)
+    """
+
+    def __init__(self, k_clusters=DEFAULT_CLUSTERS, method='kmeans', features=CLUSTER_FEATURES, n_jobs=None,
+                 random_state=0):
+        if method not in CLUSTER_METHODS:
+            raise ValueError(f"Unknown clustering method: {method}. Use one of {CLUSTER_METHODS}.")
+        self.k_clusters = k_clusters
+        self.method = method
+        self.features = list(features)
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.random_state = random_state
+        # Fundamentals as received (before extrapolation), for the previous-quarter values of later updates
+        self.history = pd.DataFrame()
+        self.groups = pd.DataFrame()
+        # year_quarter -> [feature means, feature stds, centroids]
+        self.models = {}
+
+    def update(self, df):
+        """Add fundamentals and return the peer-group rows they produced"""
+        df = df.copy()
+        df['jdate'] = pd.to_datetime(df['jdate'])
+        if not self.history.empty:
+            known = pd.MultiIndex.from_frame(self.history[['permno', 'jdate']])
+            df = df[~pd.MultiIndex.from_frame(df[['permno', 'jdate']]).isin(known)]
+        if df.empty:
+            return df
+
+        # Extrapolate with the previous quarters in view, then keep only the new rows
+        new_keys = pd.MultiIndex.from_frame(df[['permno', 'jdate']])
+        self.history = pd.concat([self.history, df], ignore_index=True)
+        prepared = extrapolate_missing(self.history)
+        prepared = prepared[pd.MultiIndex.from_frame(prepared[['permno', 'jdate']]).isin(new_keys)]
+
+        prepared = prepared.replace([np.inf, -np.inf], np.nan)
+        prepared = prepared.dropna(subset=list(dict.fromkeys(EXTRAPOLATED_FEATURES + self.features)))
+        prepared['year_quarter'] = prepared['year'].astype(str) + '-' + prepared['quarter'].astype(str)
+
+        built = prepared['year_quarter'].isin(self.models)
+        new_groups = pd.concat([self._cluster(prepared[~built]), self._assign(prepared[built])])
+        new_groups = self._label(new_groups)
+        self.groups = pd.concat([self.groups, new_groups], ignore_index=True)
+        logger.info("Peer groups: %d rows in %d new quarters, %d late rows assigned to built quarters",
+                    int((~built).sum()), prepared.loc[~built, 'year_quarter'].nunique(), int(built.sum()))
+        return new_groups
+
+    def _cluster(self, df):
+        """Standardize and cluster every quarter of df in the process pool"""
+        if df.empty:
+            return df.assign(cluster=pd.Series(dtype=np.int64))
+        quarters = [(year_quarter, rows) for year_quarter, rows in df.groupby('year_quarter', sort=True)]
+        tasks = []
+        for year_quarter, rows in quarters:
+            values = rows[self.features].to_numpy(dtype=np.float64)
+            mean, std = values.mean(axis=0), values.std(axis=0)
+            std[std == 0] = 1.0
+            self.models[year_quarter] = [mean, std, None]
+            tasks.append(((values - mean) / std, self.k_clusters, self.method, self.random_state))
+
+        if self.n_jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.n_jobs, len(tasks))) as executor:
+                results = list(executor.map(_cluster_task, tasks))
+        else:
+            results = [_cluster_task(task) for task in tasks]
+
+        clustered = []
+        for (year_quarter, rows), (labels, centroids) in zip(quarters, results):
+            self.models[year_quarter][2] = centroids
+            clustered.append(rows.assign(cluster=labels))
+        return pd.concat(clustered)
+
+    def _assign(self, df):
+        """Put late rows of built quarters into the cluster with the nearest centroid"""
+        if df.empty:
+            return df.assign(cluster=pd.Series(dtype=np.int64))
+        assigned = []
+        for year_quarter, rows in df.groupby('year_quarter', sort=True):
+            mean, std, centroids = self.models[year_quarter]
+            values = (rows[self.features].to_numpy(dtype=np.float64) - mean) / std
+            _, labels = cKDTree(centroids).query(values)
+            assigned.append(rows.assign(cluster=labels))
+        return pd.concat(assigned)
+
+    def _label(self, df):
+        """Add group_id, quarter_end and trading_start"""
+        df = df.copy()
+        df['group_id'] = (df['year'].astype(str) + '-' + df['quarter'].astype(str) + '-'
+                          + df['cluster'].astype(str).str.zfill(2))
+        df['quarter_end'] = pd.to_datetime(df['year'].astype(str) + df['quarter'].map(_QUARTER_END))
+        df['trading_start'] = df['quarter_end'] + pd.offsets.QuarterBegin(startingMonth=1)
+        return df
+
+    def save(self, path):
+        """Persist the builder (history, groups and quarter models) for later updates"""
+        _atomic_write(path, pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def build_peer_groups(df, k_clusters=DEFAULT_CLUSTERS, method='kmeans', n_jobs=None):
+    """Peer groups of a fundamentals panel (e.g. stocks_portfolio_overall.csv) in one call"""
+    return PeerGroupBuilder(k_clusters, method, n_jobs=n_jobs).update(df).reset_index(drop=True)
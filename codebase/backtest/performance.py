@@ -1,7 +1,8 @@
 import numpy as np
 import pandas as pd
 
-def calculate_trade_based_metrics(trade_df, market_returns, ffr_lookup=None, initial_capital=1_000_000_000):
+def calculate_trade_based_metrics(trade_df, market_returns, ffr_lookup=None, initial_capital=1_000_000_000,
+                                  equity_curve=None):
     """
     Calculate performance metrics based solely on trade log data and returns daily returns data
     for graphing in reports.
@@ -17,6 +18,10 @@ def calculate_trade_based_metrics(trade_df, market_returns, ffr_lookup=None, ini
         Federal Funds Rate lookup by date. If None, will use 0.02 as default.
     initial_capital : float
         Initial capital for calculating returns
+    equity_curve : pandas Series or None
+        Dense daily equity (including unrealized PnL) indexed by date. When
+        given, returns, Sharpe, Sortino, CAPM and drawdown use it instead of
+        an equity curve rebuilt from trade exit dates.
         
     Returns:
     --------
@@ -59,19 +64,12 @@ def calculate_trade_based_metrics(trade_df, market_returns, ffr_lookup=None, ini
                              trade_df['exit_date'].dropna().tolist()))
     num_trading_days = len(trading_days)
     
-    # Calculate equity curve for performance metrics
-    equity_curve = {}
-    current_equity = initial_capital
-    
-    # Group trades by exit date and calculate daily PnL
-    for date, group in trade_df.groupby('exit_date'):
-        day_pnl = group['net_pnl'].sum()
-        current_equity += day_pnl
-        equity_curve[date] = current_equity
-    
-    # Convert to Series for easier manipulation
-    equity_series = pd.Series(equity_curve)
-    equity_series = equity_series.sort_index()
+    if equity_curve is not None:
+        # Dense mark-to-market equity, one value per trading day
+        equity_series = pd.Series(equity_curve).dropna().sort_index()
+    else:
+        # Rebuild equity from realized PnL on exit dates
+        equity_series = (initial_capital + trade_df.groupby('exit_date')['net_pnl'].sum().cumsum()).sort_index()
     
     # Handle case with insufficient data points
     if len(equity_series) <= 1:
@@ -91,7 +89,10 @@ def calculate_trade_based_metrics(trade_df, market_returns, ffr_lookup=None, ini
         }
     
     # Calculate daily returns
-    daily_returns = equity_series.pct_change().fillna(0)
+    if equity_curve is not None:
+        daily_returns = equity_series / equity_series.shift(1).fillna(initial_capital) - 1
+    else:
+        daily_returns = equity_series.pct_change().fillna(0)
     
     # Create a DataFrame of dates and returns for graphing
     returns_df = pd.DataFrame({
@@ -1,35 +1,112 @@
+import logging
 import numpy as np
 import pandas as pd
-from scipy import sparse
 from .trade import Trade
+from .allocation import ADV_PARTICIPATION, ALLOCATION_MODES, allocate_entries, entry_costs, fund_in_order
+from .netting import fit_to_budget, leg_flows, net_orders, netted_costs
+
+# Columns of PortfolioManager.get_allocation_log (plus capital_utilization)
+ALLOCATION_LOG_COLUMNS = ['date', 'num_signals', 'num_entries', 'missing_volatility', 'missing_price',
+                          'zero_shares', 'insufficient_capital', 'num_liquidity_bound', 'capital_available',
+                          'capital_allocated', 'capital_used']
+
+# Columns of PortfolioManager.get_order_log (with netting)
+ORDER_LOG_COLUMNS = ['date', 'leg_orders', 'netted_orders', 'gross_shares', 'net_shares', 'gross_cost',
+                     'netted_cost']
+
+logger = logging.getLogger(__name__)
 
 class PortfolioManager:
-    def __init__(self, df_main, initial_capital, max_holding_days=5):
+    def __init__(self, df_main, initial_capital, max_holding_days=5, trading_dates=None, pair_universe=None,
+                 shared_lookups=None, allocation='inverse_vol', netting=False):
         self.df_main = df_main
+        # Optional shared PairUniverse: lookups are then only built for stocks that are a pair leg
+        self.pair_universe = pair_universe
         self.initial_capital = initial_capital
         self.available_capital = initial_capital
         self.max_holding_days = max_holding_days
+        self.cost_per_share = Trade.DEFAULT_COST_PER_SHARE
+        # Capital allocation across a day's entries (see allocation.ALLOCATION_MODES)
+        if allocation not in ALLOCATION_MODES:
+            raise ValueError(f"Unknown allocation mode: {allocation}. Use one of {ALLOCATION_MODES}.")
+        self.allocation = allocation
+        self.allocation_log = []
+        # Net orders across pairs into one order per stock and day, against one ADV budget per stock
+        self.netting = netting
+        self.order_log = []
         self.active_trades = []
         self.trade_history = []
         self.daily_pnl = {}
-        self.equity_curve = {pd.Timestamp.min: initial_capital}  # Initialize with starting capital
         
-        # Create lookups for efficient access
-        self._create_lookups()
+        # Dense daily equity, aligned to the trading calendar and filled in O(1) per day
+        if trading_dates is None:
+            trading_dates = np.sort(self.df_main['date'].unique())
+        self.trading_dates = pd.DatetimeIndex(trading_dates)
+        self._date_index = {date: i for i, date in enumerate(self.trading_dates)}
+        self.equity_values = np.full(len(self.trading_dates), np.nan)
+        self.realized_pnl_values = np.full(len(self.trading_dates), np.nan)
+        self.unrealized_pnl_values = np.full(len(self.trading_dates), np.nan)
+        self.realized_pnl = 0.0
+        
+        # Create lookups for efficient access, or reuse those of a manager over the same data
+        if shared_lookups is not None:
+            self._share_lookups(shared_lookups)
+        else:
+            self._create_lookups()
+        # Signed net position of every stock (codes into _asof_permnos) across open pairs, with netting
+        self._exposure = np.zeros(len(self._asof_permnos))
         
     def _create_lookups(self):
         """Create efficient lookups for prices and volumes"""
-        # Create lookups directly from df_main
-        lookup_data = self.df_main.set_index(['date', 'permno'])
-        self.price_lookup = lookup_data['adj_prc'].to_dict()
-        self.vol_lookup = lookup_data['adv20'].to_dict()
-        self.volatility_lookup = lookup_data['garch_vol'].to_dict()
+        # Create lookups directly from df_main, restricted to tradable legs when the universe is known
+        lookup_source = self.df_main
+        if self.pair_universe is not None:
+            lookup_source = lookup_source[self.pair_universe.contains(lookup_source['permno'].to_numpy())]
+        self._lookup_data = lookup_source.set_index(['date', 'permno'])
+        self.price_lookup = self._lookup_data['adj_prc'].to_dict()
+        self.vol_lookup = self._lookup_data['adv20'].to_dict()
+        self.volatility_lookup = self._lookup_data['garch_vol'].to_dict()
+        # (date, permno) -> z-score lookups, built on first use per z-score column
+        self._z_lookups = {}
+        
+        # As-of price index: per-permno date-sorted prices (CSR layout) for last-price queries
+        permnos = self._lookup_data.index.get_level_values('permno').to_numpy()
+        dates = self._lookup_data.index.get_level_values('date').to_numpy()
+        order = np.lexsort((dates, permnos))
+        self._asof_permnos, starts = np.unique(permnos[order], return_index=True)
+        self._asof_offsets = np.append(starts, len(order))
+        self._asof_dates = dates[order]
+        self._asof_prices = self._lookup_data['adj_prc'].to_numpy()[order]
+        # Same layout keyed by (permno code, date code) for vectorized price/ADV/volatility lookups
+        self._market_dates = np.unique(dates)
+        permno_codes = np.repeat(np.arange(len(self._asof_permnos), dtype=np.int64), np.diff(self._asof_offsets))
+        self._market_keys = permno_codes * len(self._market_dates) + np.searchsorted(self._market_dates,
+                                                                                     self._asof_dates)
+        self._market_values = self._lookup_data[['adj_prc', 'adv20', 'garch_vol']].to_numpy(dtype=np.float64)[order].T
         
         # Single date-indexed dataframe for other lookups
         date_indexed = self.df_main.drop_duplicates('date').set_index('date')
         self.ffr_lookup = date_indexed['fed_funds_rate'].to_dict()
         self.market_return_lookup = date_indexed['vwretd'].to_dict()
     
+    def _share_lookups(self, other):
+        """Reuse the read-only market data lookups of another manager built on the same data"""
+        self._lookup_data = other._lookup_data
+        self.price_lookup = other.price_lookup
+        self.vol_lookup = other.vol_lookup
+        self.volatility_lookup = other.volatility_lookup
+        # Shared dict, so lazily built z-score lookups are built once for all managers
+        self._z_lookups = other._z_lookups
+        self._asof_permnos = other._asof_permnos
+        self._asof_offsets = other._asof_offsets
+        self._asof_dates = other._asof_dates
+        self._asof_prices = other._asof_prices
+        self._market_dates = other._market_dates
+        self._market_keys = other._market_keys
+        self._market_values = other._market_values
+        self.ffr_lookup = other.ffr_lookup
+        self.market_return_lookup = other.market_return_lookup
+    
     def _calculate_max_shares(self, permno, current_date, price, allocated_money=None):      
         """Calculate maximum number of shares based on liquidity and capital"""
         # Default allocated money if not provided
@@ -68,42 +145,70 @@ class PortfolioManager:
         self.available_capital = amount
         
     def process_trading_day(self, current_date, signals, current_data):
-        """Process a single trading day"""
-        trade_updates = []
-        
+        """Process a single trading day
+
+        On the last of the trading dates, positions still open after the
+        exits are liquidated (exit reason 'end_of_period') together with the
+        exits, and no new positions are opened: they would be closed at the
+        prices they were opened at, paying costs for nothing.
+        """
         # First update financing costs for all active trades
         fed_funds_rate = self.ffr_lookup.get(current_date, 0.02)  # Default to 2% if missing
+        unrealized_pnl = 0.0
         for trade in self.active_trades:
             trade.update_daily_financing(current_date, fed_funds_rate)
             
-            # Optional: Update market value for active trades (for internal tracking only)
+            # Update market value for active trades (feeds the mark-to-market equity curve)
             price_black = self.price_lookup.get((current_date, trade.permno_black))
             price_white = self.price_lookup.get((current_date, trade.permno_white))
             
             if price_black is not None and price_white is not None:
                 trade.update_market_value(current_date, price_black, price_white)
+            unrealized_pnl += trade.mark_to_market_pnl
         
         # Then check for exits (z-score reversal or max holding period)
         closed_trades = self._process_exits(current_date, current_data)
         
+        # The last trading date liquidates everything left, in the same orders as the day's exits
+        final_date = len(self.trading_dates) > 0 and current_date == self.trading_dates[-1]
+        if final_date:
+            closed_trades += self._liquidate(current_date)
+        
         # Update available capital from closed trades
         for trade in closed_trades:
             # Return the invested capital plus profit/loss
             self.available_capital += (trade.investment_black + trade.investment_white + trade.net_pnl)
+            # Closed trades move from unrealized to realized PnL
+            unrealized_pnl -= trade.mark_to_market_pnl
             # Add to trade history (only for closed trades)
             self.trade_history.append(trade)
-            # Add to trade updates (for logging) - only adding CLOSED trades
-            trade_updates.append(trade.to_dict())
         
-        # Calculate daily PnL from closed trades only
-        day_pnl = sum([trade.net_pnl for trade in closed_trades])
+        # Entries are fitted to the stock budgets left after the day's exits
+        if self.netting:
+            self._unwind(closed_trades)
         
         # Then process new entries if we have signals and available capital
-        new_trades = self._process_entries(current_date, signals, current_data)
+        new_trades = [] if final_date else self._process_entries(current_date, signals, current_data)
+        
+        # The day's exits and entries trade as one netted order per stock
+        if self.netting:
+            self._net_orders(current_date, closed_trades, new_trades)
         
-        # Update equity curve for accounting purposes
-        prev_equity = max(self.equity_curve.values())
-        self.equity_curve[current_date] = prev_equity + day_pnl
+        for trade in new_trades:
+            unrealized_pnl += trade.mark_to_market_pnl
+        if final_date:
+            # Nothing is left open (avoids float residue from subtracting the liquidated marks)
+            unrealized_pnl = 0.0
+        
+        # Add to trade updates (for logging) - only adding CLOSED trades
+        trade_updates = [trade.to_dict() for trade in closed_trades]
+        
+        # Calculate daily PnL from closed trades only
+        day_pnl = sum([trade.net_pnl for trade in closed_trades])
+        self.realized_pnl += day_pnl
+        
+        # Record today's equity: realized PnL plus mark-to-market of open positions
+        self._record_equity(current_date, unrealized_pnl)
         
         # Save daily PnL
         self.daily_pnl[current_date] = day_pnl
@@ -111,6 +216,38 @@ class PortfolioManager:
         # Return only the updates for CLOSED trades
         return trade_updates
     
+    def _record_equity(self, current_date, unrealized_pnl):
+        """Store equity for a trading day in the calendar-aligned arrays"""
+        idx = self._date_index.get(current_date)
+        if idx is None:
+            return
+        self.realized_pnl_values[idx] = self.realized_pnl
+        self.unrealized_pnl_values[idx] = unrealized_pnl
+        self.equity_values[idx] = self.initial_capital + self.realized_pnl + unrealized_pnl
+    
+    @property
+    def equity_curve(self):
+        """Dense daily equity (realized plus unrealized PnL) indexed by trading date"""
+        return pd.Series(self.equity_values, index=self.trading_dates, name='equity')
+    
+    def get_equity_curve(self):
+        """Return the daily equity curve with its realized and unrealized components"""
+        return pd.DataFrame({
+            'date': self.trading_dates,
+            'equity': self.equity_values,
+            'realized_pnl': self.realized_pnl_values,
+            'unrealized_pnl': self.unrealized_pnl_values
+        })
+    
+    def _z_lookup(self, z_col):
+        """Return the (date, permno) -> z-score lookup for a column, or None if it is missing"""
+        if z_col not in self._z_lookups:
+            if z_col in self._lookup_data.columns:
+                self._z_lookups[z_col] = self._lookup_data[z_col].to_dict()
+            else:
+                self._z_lookups[z_col] = None
+        return self._z_lookups[z_col]
+    
     def _check_exit_conditions(self, trade, current_date, current_z_diff):
         """Check if a trade should be exited based on the specified conditions"""
         # Condition 1: Z-score mean reversion toward zero
@@ -137,18 +274,15 @@ class PortfolioManager:
             
             # Get z-scores efficiently
             z_col = f"z_{trade.zscore_method}_{trade.horizon}d_lb{trade.lookback}"
+            z_lookup = self._z_lookup(z_col)
             
             # Check if data exists for both stocks
-            black_data = current_data[current_data['permno'] == permno_black]
-            white_data = current_data[current_data['permno'] == permno_white]
+            z_black = z_lookup.get((current_date, permno_black)) if z_lookup is not None else None
+            z_white = z_lookup.get((current_date, permno_white)) if z_lookup is not None else None
             
-            if black_data.empty or white_data.empty or z_col not in black_data.columns or z_col not in white_data.columns:
+            if z_black is None or z_white is None:
                 remaining_trades.append(trade)
                 continue
-                
-            # Get current z-scores
-            z_black = black_data[z_col].values[0]
-            z_white = white_data[z_col].values[0]
             
             # Calculate current z-diff
             current_z_diff = z_black - z_white
@@ -183,126 +317,72 @@ class PortfolioManager:
         """Process new trade entries with liquidity constraints"""
         if not signals or self.available_capital <= 0:
             return []
-            
-        # Calculate volatility for each pair in signals for position sizing
-        pairs_volatility = {}
-        total_inv_vol = 0
-        
-        # Track rejection reasons
-        missing_volatility = 0
         
-        for sig in signals:
-            permno_black = sig['permno_black']
-            permno_white = sig['permno_white']
-            
-            # Get GARCH volatilities from lookup table
-            vol_black = self.volatility_lookup.get((current_date, permno_black))
-            vol_white = self.volatility_lookup.get((current_date, permno_white))
-            
-            if vol_black is None or vol_white is None or vol_black == 0 or vol_white == 0:
-                missing_volatility += 1
-                continue
-                
-            # Use combined volatility for the pair
-            pair_vol = (vol_black + vol_white) / 2
-            pair_key = (permno_black, permno_white)
-            pairs_volatility[pair_key] = pair_vol
-            
-            # Calculate inverse volatility
-            inv_vol = 1 / pair_vol
-            total_inv_vol += inv_vol
+        # Market data of both legs of every signal, gathered as arrays
+        permnos_black = np.fromiter((sig['permno_black'] for sig in signals), dtype=np.int64, count=len(signals))
+        permnos_white = np.fromiter((sig['permno_white'] for sig in signals), dtype=np.int64, count=len(signals))
+        px_b, adv_b, vol_b = self._market_arrays(current_date, permnos_black)
+        px_w, adv_w, vol_w = self._market_arrays(current_date, permnos_white)
         
-        if total_inv_vol == 0:
+        # Inverse-volatility weights, share counts, ADV caps and costs for all signals at once;
+        # with netting, per-stock budgets replace the per-leg ADV cap
+        leg_adv_b, leg_adv_w = (np.full(len(signals), np.nan),) * 2 if self.netting else (adv_b, adv_w)
+        leg_caps = None
+        if self.netting and self.allocation == 'water_fill':
+            # Water-filling fills legs up to their stock's remaining budget instead of the per-leg ADV cap
+            direction = np.array([-1 if sig['signal'] == 'short_black_long_white' else 1 for sig in signals])
+            leg_caps = self._budget_headroom(np.concatenate([permnos_black, permnos_white]),
+                                             np.concatenate([adv_b, adv_w]), np.concatenate([direction, -direction]))
+            leg_caps = np.split(leg_caps, 2)
+        sizing = allocate_entries(px_b, px_w, vol_b, vol_w, leg_adv_b, leg_adv_w, self.available_capital,
+                                  self.cost_per_share, mode=self.allocation, leg_caps=leg_caps)
+        if sizing is None:
             return []
-            
-        # Allocate capital by inverse volatility
-        capital_allocations = {}
-        for pair_key, vol in pairs_volatility.items():
-            inv_vol = 1 / vol
-            allocation = (inv_vol / total_inv_vol) * self.available_capital
-            capital_allocations[pair_key] = allocation
-        
-        # Execute trades
-        executed_trades = []
-        capital_used = 0
+        budget_args = (signals, sizing, permnos_black, permnos_white, px_b, px_w, adv_b, adv_w)
+        if self.netting:
+            self._fit_to_budget(np.flatnonzero(sizing['status'] == 0), *budget_args)
         
-        # Track rejection reasons
-        missing_price = 0
-        zero_shares = 0
-        insufficient_capital = 0
+        # Fund the sized entries in signal order while capital lasts
+        candidates = np.flatnonzero(sizing['status'] == 0)
+        accepted, capital_used = fund_in_order(sizing['total_cost'][candidates], self.available_capital)
+        while self.netting and not accepted.all():
+            # Unfunded entries no longer offset the others' flows; refitting only shrinks the funded ones
+            self._fit_to_budget(candidates[accepted], *budget_args)
+            candidates = candidates[accepted]
+            candidates = candidates[sizing['status'][candidates] == 0]
+            accepted, capital_used = fund_in_order(sizing['total_cost'][candidates], self.available_capital)
+        executed = candidates[accepted]
+        self._log_allocation(current_date, signals, sizing, executed, capital_used)
         
-        for sig in signals:
-            permno_black = sig['permno_black']
-            permno_white = sig['permno_white']
-            pair_key = (permno_black, permno_white)
-            
-            if pair_key not in capital_allocations:
-                continue
-                
-            # Get stock prices
-            px_b = self.price_lookup.get((current_date, permno_black))
-            px_w = self.price_lookup.get((current_date, permno_white))
-            
-            if px_b is None or px_w is None or px_b <= 0 or px_w <= 0:
-                missing_price += 1
-                continue
-                
-            # Allocate capital to the pair
-            pair_capital = capital_allocations[pair_key]
-            
-            # Split capital equally between black and white stocks
-            inv_b = inv_w = pair_capital / 2
-            
-            # Calculate maximum shares based on liquidity constraint (10% of ADV20)
-            max_shares_b = self._calculate_max_shares(permno_black, current_date, px_b, inv_b)
-            max_shares_w = self._calculate_max_shares(permno_white, current_date, px_w, inv_w)
-            
-            # Calculate shares based on capital allocation
-            capital_shares_b = int(inv_b / px_b)
-            capital_shares_w = int(inv_w / px_w)
-            
-            # Apply liquidity constraint
-            sh_b = min(capital_shares_b, max_shares_b) if max_shares_b > 0 else capital_shares_b
-            sh_w = min(capital_shares_w, max_shares_w) if max_shares_w > 0 else capital_shares_w
-            
-            # Skip if not enough shares can be purchased
-            if sh_b == 0 or sh_w == 0:
-                zero_shares += 1
-                continue
-                
-            # Recalculate actual investment based on constrained shares
-            inv_b = sh_b * px_b
-            inv_w = sh_w * px_w
-            
-            # Calculate transaction costs
-            entry_tc = 0.01 * (sh_b + sh_w)
-            
-            # Check if we have enough capital
-            total_cost = inv_b + inv_w + entry_tc
-            if total_cost > (self.available_capital - capital_used):
-                insufficient_capital += 1
-                continue
-                
-            # Record the capital used
-            capital_used += total_cost
-            
-            # Create new trade
+        # Create the new trades
+        executed_trades = []
+        columns = [sizing[key][executed].tolist() for key in
+                   ('investment_black', 'investment_white', 'shares_black', 'shares_white', 'entry_cost',
+                    'liquidity_bound')]
+        prices = (px_b[executed].tolist(), px_w[executed].tolist())
+        for i, inv_b, inv_w, sh_b, sh_w, entry_tc, liquidity_bound, px_black, px_white in zip(
+                executed.tolist(), *columns, *prices):
+            sig = signals[i]
             new_trade = Trade(
                 entry_date=current_date,
-                permno_black=permno_black,
-                permno_white=permno_white,
+                permno_black=sig['permno_black'],
+                permno_white=sig['permno_white'],
                 side=sig['signal'],
                 z_diff_entry=sig['z_diff'],
                 investment_black=inv_b,
                 investment_white=inv_w,
                 shares_black=sh_b,
                 shares_white=sh_w,
-                entry_price_black=px_b,
-                entry_price_white=px_w,
+                entry_price_black=px_black,
+                entry_price_white=px_white,
                 entry_transaction_cost=entry_tc,
                 zscore_method=sig.get('zscore_method', 'ou'),
                 horizon=sig.get('horizon', 5),
-                lookback=sig.get('lookback', 20)
+                lookback=sig.get('lookback', 20),
+                cost_per_share=self.cost_per_share,
+                # Liquidity-bound sizing does not depend on available capital (see Trade.sizing_constraint)
+                sizing_constraint='liquidity' if liquidity_bound else 'capital',
+                group_id=sig.get('group_id')
             )
             
             # Add to active trades list
@@ -313,57 +393,214 @@ class PortfolioManager:
         self.available_capital -= capital_used
         
         return executed_trades
+    
+    def _stock_codes(self, permnos):
+        """Codes of stocks into the lookup's sorted permnos (for exposure and netting arrays)"""
+        return np.searchsorted(self._asof_permnos, permnos)
+    
+    def _budget_headroom(self, permnos, adv, direction):
+        """
+        Whole shares every leg may trade in its direction (+1 buy, -1 sell) within its stock's budget.
 
-    def mark_to_market_open_positions(self, final_date):
-        """Close all open positions at the end of the backtest period using latest prices"""
-        closed_trades = []
+        A stock's headroom (the same limit as fit_to_budget) is split evenly
+        among the legs trading it in the same direction; inf where ADV20 is
+        unusable and no budget applies.
+        """
+        liquid = np.isfinite(adv) & (adv > 0)
+        budget = np.trunc(np.where(liquid, adv, 0.0) * ADV_PARTICIPATION)
+        codes = self._stock_codes(permnos)
+        exposure = self._exposure[codes]
+        headroom = np.maximum(np.maximum(budget, np.abs(exposure)) - direction * exposure, 0.0)
+        _, groups, counts = np.unique(codes * 2 + (direction > 0), return_inverse=True, return_counts=True)
+        return np.where(liquid, np.trunc(headroom / counts[groups]), np.inf)
+    
+    def _fit_to_budget(self, rows, signals, sizing, permnos_black, permnos_white, px_b, px_w, adv_b, adv_w):
+        """Scale the sized entries in rows so every stock's aggregate position stays within 10% of its ADV20"""
+        # Budgets are the same on every pass: one per stock, shared by all pairs trading it (none where ADV20
+        # is unusable)
+        budget = np.full(len(self._exposure), np.inf)
+        for permnos, adv in ((permnos_black[rows], adv_b[rows]), (permnos_white[rows], adv_w[rows])):
+            liquid = np.isfinite(adv) & (adv > 0)
+            budget[self._stock_codes(permnos[liquid])] = np.trunc(adv[liquid] * ADV_PARTICIPATION)
+        # Budget-bound sizes depend on the other entries of the day, so they count as capital-bound
+        sizing['liquidity_bound'][rows] = False
         
-        # Skip if no active trades
-        if not self.active_trades:
-            return []
+        # Refit until the whole-share sizes fit: truncating an offsetting leg, or scaling a pair to zero
+        # shares, can push a stock back over its budget. Every pass shrinks some pair by at least a share.
+        while len(rows) > 0:
+            codes = np.column_stack([self._stock_codes(permnos_black[rows]), self._stock_codes(permnos_white[rows])])
+            short_black = np.array([signals[i]['signal'] == 'short_black_long_white' for i in rows])
+            flows = leg_flows(short_black, sizing['shares_black'][rows], sizing['shares_white'][rows])
+            factors = fit_to_budget(codes, flows, self._exposure, budget)
+            if (factors == 1).all():
+                break
+            
+            resized = entry_costs(np.trunc(sizing['shares_black'][rows] * factors).astype(np.int64),
+                                  np.trunc(sizing['shares_white'][rows] * factors).astype(np.int64),
+                                  px_b[rows], px_w[rows], self.cost_per_share)
+            for key, values in resized.items():
+                sizing[key][rows] = values
+            zero_shares = (resized['shares_black'] == 0) | (resized['shares_white'] == 0)
+            sizing['status'][rows[zero_shares]] = 3
+            rows = rows[~zero_shares]
+    
+    def _order_flows(self, trades, unwind):
+        """Stock codes (n, 2) and signed share flows of opening (or, with unwind, closing) pair positions"""
+        codes = np.array([[self._stock_codes(trade.permno_black), self._stock_codes(trade.permno_white)]
+                          for trade in trades], dtype=np.int64).reshape(-1, 2)
+        short_black = np.array([trade.side == 'short_black_long_white' for trade in trades], dtype=bool)
+        flows = leg_flows(short_black, [trade.shares_black for trade in trades],
+                          [trade.shares_white for trade in trades])
+        return codes, -flows if unwind else flows
+    
+    def _unwind(self, closed_trades):
+        """Remove closed positions from the per-stock exposure"""
+        if closed_trades:
+            codes, flows = self._order_flows(closed_trades, unwind=True)
+            self._exposure += net_orders(codes, flows, len(self._exposure))[0]
+    
+    def _net_orders(self, current_date, closed_trades, new_trades):
+        """Net the day's exit and entry flows into one order per stock and charge costs on the netted orders"""
+        if not closed_trades and not new_trades:
+            return
+        exit_codes, exit_flows = self._order_flows(closed_trades, unwind=True)
+        entry_codes, entry_flows = self._order_flows(new_trades, unwind=False)
+        codes = np.concatenate([exit_codes, entry_codes])
+        flows = np.concatenate([exit_flows, entry_flows])
+        
+        net, gross = net_orders(codes, flows, len(self._exposure))
+        # Exits were unwound before the entries were sized
+        self._exposure += net_orders(entry_codes, entry_flows, len(self._exposure))[0]
+        costs = netted_costs(codes, flows, net, gross, self.cost_per_share).tolist()
         
+        # Costs were charged per leg; the difference is returned to available capital
+        for trade, cost in zip(closed_trades, costs):
+            self.available_capital += trade.exit_transaction_cost - cost
+            trade.set_transaction_costs(exit_transaction_cost=cost)
+        for trade, cost in zip(new_trades, costs[len(closed_trades):]):
+            self.available_capital += trade.entry_transaction_cost - cost
+            trade.set_transaction_costs(entry_transaction_cost=cost)
+        
+        self.order_log.append((
+            current_date,
+            2 * (len(closed_trades) + len(new_trades)),
+            int(np.count_nonzero(net)),
+            float(gross.sum()),
+            float(np.abs(net).sum()),
+            float(self.cost_per_share * gross.sum()),
+            float(sum(costs)),
+        ))
+    
+    def get_order_log(self):
+        """Per-day orders before and after netting (with netting enabled)"""
+        return pd.DataFrame(self.order_log, columns=ORDER_LOG_COLUMNS)
+    
+    def _log_allocation(self, current_date, signals, sizing, executed, capital_used):
+        """Record how much of the available capital a day's entries used, and why signals were skipped"""
+        status = sizing['status']
+        self.allocation_log.append((
+            current_date,
+            len(signals),
+            len(executed),
+            int(np.count_nonzero(status == 1)),
+            int(np.count_nonzero(status == 2)),
+            int(np.count_nonzero(status == 3)),
+            int(np.count_nonzero(status == 0)) - len(executed),
+            int(np.count_nonzero(sizing['liquidity_bound'][executed])),
+            float(self.available_capital),
+            float(sizing['allocation'].sum()),
+            float(capital_used),
+        ))
+    
+    def get_allocation_log(self):
+        """Per-day entry sizing summary, including capital utilization (capital used / available)"""
+        log = pd.DataFrame(self.allocation_log, columns=ALLOCATION_LOG_COLUMNS)
+        log['capital_utilization'] = log['capital_used'] / log['capital_available']
+        return log
+    
+    def _market_arrays(self, current_date, permnos):
+        """Price, ADV20 and GARCH volatility of stocks on a date (NaN where missing), by binary search"""
+        values = np.full((3, len(permnos)), np.nan)
+        if len(self._market_keys) == 0:
+            return values
+        date_code = np.searchsorted(self._market_dates, np.datetime64(current_date))
+        if date_code == len(self._market_dates) or self._market_dates[date_code] != np.datetime64(current_date):
+            return values
+        permno_codes = np.minimum(np.searchsorted(self._asof_permnos, permnos), len(self._asof_permnos) - 1)
+        found = self._asof_permnos[permno_codes] == permnos
+        keys = permno_codes.astype(np.int64) * len(self._market_dates) + date_code
+        pos = np.minimum(np.searchsorted(self._market_keys, keys), len(self._market_keys) - 1)
+        found &= self._market_keys[pos] == keys
+        values[:, found] = self._market_values[:, pos[found]]
+        return values
+
+    def last_price(self, permno, as_of_date):
+        """Latest price of a stock on or before a date (None if it has none), by binary search"""
+        pos = np.searchsorted(self._asof_permnos, permno)
+        if pos == len(self._asof_permnos) or self._asof_permnos[pos] != permno:
+            return None
+        start, end = self._asof_offsets[pos], self._asof_offsets[pos + 1]
+        idx = start + np.searchsorted(self._asof_dates[start:end], np.datetime64(as_of_date), side='right') - 1
+        if idx < start:
+            return None
+        return self._asof_prices[idx]
+    
+    def _liquidate(self, final_date):
+        """Close every open position at the final date's prices (or each stock's last earlier price)"""
+        closed_trades = []
         for trade in self.active_trades:
             # Get exit prices for the final date
             exit_price_black = self.price_lookup.get((final_date, trade.permno_black))
             exit_price_white = self.price_lookup.get((final_date, trade.permno_white))
             
-            # Skip if prices are missing
+            # Fall back to the last available prices before the final date
+            if exit_price_black is None:
+                exit_price_black = self.last_price(trade.permno_black, final_date)
+            if exit_price_white is None:
+                exit_price_white = self.last_price(trade.permno_white, final_date)
+            
+            # A leg without any price in the lookups is closed at its entry price, so the trade is still
+            # counted in the trade log and the equity curve
             if exit_price_black is None or exit_price_white is None:
-                # Try to find the last available prices
-                dates = sorted(self.price_lookup.keys(), key=lambda x: x[0])
-                for date, permno in reversed(dates):
-                    if date < final_date and permno == trade.permno_black:
-                        exit_price_black = self.price_lookup.get((date, permno))
-                        break
-                
-                for date, permno in reversed(dates):
-                    if date < final_date and permno == trade.permno_white:
-                        exit_price_white = self.price_lookup.get((date, permno))
-                        break
-                
-                # If still no prices, skip this trade
-                if exit_price_black is None or exit_price_white is None:
-                    continue
+                logger.warning("No price for trade %s (%s/%s) on or before %s, closing it at its entry prices",
+                               trade.trade_id, trade.permno_black, trade.permno_white, final_date)
+                if exit_price_black is None:
+                    exit_price_black = trade.entry_price_black
+                if exit_price_white is None:
+                    exit_price_white = trade.entry_price_white
             
             # Close the trade with "end_of_period" as reason
             trade.close_trade(final_date, exit_price_black, exit_price_white, 
                              'end_of_period', 0)  # Use 0 as z_diff_exit
-            
-            # Add to closed trades and trade history
             closed_trades.append(trade)
-            self.trade_history.append(trade)
         
-        # Update active trades list (should be empty now)
         self.active_trades = []
+        return closed_trades
+    
+    def mark_to_market_open_positions(self, final_date):
+        """Close all open positions at the end of the backtest period using latest prices
+
+        process_trading_day already liquidates on the last trading date, so
+        this only closes positions left open otherwise (e.g. when that day
+        failed or final_date is not the last trading date).
+        """
+        # Skip if no active trades
+        if not self.active_trades:
+            return []
         
-        # Update equity curve with the PnL from these trades
-        if closed_trades:
-            day_pnl = sum([trade.net_pnl for trade in closed_trades])
-            if final_date not in self.equity_curve:
-                prev_equity = max(self.equity_curve.values())
-                self.equity_curve[final_date] = prev_equity + day_pnl
-            else:
-                self.equity_curve[final_date] += day_pnl
+        closed_trades = self._liquidate(final_date)
+        self.trade_history.extend(closed_trades)
+        
+        # The liquidation orders are netted like any other day's
+        if self.netting:
+            self._unwind(closed_trades)
+            self._net_orders(final_date, closed_trades, [])
+        
+        # Update equity curve with the PnL from these trades; nothing is left unrealized
+        day_pnl = sum([trade.net_pnl for trade in closed_trades])
+        self.realized_pnl += day_pnl
+        self.daily_pnl[final_date] = self.daily_pnl.get(final_date, 0) + day_pnl
+        self._record_equity(final_date, 0.0)
         
         # Return the closed trades
         return closed_trades
@@ -0,0 +1,153 @@
+import glob
+import logging
+import os
+
+import duckdb
+import pandas as pd
+
+from .results_sink import TABLES
+
+logger = logging.getLogger(__name__)
+
+# Prebuilt aggregate views over the trades table: name -> grouping columns
+PNL_VIEWS = {
+    'pair_pnl': ('permno_black', 'permno_white'),
+    'group_pnl': ('group_id',),
+    'quarter_pnl': ('quarter',),
+    'exit_reason_pnl': ('exit_reason',),
+}
+
+# Aggregates shared by every PnL view
+_PNL_AGGREGATES = """
+    count(*) AS num_trades,
+    sum(net_pnl) AS net_pnl,
+    sum(gross_pnl) AS gross_pnl,
+    sum(entry_transaction_cost + exit_transaction_cost) AS transaction_cost,
+    sum(financing_cost) AS financing_cost,
+    avg(CASE WHEN net_pnl > 0 THEN 1.0 ELSE 0.0 END) AS win_rate,
+    avg(roi) AS avg_roi,
+    avg(days_held) AS avg_days_held"""
+
+
+class ResultsQuery:
+    """
+    SQL access (DuckDB) to the datasets written by a ResultsSink.
+
+    The `results`, `trades` and `daily_returns` tables are views over the
+    sink's Parquet parts, so nothing is loaded up front and filters on
+    run_id, dates or permnos are pushed down into the Parquet scans (row
+    groups that cannot match are skipped). On top of them, PNL_VIEWS
+    aggregate net PnL per run and pair, group_id, quarter and exit reason.
+
+    `group_pnl` groups on the trades' own group_id (the group of the signal
+    that opened each trade), so it is only created for trade logs that
+    carry one.
+    """
+
+    def __init__(self, root, threads=None):
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"Results directory {root} does not exist")
+        self.root = root
+        self.con = duckdb.connect(database=':memory:')
+        if threads is not None:
+            self.con.execute(f"SET threads TO {int(threads)}")
+
+        self.tables = []
+        for table in TABLES:
+            pattern = os.path.join(root, table, '*.parquet')
+            if not glob.glob(pattern):
+                continue
+            self.con.execute(
+                f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{pattern}', union_by_name = true)")
+            self.tables.append(table)
+
+        self.views = self._create_pnl_views()
+        logger.info("Opened %s: tables %s, views %s", root, self.tables, self.views)
+
+    def _create_pnl_views(self):
+        if 'trades' not in self.tables:
+            return []
+        views = []
+        trade_columns = set(self._columns('trades'))
+        for view, keys in PNL_VIEWS.items():
+            if not trade_columns.issuperset(keys):
+                continue
+            columns = ', '.join(keys)
+            self.con.execute(
+                f"CREATE VIEW {view} AS SELECT run_id, {columns}, {_PNL_AGGREGATES} "
+                f"FROM trades GROUP BY run_id, {columns}")
+            views.append(view)
+        return views
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def sql(self, query, params=None):
+        """Run a SQL query against the tables and views, returning a DataFrame"""
+        return self.con.execute(query, params or []).df()
+
+    def top_runs(self, n=20, metric='sharpe_ratio', ascending=False):
+        """Results rows of the best n successful runs by a metric"""
+        where = "WHERE error IS NULL" if 'error' in self._columns('results') else ""
+        order = 'ASC' if ascending else 'DESC'
+        return self.sql(f"SELECT * FROM results {where} ORDER BY {metric} {order} NULLS LAST LIMIT ?", [n])
+
+    def pnl_by(self, view, run_ids=None, combine_runs=True, order_by='net_pnl', limit=None):
+        """
+        Read an aggregate PnL view, optionally restricted to some runs.
+
+        With combine_runs=True the per-run rows are summed across the
+        selected runs (win rate, average ROI and holding period are
+        trade-weighted), answering e.g. which pairs drive the PnL of the
+        best configurations.
+        """
+        if view not in self.views:
+            raise ValueError(f"Unknown or unavailable view: {view}. Available: {self.views}")
+        where, params = self._run_filter(run_ids)
+        keys = ', '.join(PNL_VIEWS[view])
+        if combine_runs:
+            query = (f"SELECT {keys}, sum(num_trades)::BIGINT AS num_trades, sum(net_pnl) AS net_pnl, "
+                     f"sum(gross_pnl) AS gross_pnl, sum(transaction_cost) AS transaction_cost, "
+                     f"sum(financing_cost) AS financing_cost, "
+                     f"sum(win_rate * num_trades) / sum(num_trades) AS win_rate, "
+                     f"sum(avg_roi * num_trades) / sum(num_trades) AS avg_roi, "
+                     f"sum(avg_days_held * num_trades) / sum(num_trades) AS avg_days_held, "
+                     f"count(DISTINCT run_id) AS num_runs "
+                     f"FROM {view} {where} GROUP BY {keys}")
+        else:
+            query = f"SELECT * FROM {view} {where}"
+        query += f" ORDER BY {order_by} DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return self.sql(query, params)
+
+    def trades(self, run_ids=None, columns=None, start_date=None, end_date=None):
+        """Trade rows, filtered by run and exit date range (pushed down to the scan)"""
+        where, params = self._run_filter(run_ids)
+        conditions = [where[len('WHERE '):]] if where else []
+        if start_date is not None:
+            conditions.append("exit_date >= ?")
+            params.append(pd.Timestamp(start_date))
+        if end_date is not None:
+            conditions.append("exit_date <= ?")
+            params.append(pd.Timestamp(end_date))
+        select = ', '.join(columns) if columns else '*'
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.sql(f"SELECT {select} FROM trades {where}", params)
+
+    def _run_filter(self, run_ids):
+        if run_ids is None:
+            return "", []
+        run_ids = list(run_ids)
+        if not run_ids:
+            return "WHERE false", []
+        return f"WHERE run_id IN ({', '.join('?' * len(run_ids))})", run_ids
+
+    def _columns(self, table):
+        return [row[0] for row in self.con.execute(f"DESCRIBE {table}").fetchall()]
@@ -0,0 +1,232 @@
+import logging
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from .trade import Trade
+from .performance import calculate_trade_based_metrics
+
+logger = logging.getLogger(__name__)
+
+# Cost model parameters a scenario can change, with the values used in the simulation
+COST_PARAMS = {
+    'COST_PER_SHARE': Trade.DEFAULT_COST_PER_SHARE,
+    'SHORT_SPREAD': Trade.DEFAULT_SHORT_SPREAD,
+    'LONG_SPREAD': Trade.DEFAULT_LONG_SPREAD,
+}
+
+# Trade log columns holding the cost parameters each trade was simulated with
+_LOG_COLUMNS = {'COST_PER_SHARE': 'cost_per_share', 'SHORT_SPREAD': 'short_spread', 'LONG_SPREAD': 'long_spread'}
+
+
+def expand_cost_grid(cost_grid):
+    """Expand a grid of cost parameters (lists or scalars) into a scenario DataFrame"""
+    invalid = [key for key in cost_grid if key not in COST_PARAMS]
+    if invalid:
+        raise ValueError(f"Unknown cost parameters: {invalid}. Use any of {list(COST_PARAMS)}.")
+    values = [cost_grid.get(key, default) for key, default in COST_PARAMS.items()]
+    values = [value if isinstance(value, (list, tuple, np.ndarray)) else [value] for value in values]
+    return pd.DataFrame(list(product(*values)), columns=list(COST_PARAMS))
+
+
+def _trade_arrays(trade_df):
+    """Per-trade quantities that drive the cost model, as float arrays"""
+    shares = (trade_df['shares_black'] + trade_df['shares_white']).to_numpy(dtype=np.float64)
+    short_black = (trade_df['side'] == 'short_black_long_white').to_numpy()
+    inv_black = trade_df['investment_black'].to_numpy(dtype=np.float64)
+    inv_white = trade_df['investment_white'].to_numpy(dtype=np.float64)
+    # Investment financed at the short and long spread (see Trade.update_daily_financing)
+    short_investment = np.where(short_black, inv_black, inv_white)
+    long_investment = np.where(short_black, inv_white, inv_black)
+
+    baseline = {}
+    for key, column in _LOG_COLUMNS.items():
+        if column in trade_df.columns:
+            baseline[key] = trade_df[column].fillna(COST_PARAMS[key]).to_numpy(dtype=np.float64)
+        else:
+            baseline[key] = np.full(len(trade_df), COST_PARAMS[key])
+    return shares, short_investment, long_investment, baseline
+
+
+def _netted_share(trade_df, column, gross_cost):
+    """Logged transaction cost over its per-leg (un-netted) value: 1 unless orders were netted"""
+    logged = trade_df[column].to_numpy(dtype=np.float64)
+    return np.divide(logged, gross_cost, out=np.ones_like(gross_cost), where=gross_cost > 0)
+
+
+def _cost_deltas(trade_df, scenarios):
+    """
+    Change in per-share costs and daily financing of every trade under every scenario.
+
+    Returns (d_entry_cost, d_exit_cost, d_daily_financing), each
+    (n_scenarios, n_trades): the change of the entry and exit transaction
+    costs and of the daily financing charge. With netted orders a trade pays
+    for only part of its shares, so its cost changes in proportion to the
+    logged cost. Fed Funds enters the daily charge with the same weight in
+    every scenario, so only the spreads move it.
+    """
+    shares, short_investment, long_investment, baseline = _trade_arrays(trade_df)
+    cost = scenarios['COST_PER_SHARE'].to_numpy(dtype=np.float64)[:, None]
+    short_spread = scenarios['SHORT_SPREAD'].to_numpy(dtype=np.float64)[:, None]
+    long_spread = scenarios['LONG_SPREAD'].to_numpy(dtype=np.float64)[:, None]
+
+    d_trade_cost = (cost - baseline['COST_PER_SHARE']) * shares
+    gross_cost = baseline['COST_PER_SHARE'] * shares
+    d_entry_cost = d_trade_cost * _netted_share(trade_df, 'entry_transaction_cost', gross_cost)
+    d_exit_cost = d_trade_cost * _netted_share(trade_df, 'exit_transaction_cost', gross_cost)
+    # Short leg earns FFR + short spread, long leg pays FFR + long spread
+    d_daily_financing = (long_investment * (long_spread - baseline['LONG_SPREAD'])
+                         - short_investment * (short_spread - baseline['SHORT_SPREAD'])) / Trade.DAYS_PER_YEAR
+    return d_entry_cost, d_exit_cost, d_daily_financing
+
+
+def reprice_trade_log(trade_df, cost_per_share=Trade.DEFAULT_COST_PER_SHARE,
+                      short_spread=Trade.DEFAULT_SHORT_SPREAD, long_spread=Trade.DEFAULT_LONG_SPREAD):
+    """Return a copy of a closed-trade log with costs, financing and net PnL under another cost model"""
+    scenario = pd.DataFrame([{'COST_PER_SHARE': cost_per_share, 'SHORT_SPREAD': short_spread,
+                              'LONG_SPREAD': long_spread}])
+    d_entry_cost, d_exit_cost, d_daily_financing = _cost_deltas(trade_df, scenario)
+    days_held = trade_df['days_held'].to_numpy(dtype=np.float64)
+
+    repriced = trade_df.copy()
+    repriced['entry_transaction_cost'] = trade_df['entry_transaction_cost'] + d_entry_cost[0]
+    repriced['exit_transaction_cost'] = trade_df['exit_transaction_cost'] + d_exit_cost[0]
+    repriced['financing_cost'] = trade_df['financing_cost'] + d_daily_financing[0] * days_held
+    repriced['net_pnl'] = (repriced['gross_pnl'] - repriced['entry_transaction_cost']
+                           - repriced['exit_transaction_cost'] - repriced['financing_cost'])
+    repriced['roi'] = repriced['net_pnl'] / (repriced['investment_black'] + repriced['investment_white'])
+    repriced['cost_per_share'] = cost_per_share
+    repriced['short_spread'] = short_spread
+    repriced['long_spread'] = long_spread
+    return repriced
+
+
+def flag_sizing_sensitive(trade_df):
+    """
+    Flag trades whose size could change under a different cost model.
+
+    Capital-bound trades are sized from available capital, which depends on
+    the costs of earlier entries and the net PnL of earlier exits in the same
+    quarter. Only the first entry day of a quarter sees untouched capital.
+    Liquidity-bound trades (ADV cap on both legs) keep their size. Logs
+    without a sizing_constraint column are treated as capital-bound.
+    """
+    if 'sizing_constraint' in trade_df.columns:
+        capital_bound = (trade_df['sizing_constraint'] != 'liquidity').to_numpy()
+    else:
+        capital_bound = np.ones(len(trade_df), dtype=bool)
+    entry_dates = pd.to_datetime(trade_df['entry_date'])
+    period = trade_df['quarter'] if 'quarter' in trade_df.columns else entry_dates.dt.to_period('Q')
+    first_entry = entry_dates.groupby(period).transform('min')
+    return capital_bound & (entry_dates > first_entry).to_numpy()
+
+
+def _equity_deltas(trade_df, calendar, d_entry_cost, d_daily_financing, net_pnl_delta):
+    """
+    Change of the dense daily equity curve under every scenario, (n_scenarios, n_days).
+
+    An open trade is marked at value - investment - entry cost - financing so
+    far (Trade.mark_to_market_pnl), which moves by -(d_entry + d_daily * k) on
+    the k-th day after entry. From its exit date on, the change of its net PnL
+    is part of realized PnL. Both parts are accumulated with difference arrays.
+    """
+    n_scenarios, n_days = d_entry_cost.shape[0], len(calendar)
+    entry_idx = np.searchsorted(calendar, pd.to_datetime(trade_df['entry_date']).to_numpy())
+    exit_idx = np.searchsorted(calendar, pd.to_datetime(trade_df['exit_date']).to_numpy())
+
+    # While open (entry <= day < exit): -(d_entry - d_daily * entry) - d_daily * day
+    intercept = np.zeros((n_scenarios, n_days + 1))
+    slope = np.zeros((n_scenarios, n_days + 1))
+    open_intercept = -(d_entry_cost - d_daily_financing * entry_idx)
+    for idx, sign in ((entry_idx, 1), (exit_idx, -1)):
+        np.add.at(intercept.T, idx, (sign * open_intercept).T)
+        np.add.at(slope.T, idx, (-sign * d_daily_financing).T)
+    days = np.arange(n_days)
+    open_delta = np.cumsum(intercept, axis=1)[:, :n_days] + np.cumsum(slope, axis=1)[:, :n_days] * days
+
+    # From exit on: change in realized net PnL
+    realized = np.zeros((n_scenarios, n_days + 1))
+    np.add.at(realized.T, exit_idx, net_pnl_delta.T)
+    return open_delta + np.cumsum(realized, axis=1)[:, :n_days]
+
+
+def run_cost_scenarios(trade_df, cost_grid, market_returns, ffr_lookup=None, initial_capital=1_000_000_000,
+                       equity_curve=None):
+    """
+    Re-cost a closed-trade log under a grid of cost scenarios without re-simulating.
+
+    Entry/exit decisions and share counts are taken from the log. Per-share
+    costs and financing spreads are changed relative to the values each
+    trade was simulated with. Then all calculate_trade_based_metrics outputs
+    are recomputed for every scenario. Fed Funds financing is unchanged
+    because it does not depend on the cost model.
+
+    Parameters:
+    -----------
+    trade_df : pandas DataFrame
+        Closed-trade log as returned by BacktestEngine.run_backtest
+    cost_grid : dict or DataFrame
+        Lists of COST_PER_SHARE, SHORT_SPREAD and LONG_SPREAD values (missing
+        keys keep the simulation values), or one scenario per row
+    market_returns, ffr_lookup, initial_capital :
+        As for calculate_trade_based_metrics
+    equity_curve : pandas Series or None
+        Dense daily equity of the run (indexed by date). When given, it is
+        shifted by each scenario's cost changes, including the marks of
+        logged trades before their exit, and the metrics use it as in the
+        original run. Positions never closed are not in the log and keep
+        their simulated marks.
+
+    Returns:
+    --------
+    pandas DataFrame : one row per scenario with the cost parameters, total
+        net PnL, all scalar metrics, and the number and share of trades whose
+        size could have changed under that scenario (see flag_sizing_sensitive)
+    """
+    scenarios = expand_cost_grid(cost_grid) if isinstance(cost_grid, dict) else cost_grid.reset_index(drop=True)
+    if len(trade_df) == 0:
+        rows = [{**scenario, **calculate_trade_based_metrics(trade_df, market_returns, ffr_lookup, initial_capital)}
+                for scenario in scenarios.to_dict('records')]
+        return pd.DataFrame(rows).drop(columns='daily_returns')
+
+    d_entry_cost, d_exit_cost, d_daily_financing = _cost_deltas(trade_df, scenarios)
+    days_held = trade_df['days_held'].to_numpy(dtype=np.float64)
+    net_pnl_delta = -(d_entry_cost + d_exit_cost + d_daily_financing * days_held)
+    net_pnl = trade_df['net_pnl'].to_numpy(dtype=np.float64) + net_pnl_delta
+
+    sizing_sensitive = flag_sizing_sensitive(trade_df)
+    # A scenario equal to the simulated cost model cannot change any decision
+    cost_changed = (np.abs(d_entry_cost) > 0) | (np.abs(d_exit_cost) > 0) | (np.abs(d_daily_financing) > 0)
+
+    equity_deltas = None
+    if equity_curve is not None:
+        equity_curve = pd.Series(equity_curve).dropna().sort_index()
+        equity_deltas = _equity_deltas(trade_df, equity_curve.index.to_numpy(), d_entry_cost,
+                                       d_daily_financing, net_pnl_delta)
+
+    metric_trades = trade_df[['entry_date', 'exit_date', 'days_held']].copy()
+    rows = []
+    for k, scenario in enumerate(scenarios.to_dict('records')):
+        metric_trades['net_pnl'] = net_pnl[k]
+        scenario_equity = None
+        if equity_deltas is not None:
+            scenario_equity = equity_curve + equity_deltas[k]
+        metrics = calculate_trade_based_metrics(metric_trades, market_returns, ffr_lookup, initial_capital,
+                                                equity_curve=scenario_equity)
+        metrics.pop('daily_returns', None)
+
+        flagged = int(sizing_sensitive.sum()) if cost_changed[k].any() else 0
+        rows.append({
+            **scenario,
+            'total_net_pnl': float(net_pnl[k].sum()),
+            **metrics,
+            'num_sizing_sensitive': flagged,
+            'share_sizing_sensitive': flagged / len(trade_df),
+        })
+
+    results = pd.DataFrame(rows)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Repriced %d trades under %d cost scenarios; up to %d trades could be sized differently",
+                    len(trade_df), len(scenarios), int(results['num_sizing_sensitive'].max()))
+    return results
@@ -0,0 +1,148 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Datasets written by the sink, one directory of Parquet parts each
+TABLES = ('results', 'trades', 'daily_returns')
+
+
+def run_hash(hyperparams):
+    """Stable short hash identifying a run by its hyperparameters"""
+    payload = json.dumps(hyperparams, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class ResultsSink:
+    """
+    Background writer of compressed, columnar run outputs.
+
+    Frames handed to `write` are queued and returned immediately. A writer
+    thread batches them per table and writes zstd-compressed Parquet parts
+    of at least `batch_rows` rows (smaller ones only on flush/close). Each
+    table is one dataset under `root/<table>/`, with a `run_id` column (see
+    run_hash) identifying the run each row belongs to. Parts are written to
+    a temporary name and renamed, so readers never see partial files.
+
+    Use it as a context manager, or call close() to flush the last batch.
+    """
+
+    def __init__(self, root, batch_rows=250_000, compression='zstd', max_pending=16):
+        self.root = root
+        self.batch_rows = batch_rows
+        self.compression = compression
+        for table in TABLES:
+            os.makedirs(os.path.join(root, table), exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._buffers = {table: [] for table in TABLES}
+        self._buffered_rows = {table: 0 for table in TABLES}
+        self._session = uuid.uuid4().hex[:8]
+        self._part = 0
+        self._error = None
+        self._closed = False
+        self._writer = threading.Thread(target=self._run_writer, name='ResultsSinkWriter', daemon=True)
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, table, df, run_id=None):
+        """Queue a frame for `table`, tagged with `run_id` if given"""
+        if table not in TABLES:
+            raise ValueError(f"Unknown table: {table}. Use one of {TABLES}.")
+        if self._closed:
+            raise RuntimeError("ResultsSink is closed")
+        self._raise_writer_error()
+        if df is None or len(df) == 0:
+            return
+        df = df.copy()
+        if run_id is not None:
+            df['run_id'] = run_id
+        # Blocks only when the writer is max_pending frames behind
+        self._queue.put((table, df))
+
+    def flush(self):
+        """Block until everything queued so far is on disk"""
+        self._queue.put(('__flush__', None))
+        self._queue.join()
+        self._raise_writer_error()
+
+    def close(self):
+        """Flush and stop the writer thread"""
+        if self._closed:
+            return
+        self._queue.put(('__close__', None))
+        self._writer.join()
+        self._closed = True
+        self._raise_writer_error()
+
+    def _raise_writer_error(self):
+        if self._error is not None:
+            raise RuntimeError("ResultsSink writer failed") from self._error
+
+    def _run_writer(self):
+        while True:
+            table, df = self._queue.get()
+            try:
+                if table in ('__flush__', '__close__'):
+                    for name in TABLES:
+                        self._write_part(name)
+                else:
+                    self._buffers[table].append(df)
+                    self._buffered_rows[table] += len(df)
+                    if self._buffered_rows[table] >= self.batch_rows:
+                        self._write_part(table)
+            except Exception as e:
+                logger.exception("Error writing %s results", table)
+                self._error = e
+            finally:
+                self._queue.task_done()
+            if table == '__close__':
+                return
+
+    def _write_part(self, table):
+        """Write the buffered frames of a table as one Parquet part"""
+        if not self._buffers[table]:
+            return
+        batch = pd.concat(self._buffers[table], ignore_index=True)
+        self._buffers[table] = []
+        self._buffered_rows[table] = 0
+
+        path = os.path.join(self.root, table, f"part-{self._session}-{self._part:05d}.parquet")
+        self._part += 1
+        tmp_path = path + '.tmp'
+        batch.to_parquet(tmp_path, index=False, compression=self.compression)
+        os.replace(tmp_path, path)
+        logger.debug("Wrote %d %s rows to %s", len(batch), table, path)
+
+    def parts(self, table):
+        """Completed Parquet parts of a table"""
+        return sorted(glob.glob(os.path.join(self.root, table, '*.parquet')))
+
+    def read(self, table, run_ids=None, columns=None):
+        """Read a table (already written parts only), optionally for some runs and columns"""
+        filters = [('run_id', 'in', list(run_ids))] if run_ids is not None else None
+        frames = [pd.read_parquet(path, columns=columns, filters=filters) for path in self.parts(table)]
+        frames = [frame for frame in frames if not frame.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def completed_runs(self):
+        """Run ids with a stored results row that is not an error row"""
+        results = self.read('results')
+        if results.empty:
+            return set()
+        if 'error' in results.columns:
+            results = results[results['error'].isna()]
+        return set(results['run_id'])
@@ -1,17 +1,7 @@
+import sys
+
+from backtest.cli import main
+
 if __name__ == "__main__":
-    # Specify period as 'train' or 'test'
-    period = 'test'
-    
-    print(f"Running backtest for period: {period}")
-    
-    # Run the backtest
-    results = run_backtest(
-        df_main_path='final_backtest_data.csv',
-        df_pairs_path='corr_coin.csv',
-        period=period
-    )
-    
-    if results is not None:
-        print("Backtest completed successfully!")
-    else:
-        print("Backtest failed. Check error logs.")
\ No newline at end of file
+    # Same as `python -m backtest sweep --period test`; prefer the CLI and a config file
+    raise SystemExit(main(['sweep', '--period', 'test'] + sys.argv[1:]))
@@ -0,0 +1,160 @@
+import gc
+import logging
+import os
+import resource
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# Bytes per value of columns whose itemsize says nothing about their footprint (Python objects)
+OBJECT_VALUE_BYTES = 64
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        scale = 1 if os.uname().sysname == 'Darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def available_memory():
+    """Memory this process can still grow into: MemAvailable, capped by a cgroup limit if any"""
+    available = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    if available is None:
+        available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+    for limit_file, usage_file in (('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+                                   ('/sys/fs/cgroup/memory/memory.limit_in_bytes',
+                                    '/sys/fs/cgroup/memory/memory.usage_in_bytes')):
+        try:
+            with open(limit_file) as f:
+                limit = f.read().strip()
+            with open(usage_file) as f:
+                usage = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        if limit.isdigit():
+            available = min(available, int(limit) - usage)
+        break
+    return max(available, 0)
+
+
+def estimate_frame_bytes(n_rows, dtypes):
+    """Estimated bytes of n_rows rows with the given column dtypes (e.g. df.dtypes)"""
+    row_bytes = 0
+    for dtype in dtypes:
+        row_bytes += OBJECT_VALUE_BYTES if dtype == object else getattr(dtype, 'itemsize', OBJECT_VALUE_BYTES)
+    return int(n_rows) * row_bytes
+
+
+class MemoryScheduler:
+    """
+    Thread pool whose concurrency adapts to a memory ceiling.
+
+    Each task comes with an estimated footprint (e.g. from
+    estimate_frame_bytes). In every map, the first task runs alone and the
+    RSS growth it causes calibrates the ratio between actual and estimated
+    bytes. After that, a task starts only while fewer than max_workers are
+    running and the calibrated footprints of the running tasks plus the new
+    one fit under memory_limit, counted both from the starting RSS and from
+    the current one. If RSS exceeds the limit, no new tasks start until it
+    falls back (garbage is collected while waiting). A single task always
+    runs, even if its estimate alone exceeds the limit.
+
+    Parameters:
+    -----------
+    memory_limit : int or None
+        Ceiling on process RSS in bytes; by default the current RSS plus
+        (1 - headroom) of the memory still available
+    max_workers : int or None
+        Upper bound on concurrency (default: number of CPUs)
+    headroom : float
+        Share of available memory left untouched when memory_limit is None
+    """
+
+    def __init__(self, memory_limit=None, max_workers=None, headroom=0.2, poll_interval=0.05):
+        if memory_limit is None:
+            memory_limit = current_rss() + int(available_memory() * (1 - headroom))
+        self.memory_limit = memory_limit
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.poll_interval = poll_interval
+        # Actual / estimated bytes, learned from the first task
+        self.calibration = None
+        self.peak_rss = 0
+        self.peak_concurrency = 0
+
+    def map(self, func, tasks, estimates, desc=None, disable=True):
+        """Run func(task) for every task on threads and return the results in task order"""
+        tasks = list(tasks)
+        estimates = np.maximum(np.asarray(estimates, dtype=np.float64), 1.0)
+        results = [None] * len(tasks)
+        # Calibrate per map: tasks of different maps have different estimate/actual ratios
+        self.calibration = None
+        baseline = current_rss()
+        running = {}
+        next_task = 0
+        # RSS right before the calibration task and the highest RSS seen while it runs
+        calibration_start = calibration_peak = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                tqdm(total=len(tasks), desc=desc, disable=disable) as progress:
+            while next_task < len(tasks) or running:
+                rss = current_rss()
+                self.peak_rss = max(self.peak_rss, rss)
+                if calibration_peak is not None:
+                    calibration_peak = max(calibration_peak, rss)
+
+                while next_task < len(tasks) and self._can_start(running, estimates, next_task, baseline, rss):
+                    if self.calibration is None and calibration_start is None:
+                        calibration_start = calibration_peak = rss
+                    future = executor.submit(func, tasks[next_task])
+                    running[future] = next_task
+                    next_task += 1
+                    self.peak_concurrency = max(self.peak_concurrency, len(running))
+
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = running.pop(future)
+                    results[idx] = future.result()
+                    progress.update(1)
+                    if self.calibration is None:
+                        # Growth attributable to the (lone) first task; at least its estimate's worth
+                        growth = max(calibration_peak, current_rss()) - calibration_start
+                        self.calibration = max(growth / estimates[idx], 1.0)
+                        calibration_start = calibration_peak = None
+                        logger.debug("Calibrated memory estimates: x%.2f (task grew RSS by %.1f MB)",
+                                     self.calibration, growth / 1024 ** 2)
+                if not done and rss > self.memory_limit:
+                    gc.collect()
+
+        logger.debug("Ran %d tasks with up to %d concurrent, peak RSS %.1f MB of %.1f MB allowed",
+                     len(tasks), self.peak_concurrency, self.peak_rss / 1024 ** 2, self.memory_limit / 1024 ** 2)
+        return results
+
+    def _can_start(self, running, estimates, idx, baseline, rss):
+        if not running:
+            return True
+        if self.calibration is None or len(running) >= self.max_workers:
+            return False
+        if rss > self.memory_limit:
+            logger.debug("RSS %.1f MB over the %.1f MB limit, throttling", rss / 1024 ** 2,
+                         self.memory_limit / 1024 ** 2)
+            return False
+        needed = self.calibration * estimates[idx]
+        reserved = self.calibration * sum(estimates[i] for i in running.values())
+        return baseline + reserved + needed <= self.memory_limit and rss + needed <= self.memory_limit
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# Money and sizing columns stay in float64: prices, ADV20 and GARCH volatility feed share counts
+# through truncation (float32 would move them by a share), rates feed financing
+FLOAT64_COLUMNS = ['adj_prc', 'fed_funds_rate', 'vwretd', 'adv20', 'garch_vol']
+
+# Signal columns that tolerate float32 precision (only compared against thresholds and zero)
+FLOAT32_PREFIXES = ('z_', 'future_cumret_')
+
+
+def quarter_codes(dates):
+    """Encode dates as int16 calendar-quarter codes (year * 4 + quarter - 1)"""
+    dates = pd.DatetimeIndex(dates)
+    return (dates.year * 4 + dates.quarter - 1).astype(np.int16)
+
+
+def quarter_label(code):
+    """Convert a quarter code back to its period label, e.g. 8088 -> '2022Q1'"""
+    code = int(code)
+    return f"{code // 4}Q{code % 4 + 1}"
+
+
+def quarter_code_from_label(label):
+    """Convert a period label such as '2022Q1' to its quarter code"""
+    period = pd.Period(label, freq='Q')
+    return np.int16(period.year * 4 + period.quarter - 1)
+
+
+def compact_frame(df):
+    """
+    Convert a backtest working frame to the compact schema in place.
+
+    permno -> int32, quarter -> int16 quarter codes, group_id -> category,
+    z-score and future return columns -> float32, money and sizing columns -> float64.
+    """
+    if 'date' in df.columns and not pd.api.types.is_datetime64_dtype(df['date']):
+        df['date'] = pd.to_datetime(df['date'])
+    if 'permno' in df.columns:
+        df['permno'] = df['permno'].astype(np.int32)
+    if 'quarter' in df.columns and df['quarter'].dtype != np.int16:
+        if pd.api.types.is_integer_dtype(df['quarter']):
+            df['quarter'] = df['quarter'].astype(np.int16)
+        else:
+            df['quarter'] = quarter_codes(df['date'])
+    if 'group_id' in df.columns and not isinstance(df['group_id'].dtype, pd.CategoricalDtype):
+        df['group_id'] = df['group_id'].astype('category')
+
+    for col in df.columns:
+        if col in FLOAT64_COLUMNS:
+            df[col] = df[col].astype(np.float64)
+        elif col.startswith(FLOAT32_PREFIXES):
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def memory_report(df, name=None):
+    """Return per-column dtype and memory usage (bytes) of a frame, plus a total row"""
+    usage = df.memory_usage(deep=True, index=True)
+    report = pd.DataFrame({
+        'column': usage.index,
+        'dtype': [str(df.index.dtype) if col == 'Index' else str(df[col].dtype) for col in usage.index],
+        'bytes': usage.values,
+    })
+    total = pd.DataFrame([{'column': 'TOTAL', 'dtype': '', 'bytes': int(usage.sum())}])
+    report = pd.concat([report, total], ignore_index=True)
+    report['megabytes'] = report['bytes'] / 1024 ** 2
+    if name is not None:
+        report.insert(0, 'frame', name)
+    return report
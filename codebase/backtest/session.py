@@ -0,0 +1,240 @@
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import BacktestEngine, prepare_working_frame, zscore_column
+from .pair_universe import PairScreen, pairs_formed_between
+
+logger = logging.getLogger(__name__)
+
+# Working frames (one per z-score column) and signal sets kept warm, least recently used dropped first
+DEFAULT_CACHE_SIZE = 4
+
+
+class BacktestSession:
+    """
+    Load once, run many: one dataset serving any number of period and parameter runs.
+
+    The data is loaded (or handed in) once. Then the session keeps three
+    things:
+
+    - per period, the PairScreen over the pairs formed in it (the
+      formation_date filter of main.load_backtest_data);
+    - per z-score column, the engine's working frame of the whole dataset
+      (prepare_working_frame: selected, cleaned, compacted, sorted by date);
+    - per (z-score column, period), the signals at the loosest pair filter
+      and z-score threshold requested so far.
+
+    A period is a contiguous row slice of a working frame, so every run gets
+    an engine over a view, without reloading, re-cleaning or re-sorting.
+    Signals for stricter filters and thresholds are derived from the cached
+    ones (SignalGenerator.subset). Results are identical to
+    main.run_backtest / BacktestEngine on the same period.
+
+    Parameters:
+    -----------
+    df_main : pandas DataFrame
+        Backtest data of every period (e.g. final_backtest_data.csv)
+    df_pairs : pandas DataFrame
+        Pair table (permno_1/permno_2 are renamed to permno_black/permno_white)
+    periods : dict or None
+        Named periods, name -> (start_date, end_date[, description]); main.PERIODS by default
+    quiet : bool
+        Skip diagnostics and progress bars in every engine
+    cache_size : int
+        Working frames and signal sets kept
+    memory_limit, max_workers
+        Passed to every engine (see BacktestEngine)
+    """
+
+    def __init__(self, df_main, df_pairs, periods=None, quiet=False, cache_size=DEFAULT_CACHE_SIZE,
+                 memory_limit=None, max_workers=None):
+        if not pd.api.types.is_datetime64_dtype(df_main['date']):
+            df_main = df_main.assign(date=pd.to_datetime(df_main['date']))
+        if 'permno_1' in df_pairs.columns and 'permno_2' in df_pairs.columns:
+            df_pairs = df_pairs.rename(columns={'permno_1': 'permno_black', 'permno_2': 'permno_white'})
+        if 'formation_date' in df_pairs.columns and not pd.api.types.is_datetime64_dtype(df_pairs['formation_date']):
+            df_pairs = df_pairs.assign(formation_date=pd.to_datetime(df_pairs['formation_date']))
+        if periods is None:
+            from .main import PERIODS
+            periods = PERIODS
+        self.df_main = df_main
+        self.df_pairs = df_pairs
+        self.periods = periods
+        self.quiet = quiet
+        self.cache_size = cache_size
+        self.memory_limit = memory_limit
+        self.max_workers = max_workers
+        # Screen over all pairs; pair_screen_for(period) narrows it to the pairs formed in a period
+        self.pair_screen = PairScreen(df_pairs)
+        self._pair_screens = {None: self.pair_screen}
+        self.calendar = pd.DatetimeIndex(np.unique(df_main['date'].to_numpy()))
+        # z-score column -> working frame of the whole dataset
+        self._frames = OrderedDict()
+        # (z-score column, period row slice, formation bounds) -> (pair filter, SignalGenerator)
+        self._signals = OrderedDict()
+
+    @classmethod
+    def from_files(cls, df_main_path='final_backtest_data.csv', df_pairs_path='corr_coin.csv', **kwargs):
+        """Session over a backtest data file and a pair table file (CSV or Parquet), read once"""
+        from .main import _read_table, load_pairs
+        return cls(_read_table(df_main_path), load_pairs(df_pairs_path), **kwargs)
+
+    def period_bounds(self, period=None):
+        """(start, end) timestamps of a period name or (start_date, end_date) pair; None spans all data"""
+        if period is None:
+            return self.calendar[0], self.calendar[-1]
+        if isinstance(period, str):
+            if period.lower() not in self.periods:
+                raise ValueError(f"Invalid period: {period}. Use one of {list(self.periods)} or (start, end).")
+            period = self.periods[period.lower()]
+        return pd.Timestamp(period[0]), pd.Timestamp(period[1])
+
+    def _formation_bounds(self, period):
+        """Formation date bounds of a period's pairs (None when pairs are not filtered by formation_date)"""
+        if period is None or 'formation_date' not in self.df_pairs.columns:
+            return None
+        return self.period_bounds(period)
+
+    def pair_screen_for(self, period=None):
+        """
+        PairScreen over the pairs of a period.
+
+        Like main.load_backtest_data, only pairs whose formation_date falls
+        in the period are kept (all pairs for period=None or without a
+        formation_date column).
+        """
+        bounds = self._formation_bounds(period)
+        if bounds not in self._pair_screens:
+            df_pairs = pairs_formed_between(self.df_pairs, *bounds)
+            self._pair_screens[bounds] = PairScreen(df_pairs)
+            logger.info("Pairs formed %s to %s: %d of %d", bounds[0].date(), bounds[1].date(), len(df_pairs),
+                        len(self.df_pairs))
+        return self._pair_screens[bounds]
+
+    def _cached(self, cache, key):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        return None
+
+    def _store(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def working_frame(self, hyperparams, period=None):
+        """
+        Engine working frame of a run's z-score column over a period (a row slice of the cached frame).
+
+        Returns (frame, (start_row, stop_row)).
+        """
+        z_col = zscore_column(hyperparams)
+        frame = self._cached(self._frames, z_col)
+        if frame is None:
+            frame = prepare_working_frame(self.df_main, hyperparams)
+            self._store(self._frames, z_col, frame)
+            logger.info("Prepared working frame for %s: %d rows", z_col, len(frame))
+        start, end = self.period_bounds(period)
+        dates = frame['date'].to_numpy()
+        rows = (int(np.searchsorted(dates, start.to_datetime64(), side='left')),
+                int(np.searchsorted(dates, end.to_datetime64(), side='right')))
+        return frame.iloc[rows[0]:rows[1]], rows
+
+    def engine(self, hyperparams, period=None, pair_universe=None, **engine_kwargs):
+        """BacktestEngine of a hyperparameter set over a period view (sink, checkpoint_dir, ... as keywords)"""
+        frame, _ = self.working_frame(hyperparams, period)
+        pair_screen = self.pair_screen_for(period)
+        if pair_universe is None:
+            pair_universe = pair_screen.universe(hyperparams['CORRELATION_THRESHOLD'],
+                                                 hyperparams['COINTEGRATION_THRESHOLD'])
+        engine_kwargs.setdefault('memory_limit', self.memory_limit)
+        engine_kwargs.setdefault('max_workers', self.max_workers)
+        return BacktestEngine(frame, pair_screen.df_pairs, hyperparams, quiet=self.quiet, pair_universe=pair_universe,
+                              prepared=True, **engine_kwargs)
+
+    def signal_generator(self, hyperparams, period=None, pair_filter=None, zscore_threshold=None):
+        """
+        Signals of a run over a period, for a pair filter and z-score threshold (the run's by default).
+
+        Served from the cached signals of the period and z-score column when
+        those cover the request (looser filter and threshold). Otherwise they
+        are precomputed at the loosest filter and threshold of the cache and
+        the request, and replace the cache entry.
+        """
+        if pair_filter is None:
+            pair_filter = (hyperparams['CORRELATION_THRESHOLD'], hyperparams['COINTEGRATION_THRESHOLD'])
+        pair_filter = tuple(pair_filter)
+        if zscore_threshold is None:
+            zscore_threshold = hyperparams['ZSCORE_THRESHOLD']
+        _, rows = self.working_frame(hyperparams, period)
+        pair_screen = self.pair_screen_for(period)
+        key = (zscore_column(hyperparams), rows, self._formation_bounds(period))
+
+        cached = self._cached(self._signals, key)
+        if cached is not None:
+            cached_filter, generator = cached
+            if PairScreen.loosest([cached_filter, pair_filter]) == cached_filter \
+                    and generator.zscore_threshold <= zscore_threshold:
+                if cached_filter == pair_filter and generator.zscore_threshold == zscore_threshold:
+                    return generator
+                return generator.subset(pair_screen.universe(*pair_filter), zscore_threshold)
+            pair_filter_to_compute = PairScreen.loosest([cached_filter, pair_filter])
+            threshold_to_compute = min(generator.zscore_threshold, zscore_threshold)
+        else:
+            pair_filter_to_compute, threshold_to_compute = pair_filter, zscore_threshold
+
+        loose_params = {**hyperparams, 'CORRELATION_THRESHOLD': pair_filter_to_compute[0],
+                        'COINTEGRATION_THRESHOLD': pair_filter_to_compute[1],
+                        'ZSCORE_THRESHOLD': threshold_to_compute}
+        generator = self.engine(loose_params, period).create_signal_generator(threshold_to_compute)
+        self._store(self._signals, key, (pair_filter_to_compute, generator))
+        if pair_filter_to_compute == pair_filter and threshold_to_compute == zscore_threshold:
+            return generator
+        return generator.subset(pair_screen.universe(*pair_filter), zscore_threshold)
+
+    def run(self, hyperparams, period=None, configs=None, **engine_kwargs):
+        """
+        Backtest a hyperparameter set over a period with the session's cached frames and signals.
+
+        With `configs` (overrides of SIMULATION_PARAMS, as for
+        BacktestEngine.run_backtest_batch) all configurations run as one batch
+        and a list of results is returned; otherwise the run_backtest result.
+        """
+        batch = [{}] if configs is None else configs
+        threshold = min({**hyperparams, **config}['ZSCORE_THRESHOLD'] for config in batch)
+        engine = self.engine(hyperparams, period, **engine_kwargs)
+        results = engine.run_backtest_batch(batch, self.signal_generator(hyperparams, period,
+                                                                         zscore_threshold=threshold))
+        return results[0] if configs is None else results
+
+    def run_grid(self, param_grid, period=None, output_file='backtest_results.csv', sink=None, checkpoint_dir=None,
+                 output_dir='.'):
+        """Grid search over a period on this session (see run_hyperparameter_grid_search)"""
+        from .grid_search import run_hyperparameter_grid_search
+        return run_hyperparameter_grid_search(None, None, param_grid, output_file, quiet=self.quiet, sink=sink,
+                                              checkpoint_dir=checkpoint_dir, session=self, period=period,
+                                              output_dir=output_dir)
+
+    def signal_quality(self, period=None, pair_filter=None, **kwargs):
+        """
+        SignalQuality pre-screen of the z-score columns over a period (see signal_quality.py).
+
+        `pair_filter` is a (CORRELATION_THRESHOLD, COINTEGRATION_THRESHOLD)
+        selection of the period's pairs (all of them by default); keywords go to
+        SignalQuality (max_holding_days, thresholds, ...).
+        """
+        from .signal_quality import SignalQuality
+        start, end = self.period_bounds(period)
+        dates = self.df_main['date']
+        pair_screen = self.pair_screen_for(period)
+        df_pairs = pair_screen.df_pairs if pair_filter is None else pair_screen.select(*pair_filter)
+        return SignalQuality(self.df_main[(dates >= start) & (dates <= end)], df_pairs, **kwargs)
+
+    def clear_cache(self):
+        """Drop the cached working frames and signals"""
+        self._frames.clear()
+        self._signals.clear()
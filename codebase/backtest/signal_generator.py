@@ -1,107 +1,110 @@
+import logging
+from functools import partial
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
+
+from .pair_universe import PairUniverse
+from .scheduler import MemoryScheduler, estimate_frame_bytes
+
+logger = logging.getLogger(__name__)
 
 class SignalGenerator:
-    def __init__(self, df_main, df_pairs, zscore_method='ou', zscore_threshold=1.5, horizon=5, lookback_period=20):
+    def __init__(self, df_main, df_pairs, zscore_method='ou', zscore_threshold=1.5, horizon=5, lookback_period=20,
+                 quiet=False, pair_universe=None):
         self.df_main = df_main
         self.df_pairs = df_pairs
+        # Shared pair index; built here if the caller did not provide one
+        self.pair_universe = pair_universe if pair_universe is not None else PairUniverse(df_pairs)
         self.zscore_method = zscore_method
         self.zscore_threshold = zscore_threshold
         self.lookback_period = lookback_period
         self.precomputed_signals = None
+        self._signal_rows_by_date = {}
         self.horizon = horizon
+        self.quiet = quiet
         
-        # Add diagnostic print
-        print(f"SignalGenerator initialized with {len(df_pairs)} pairs")
-        print(f"Z-score method: {zscore_method}, threshold: {zscore_threshold}, lookback: {lookback_period}")
+        logger.info("SignalGenerator initialized with %d pairs (method: %s, threshold: %s, lookback: %s)",
+                    len(df_pairs), zscore_method, zscore_threshold, lookback_period)
         
-        # Check sample z-score values
+        # Check the z-score column; its statistics are only computed when they will be logged
         z_col = f'z_{zscore_method}_{self.horizon}d_lb{lookback_period}'
-        if z_col in df_main.columns:
+        if z_col not in df_main.columns:
+            logger.warning("Z-score column '%s' not found in data!", z_col)
+        elif not quiet and logger.isEnabledFor(logging.DEBUG):
             z_values = df_main[z_col].dropna()
-            print(f"Z-score column '{z_col}' stats:")
-            print(f"  - Non-null values: {len(z_values)} out of {len(df_main)} ({len(z_values)/len(df_main)*100:.2f}%)")
-            print(f"  - Range: {z_values.min():.4f} to {z_values.max():.4f}")
-            print(f"  - Values exceeding threshold {zscore_threshold}: {(abs(z_values) >= zscore_threshold).sum()} ({(abs(z_values) >= zscore_threshold).sum()/len(z_values)*100:.2f}%)")
-        else:
-            print(f"WARNING: Z-score column '{z_col}' not found in data!")
+            exceeding = (abs(z_values) >= zscore_threshold).sum()
+            logger.debug("Z-score column '%s': %d non-null of %d (%.2f%%), range %.4f to %.4f, "
+                         "%d (%.2f%%) exceeding threshold %s",
+                         z_col, len(z_values), len(df_main), len(z_values) / max(len(df_main), 1) * 100,
+                         z_values.min(), z_values.max(), exceeding,
+                         exceeding / max(len(z_values), 1) * 100, zscore_threshold)
 
-    def precompute_signals_parallel(self, horizon=5, n_jobs=4):
-        """Precompute signals for all dates and pairs in parallel"""
+    def precompute_signals_parallel(self, horizon=5, n_jobs=None, scheduler=None):
+        """Precompute signals for all dates and pairs in parallel (n_jobs caps concurrency without a scheduler)"""
         z_col = f'z_{self.zscore_method}_{horizon}d_lb{self.lookback_period}'
-        print(f"Precomputing signals for z-score column: {z_col}")
+        logger.debug("Precomputing signals for z-score column: %s", z_col)
         
         # Verify z-score column exists
         if z_col not in self.df_main.columns:
-            print(f"ERROR: Z-score column '{z_col}' not found in data columns!")
-            print(f"Available columns: {self.df_main.columns}")
+            logger.error("Z-score column '%s' not found in data columns! Available columns: %s",
+                         z_col, list(self.df_main.columns))
             return
         
         # Group by group_id for efficient processing
-        group_ids = self.df_pairs['group_id'].unique()
-        print(f"Processing {len(group_ids)} unique group_ids")
-        
-        chunk_size = max(1, len(group_ids) // n_jobs)
-        chunked_groups = [group_ids[i:i + chunk_size] for i in range(0, len(group_ids), chunk_size)]
+        group_ids = self.pair_universe.group_ids
+        logger.debug("Processing %d unique group_ids", len(group_ids))
         
-        # Precompute group dictionaries
-        print("Building group dictionaries...")
+        # Precompute group dictionaries from one grouping pass over df_main
         group_df_main_dict = {}
+        if not {'permno', 'date', 'group_id'}.issubset(self.df_main.columns):
+            logger.warning("Missing required columns for group lookup")
+            group_rows = {}
+        else:
+            group_rows = self.df_main.groupby('group_id', observed=True, sort=False).indices
+        z_data = self.df_main[['permno', z_col, 'date']] if group_rows else None
         for group_id in group_ids:
-            group_data = self.df_main[self.df_main['group_id'] == group_id]
-            if 'permno' in group_data.columns and z_col in group_data.columns and 'date' in group_data.columns:
-                filtered_data = group_data[['permno', z_col, 'date']].dropna()
-                group_df_main_dict[group_id] = filtered_data
-                if len(filtered_data) < 10 and len(filtered_data) > 0:
-                    print(f"  Group {group_id}: Only {len(filtered_data)} records with valid z-scores")
-            else:
-                print(f"  WARNING: Missing required columns for group {group_id}")
-        
-        print(f"Created dictionaries for {len(group_df_main_dict)} groups")
-        
-        # Process chunks in parallel
-        all_results = []
-        signal_counts = []
-        
-        for chunk_idx, chunk in enumerate(chunked_groups):
-            # Process each group in parallel within the chunk
-            parallel_results = Parallel(n_jobs=n_jobs, prefer="threads")(
-                delayed(self._process_group_signal)(
-                    group_id,
-                    group_df_main_dict,
-                    self.df_pairs[self.df_pairs['group_id'] == group_id],
-                    z_col,
-                    self.zscore_threshold,
-                    horizon
-                )
-                for group_id in chunk
-            )
-            
-            # Count signals in this chunk
-            chunk_signals = 0
-            # Append non-empty results
-            for df in parallel_results:
-                if not df.empty:
-                    all_results.append(df)
-                    chunk_signals += len(df)
-            
-            signal_counts.append(chunk_signals)
-            print(f"Chunk {chunk_idx+1}: Generated {chunk_signals} signals")
+            rows = group_rows.get(group_id)
+            if rows is None:
+                continue
+            filtered_data = z_data.iloc[rows].dropna()
+            group_df_main_dict[group_id] = filtered_data
+            if len(filtered_data) < 10 and len(filtered_data) > 0:
+                logger.debug("Group %s: Only %d records with valid z-scores", group_id, len(filtered_data))
+        
+        logger.debug("Created dictionaries for %d groups", len(group_df_main_dict))
+        
+        # Process groups in parallel, as many at once as the scheduler's memory ceiling allows
+        if scheduler is None:
+            scheduler = MemoryScheduler(max_workers=n_jobs)
+        process_group = partial(self._process_group_signal, group_df_main_dict=group_df_main_dict, z_col=z_col,
+                                zscore_threshold=self.zscore_threshold, horizon=horizon)
+        tasks = [(group_id, self.pair_universe.group_pairs(group_id)) for group_id in group_ids]
+        # A group's candidate rows are its pairs times its dates (rows / members)
+        estimates = [estimate_frame_bytes(len(pairs) * len(group_df_main_dict.get(group_id, ()))
+                                          / max(len(self.pair_universe.group_members(group_id)), 1),
+                                          z_data.dtypes) if z_data is not None else 0
+                     for group_id, pairs in tasks]
+        parallel_results = scheduler.map(lambda task: process_group(task[0], df_pairs_group=task[1]), tasks,
+                                         estimates)
+        
+        # Append non-empty results
+        all_results = [df for df in parallel_results if not df.empty]
         
         # Concatenate results
         if all_results:
             self.precomputed_signals = pd.concat(all_results).reset_index(drop=True)
-            print(f"Total signals generated: {len(self.precomputed_signals)}")
-            print(f"Signals span {self.precomputed_signals['date'].nunique()} unique trading days")
+            self._index_signals()
+            logger.info("Total signals generated: %d", len(self.precomputed_signals))
             
-            # Distribution of signals
-            if len(self.precomputed_signals) > 0:
-                signal_counts = self.precomputed_signals['signal'].value_counts()
-                print(f"Signal distribution: {dict(signal_counts)}")
+            # Span and distribution of signals are only computed when logged
+            if not self.quiet and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Signals span %d unique trading days; distribution: %s",
+                             self.precomputed_signals['date'].nunique(),
+                             dict(self.precomputed_signals['signal'].value_counts()))
         else:
-            print("WARNING: No signals were generated!")
+            logger.warning("No signals were generated!")
             self.precomputed_signals = pd.DataFrame()
+            self._signal_rows_by_date = {}
 
     def _process_group_signal(self, group_id, group_df_main_dict, df_pairs_group, z_col, zscore_threshold, horizon):
         """Process signals for a specific group (used for parallel processing)"""
@@ -127,6 +130,8 @@ class SignalGenerator:
         
         for i in range(0, len(df_pairs_group), chunk_size):
             df_chunk = df_pairs_group.iloc[i:i+chunk_size].copy()
+            # Position in the pair universe, so signals can be re-filtered per pair selection
+            df_chunk['pair_id'] = df_chunk.index.to_numpy()
             
             # Map z-scores efficiently
             df_chunk['z_black'] = df_chunk['permno_black'].map(z_map)
@@ -179,17 +184,81 @@ class SignalGenerator:
         result_df = pd.concat(results)
         return result_df
 
+    def _index_signals(self):
+        """Index precomputed signal rows by date so daily lookups do not scan the frame"""
+        self._signal_rows_by_date = self.precomputed_signals.groupby('date', sort=False).indices
+
+    def subset(self, pair_universe=None, zscore_threshold=None):
+        """
+        Signals for a stricter pair selection and/or z-score threshold, without recomputing them.
+
+        `pair_universe` must select a subset of this generator's pairs (from
+        the same pair table) and `zscore_threshold` must not be looser than
+        this generator's. The result holds exactly the signals a generator
+        precomputed directly with those settings would hold, in the same
+        per-date order.
+        """
+        pair_universe = self.pair_universe if pair_universe is None else pair_universe
+        zscore_threshold = self.zscore_threshold if zscore_threshold is None else zscore_threshold
+        if zscore_threshold < self.zscore_threshold:
+            raise ValueError(f"Cannot derive signals for threshold {zscore_threshold} from threshold "
+                             f"{self.zscore_threshold}")
+        
+        subset = SignalGenerator(self.df_main, pair_universe.pairs, zscore_method=self.zscore_method,
+                                 zscore_threshold=zscore_threshold, horizon=self.horizon,
+                                 lookback_period=self.lookback_period, quiet=True, pair_universe=pair_universe)
+        if self.precomputed_signals is None or self.precomputed_signals.empty:
+            subset.precomputed_signals = self.precomputed_signals
+            return subset
+        
+        # Map every signal to its pair in the new universe and drop pairs or z-diffs that do not pass
+        signals = self.precomputed_signals
+        pair_ids = pair_universe.pair_ids_for_labels(self.pair_universe.source_index[signals['pair_id'].to_numpy()])
+        z_diff = signals['z_diff'].to_numpy()
+        keep = (pair_ids >= 0) & ((z_diff >= zscore_threshold) | (z_diff <= -zscore_threshold))
+        
+        # Daily signals are ordered by pair id, as precompute_signals_parallel produces them
+        order = np.argsort(pair_ids[keep], kind='stable')
+        subset.precomputed_signals = signals[keep].iloc[order].reset_index(drop=True)
+        subset.precomputed_signals['pair_id'] = pair_ids[keep][order]
+        subset._index_signals()
+        return subset
+
+    def generate_signals_for_thresholds(self, date, thresholds):
+        """Signals for a date at several z-score thresholds (none looser than this generator's)"""
+        if self.precomputed_signals is None or self.precomputed_signals.empty:
+            return [[] for _ in thresholds]
+
+        rows = self._signal_rows_by_date.get(pd.Timestamp(date))
+        if rows is None:
+            return [[] for _ in thresholds]
+        signals_today = self.precomputed_signals.iloc[rows]
+        
+        records = signals_today[['date', 'group_id', 'permno_black', 'permno_white', 'signal', 'z_diff',
+                                 'zscore_method', 'horizon', 'lookback']].to_dict('records')
+        
+        # Same comparison as precompute_signals_parallel, on the stored z_diff dtype
+        z_diff = signals_today['z_diff'].to_numpy()
+        results = []
+        for threshold in thresholds:
+            if threshold == self.zscore_threshold:
+                results.append(records)
+            else:
+                passes = (z_diff >= threshold) | (z_diff <= -threshold)
+                results.append([record for record, keep in zip(records, passes) if keep])
+        return results
+
     def generate_signals(self, date):
         """Get signals for a specific date"""
         if self.precomputed_signals is None or self.precomputed_signals.empty:
             return []
 
-        signals_today = self.precomputed_signals[self.precomputed_signals['date'] == date]
-        
-        if signals_today.empty:
+        rows = self._signal_rows_by_date.get(pd.Timestamp(date))
+        if rows is None:
             return []
+        signals_today = self.precomputed_signals.iloc[rows]
         
-        result = signals_today[['date', 'permno_black', 'permno_white', 'signal', 'z_diff', 
+        result = signals_today[['date', 'group_id', 'permno_black', 'permno_white', 'signal', 'z_diff',
                                'zscore_method', 'horizon', 'lookback']].to_dict('records')
         
         return result
\ No newline at end of file
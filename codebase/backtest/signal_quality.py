@@ -0,0 +1,421 @@
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import BASE_COLUMNS, prepare_working_frame
+from .pair_universe import PairUniverse
+from .scheduler import MemoryScheduler
+from .schema import quarter_codes, quarter_label
+from .signal_generator import SignalGenerator
+from .spreads import _last_valid, pair_columns
+
+logger = logging.getLogger(__name__)
+
+# Z-score columns of the backtest data, e.g. z_classical_10d_lb10
+ZSCORE_PATTERN = re.compile(r'^z_(?P<method>[a-z]+)_(?P<horizon>\d+)d_lb(?P<lookback>\d+)$')
+
+DEFAULT_THRESHOLDS = (1.0, 1.5, 2.0, 2.5, 3.0)
+
+# Dates with fewer pairs than this get no information coefficient
+MIN_IC_PAIRS = 10
+
+
+def zscore_columns(columns):
+    """Z-score columns among `columns` (names matching ZSCORE_PATTERN), in their order"""
+    return [col for col in columns if ZSCORE_PATTERN.match(col)]
+
+
+def _row_order(values):
+    """Per-row argsort of a matrix, NaNs last"""
+    return np.argsort(np.where(np.isnan(values), np.inf, values), axis=1)
+
+
+def _valid_ranks(order, valid):
+    """Rank of every entry among the valid entries of its row, from the row order of the values"""
+    ranks = np.empty(order.shape, dtype=np.float64)
+    np.put_along_axis(ranks, order, np.cumsum(np.take_along_axis(valid, order, axis=1), axis=1), axis=1)
+    return ranks
+
+
+def _rank_ic(signal_order, signal, returns):
+    """
+    Spearman correlation of every row of signal and returns, over the pairs where both are finite.
+
+    `signal_order` is _row_order(signal), computed once for all horizons.
+    Ties are ranked arbitrarily, which is immaterial for continuous data.
+    """
+    valid = np.isfinite(signal) & np.isfinite(returns)
+    # Valid entries rank 1..n in both, so the no-ties formula applies
+    d = np.where(valid, _valid_ranks(signal_order, valid) - _valid_ranks(_row_order(returns), valid), 0)
+    n = valid.sum(axis=1).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ic = 1 - 6 * (d ** 2).sum(axis=1) / (n * (n ** 2 - 1))
+    return np.where(n >= MIN_IC_PAIRS, ic, np.nan)
+
+
+def _threshold_sums(levels, values, n_thresholds):
+    """(count, hits, sum) of the finite values passing each threshold, from each value's number of thresholds passed"""
+    finite = np.isfinite(values)
+    levels, values = levels[finite], values[finite]
+    sums = []
+    for weights in (None, (values > 0).astype(np.float64), values):
+        per_level = np.bincount(levels, weights=weights, minlength=n_thresholds + 1)
+        # A value passing k thresholds counts for the first k of them
+        sums.append(per_level[::-1].cumsum()[::-1][1:])
+    return np.array(sums)
+
+
+def _quarter_stats(z, log_prices, rows, black, white, z0, max_holding_days, thresholds):
+    """
+    IC and hit-rate sums of one quarter's signals.
+
+    `rows`, `black` and `white` locate every signal's date and legs in the
+    quarter's (date x permno) z and log price matrices, and `z0` is its
+    z_diff. Exits follow the PortfolioManager rules on the day's
+    z_black - z_white, and positions still open are liquidated on the
+    quarter's last date, where none open.
+    """
+    n_dates, n_thresholds = len(z), len(thresholds)
+    last = n_dates - 1
+    order = np.argsort(rows, kind='stable')
+    rows, black, white, z0 = rows[order], black[order], white[order], z0[order]
+    s0 = log_prices[rows, black] - log_prices[rows, white]
+    side = -np.sign(z0)
+    levels = np.searchsorted(thresholds, np.abs(z0), side='right')
+
+    # The day's signals side by side, one row per date, for the daily IC
+    counts = np.bincount(rows, minlength=n_dates)
+    slots = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    signal = np.full((n_dates, counts.max(initial=0)), np.nan)
+    signal[rows, slots] = -z0
+    signal_order = _row_order(signal)
+
+    ic = []
+    horizon_sums = np.zeros((max_holding_days, 3, n_thresholds))
+    exit_return = np.full(len(rows), np.nan)
+    holding_days = np.zeros(len(rows))
+    is_open = np.isfinite(s0) & (rows < last)
+    for h in range(1, max_holding_days + 1):
+        within = rows + h <= last
+        current = np.minimum(rows + h, last)
+        change = np.where(within, log_prices[current, black] - log_prices[current, white] - s0, np.nan)
+        returns = np.full(signal.shape, np.nan)
+        returns[rows, slots] = change
+        ic.append(_rank_ic(signal_order, signal, returns))
+
+        forward = side * change
+        horizon_sums[h - 1] = _threshold_sums(levels, forward, n_thresholds)
+
+        # Without both legs' z or prices on the day, the position is kept
+        z_h = z[current, black] - z[current, white]
+        with np.errstate(invalid='ignore'):
+            reverted = np.where(z0 > 0, z_h <= 0, z_h >= 0)
+        close = is_open & np.isfinite(forward) & np.isfinite(z_h) & (reverted | (h == max_holding_days))
+        exit_return[close] = forward[close]
+        holding_days[close] = h
+        is_open &= ~close
+
+    # Positions still open are liquidated at each leg's last price of the quarter
+    if is_open.any():
+        last_log_prices = _last_valid(log_prices, 1)[0]
+        last_spread = last_log_prices[black[is_open]] - last_log_prices[white[is_open]]
+        exit_return[is_open] = side[is_open] * (last_spread - s0[is_open])
+        holding_days[is_open] = last - rows[is_open]
+
+    exit_sums = _threshold_sums(levels, exit_return, n_thresholds)
+    holding_sums = np.bincount(levels[np.isfinite(exit_return)], weights=holding_days[np.isfinite(exit_return)],
+                               minlength=n_thresholds + 1)[::-1].cumsum()[::-1][1:]
+    return {
+        'ic': ic,
+        'n_obs': len(rows),
+        'horizon_sums': horizon_sums,
+        'exit_sums': exit_sums,
+        'holding_sums': holding_sums,
+    }
+
+
+class SignalQuality:
+    """
+    Portfolio-free quality of z-score signals: information coefficient and forward spread hit rates.
+
+    A fast pre-screen for z-score variants (ZSCORE_METHOD, HORIZON,
+    LOOKBACK_PERIOD) before any BacktestEngine run. The signals are exactly
+    the precomputed signals of the SignalGenerator a run of the variant
+    would build, at the loosest threshold, reproduced with array operations
+    (`generator_signals` runs the generator itself, as a reference). For
+    every (pair, date) signal it
+    measures the forward log spread return log(P_black / P_white) over
+    1..max_holding_days, signed in the trade's direction, so a positive
+    return is a profitable trade before costs. Prices and daily z-scores
+    are laid out once as (date x permno) matrices per calendar quarter
+    (positions never outlive a quarter).
+
+    Per variant, `evaluate` reports:
+
+    - the mean daily rank IC of -z_diff against the h-day forward return
+      (positive when wide spreads revert), with its t-statistic;
+    - per threshold and horizon, the number of signals, the hit rate
+      (share of positive forward returns) and the mean forward return;
+    - per threshold, the same at the exit of the simulator's rules (the
+      day's z_diff crossing zero, MAX_HOLDING_DAYS or the quarter's end),
+      which approximates the trades a run would make if every signal were
+      taken.
+
+    Rows count as the engine's working frame does: complete in the base
+    columns, the z-score column and its future_cumret column.
+
+    Parameters:
+    -----------
+    df_main : pandas DataFrame
+        Backtest data with the z-score columns to evaluate
+    df_pairs : pandas DataFrame
+        Pairs (group_id, permno_black/permno_white or permno_1/permno_2), already filtered as wanted
+    max_holding_days : int
+        Longest forward horizon, and the exit rule's MAX_HOLDING_DAYS
+    thresholds : sequence of float
+        Z-score thresholds to report hit rates for
+    memory_limit, max_workers
+        MemoryScheduler settings of `rank`
+    """
+
+    def __init__(self, df_main, df_pairs, max_holding_days=10, thresholds=DEFAULT_THRESHOLDS, memory_limit=None,
+                 max_workers=None):
+        if 'permno_1' in df_pairs.columns and 'permno_2' in df_pairs.columns:
+            df_pairs = df_pairs.rename(columns={'permno_1': 'permno_black', 'permno_2': 'permno_white'})
+        self.df_main = df_main
+        self.pair_universe = PairUniverse(df_pairs)
+        self.max_holding_days = max_holding_days
+        self.thresholds = np.sort(np.asarray(thresholds, dtype=np.float64))
+        self.memory_limit = memory_limit
+        self.max_workers = max_workers
+
+        base = df_main[[col for col in BASE_COLUMNS if col in df_main.columns]]
+        valid = base.notna().all(axis=1)
+        numeric_cols = base.select_dtypes(include='number').columns
+        if len(numeric_cols) > 0:
+            valid &= np.isfinite(base[numeric_cols]).all(axis=1)
+        prices = df_main['adj_prc'].to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._log_prices = np.where(prices > 0, np.log(prices), np.nan)
+        self._valid = valid.to_numpy()
+
+        self.dates, date_codes = np.unique(pd.to_datetime(df_main['date']).to_numpy(), return_inverse=True)
+        self.permnos, self._permno_codes = np.unique(df_main['permno'].to_numpy(dtype=np.int64),
+                                                     return_inverse=True)
+        # Rows in date order, so every quarter is one slice of it
+        self._order = np.argsort(date_codes, kind='stable')
+        self._date_codes = date_codes[self._order]
+
+        # Pair universe group of every row (-1 outside it), and every pair's group and leg columns
+        self._row_groups = pd.Index(self.pair_universe.group_ids).get_indexer(np.asarray(df_main['group_id']))
+        self._pair_groups = self.pair_universe.pair_group_codes
+        pairs = self.pair_universe.pairs
+        self._black = pair_columns(self.permnos, pairs['permno_black'].to_numpy(dtype=np.int64))
+        self._white = pair_columns(self.permnos, pairs['permno_white'].to_numpy(dtype=np.int64))
+        # Most signals a variant can have: every pair on every date its group has rows
+        in_groups = self._valid & (self._row_groups >= 0)
+        group_dates = np.unique(self._row_groups[in_groups].astype(np.int64) * len(self.dates) + date_codes[in_groups])
+        self._max_signals = int(np.bincount(group_dates // max(len(self.dates), 1),
+                                            minlength=len(self.pair_universe.group_ids))[self._pair_groups].sum())
+
+        # Per quarter: its date codes and row slice
+        self._quarters = []
+        codes = quarter_codes(self.dates)
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(self.dates)]):
+            lo, hi = np.searchsorted(self._date_codes, [start, stop])
+            self._quarters.append({'quarter': quarter_label(codes[start]), 'dates': (start, stop), 'rows': (lo, hi)})
+        logger.info("SignalQuality: %d dates, %d stocks, %d pairs in %d quarters", len(self.dates),
+                    len(self.permnos), len(df_pairs), len(self._quarters))
+
+    def _matrices(self, quarter, values, valid):
+        """(z, log price) matrices of a quarter's valid rows, with an empty last column for absent legs"""
+        lo, hi = quarter['rows']
+        positions = np.arange(lo, hi)[valid[self._order[lo:hi]]]
+        rows = self._order[positions]
+        start, stop = quarter['dates']
+        cells = (self._date_codes[positions] - start, self._permno_codes[rows])
+        shape = (stop - start, len(self.permnos) + 1)
+        z, log_prices = np.full(shape, np.nan), np.full(shape, np.nan)
+        z[cells], log_prices[cells] = values[rows], self._log_prices[rows]
+        return z, log_prices
+
+    def _hyperparams(self, z_col):
+        """ZSCORE_METHOD, HORIZON and LOOKBACK_PERIOD of a z-score column name"""
+        match = ZSCORE_PATTERN.match(z_col)
+        if match is None:
+            raise ValueError(f"{z_col!r} is not a z-score column (z_<method>_<horizon>d_lb<lookback>)")
+        return {'ZSCORE_METHOD': match['method'], 'HORIZON': int(match['horizon']),
+                'LOOKBACK_PERIOD': int(match['lookback'])}
+
+    def _z_values(self, z_col):
+        """Float32 z-scores (as the working frame holds them) and the rows a run's working frame keeps"""
+        values = self.df_main[z_col].to_numpy(dtype=np.float32)
+        valid = self._valid & np.isfinite(values)
+        future_return_col = f"future_cumret_{self._hyperparams(z_col)['HORIZON']}d"
+        if future_return_col in self.df_main.columns:
+            valid &= np.isfinite(self.df_main[future_return_col].to_numpy(dtype=np.float64))
+        return values, valid
+
+    def _signal_arrays(self, values, valid):
+        """
+        (date code, pair, z_diff) of every signal SignalGenerator precomputes at the loosest threshold.
+
+        The generator's rules, as array operations over the valid rows: a
+        pair's z_diff is the difference of its legs' last z-scores among its
+        group's rows (in date order), and a pair passing the threshold
+        signals on every date its group has rows.
+        """
+        positions = np.flatnonzero(valid[self._order] & (self._row_groups[self._order] >= 0))
+        rows = self._order[positions]
+        groups, dates = self._row_groups[rows], self._date_codes[positions]
+
+        # Last z-score of every (group, stock), from the rows in reverse date order
+        n_columns = len(self.permnos) + 1
+        member_keys, last = np.unique((groups * n_columns + self._permno_codes[rows])[::-1], return_index=True)
+        last_z = values[rows][::-1][last]
+
+        def leg_z(columns):
+            keys = self._pair_groups.astype(np.int64) * n_columns + columns
+            found = np.searchsorted(member_keys, keys)
+            present = found < len(member_keys)
+            present[present] = member_keys[found[present]] == keys[present]
+            z = np.full(len(keys), np.nan, dtype=np.float32)
+            z[present] = last_z[found[present]]
+            return z
+
+        # Same float32 z_diff and threshold comparison as the generator
+        z_diff = leg_z(self._black) - leg_z(self._white)
+        threshold = float(self.thresholds[0])
+        with np.errstate(invalid='ignore'):
+            signalling = np.flatnonzero((z_diff >= threshold) | (z_diff <= -threshold))
+
+        # Every signalling pair on each of its group's dates (group dates as CSR runs)
+        group_dates = np.unique(groups.astype(np.int64) * len(self.dates) + dates)
+        counts = np.bincount(group_dates // len(self.dates), minlength=len(self.pair_universe.group_ids))
+        offsets = np.cumsum(counts) - counts
+        repeats = counts[self._pair_groups[signalling]]
+        block_starts = np.cumsum(repeats) - repeats
+        cells = np.repeat(offsets[self._pair_groups[signalling]] - block_starts, repeats) + np.arange(repeats.sum())
+        pair_ids = np.repeat(signalling, repeats)
+        return group_dates[cells] % len(self.dates), pair_ids, z_diff[pair_ids]
+
+    def signals(self, z_col):
+        """
+        Signals of a z-score column at the loosest threshold, as SignalGenerator precomputes them.
+
+        One row per (date, pair): date, group_id, permno_black,
+        permno_white and z_diff (the generator's float32 value).
+        """
+        date_codes, pair_ids, z_diff = self._signal_arrays(*self._z_values(z_col))
+        pairs = self.pair_universe.pairs
+        return pd.DataFrame({
+            'date': self.dates[date_codes],
+            'group_id': pairs['group_id'].to_numpy()[pair_ids],
+            'permno_black': pairs['permno_black'].to_numpy()[pair_ids],
+            'permno_white': pairs['permno_white'].to_numpy()[pair_ids],
+            'z_diff': z_diff,
+        })
+
+    def generator_signals(self, z_col):
+        """Precomputed signals of the SignalGenerator a run would build (the reference `signals` reproduces)"""
+        hyperparams = self._hyperparams(z_col)
+        generator = SignalGenerator(prepare_working_frame(self.df_main, hyperparams), self.pair_universe.pairs,
+                                    zscore_method=hyperparams['ZSCORE_METHOD'],
+                                    zscore_threshold=float(self.thresholds[0]), horizon=hyperparams['HORIZON'],
+                                    lookback_period=hyperparams['LOOKBACK_PERIOD'], quiet=True,
+                                    pair_universe=self.pair_universe)
+        # Already one task of `rank`'s scheduler
+        generator.precompute_signals_parallel(horizon=hyperparams['HORIZON'], scheduler=MemoryScheduler(max_workers=1))
+        return generator.precomputed_signals
+
+    def evaluate(self, z_col):
+        """
+        IC, per-horizon and exit hit rates of one z-score column.
+
+        Returns a dict with 'ic' (per horizon: ic, ic_std, ic_tstat,
+        n_dates), 'hit_rates' (per threshold and horizon: n_signals,
+        hit_rate, mean_return), 'exit' (per threshold: n_signals, hit_rate,
+        mean_return, mean_holding_days) and 'summary' (one row for `rank`).
+        """
+        values, valid = self._z_values(z_col)
+        date_codes, pair_ids, z_diff = self._signal_arrays(values, valid)
+        black, white, z_diff = self._black[pair_ids], self._white[pair_ids], z_diff.astype(np.float64)
+        # Daily z-scores for the exit rule
+        values = values.astype(np.float64)
+
+        stats = []
+        for quarter in self._quarters:
+            start, stop = quarter['dates']
+            selected = (date_codes >= start) & (date_codes < stop)
+            if not selected.any():
+                continue
+            z, log_prices = self._matrices(quarter, values, valid)
+            stats.append(_quarter_stats(z, log_prices, date_codes[selected] - start, black[selected],
+                                        white[selected], z_diff[selected], self.max_holding_days, self.thresholds))
+        return self._combine(z_col, stats)
+
+    def _combine(self, z_col, stats):
+        horizons = np.arange(1, self.max_holding_days + 1)
+        ic_rows = []
+        for k in range(self.max_holding_days):
+            daily = np.concatenate([s['ic'][k] for s in stats]) if stats else np.array([])
+            daily = daily[np.isfinite(daily)]
+            mean, std = (daily.mean(), daily.std(ddof=1)) if len(daily) > 1 else (np.nan, np.nan)
+            ic_rows.append({'ic': mean, 'ic_std': std, 'ic_tstat': mean / std * np.sqrt(len(daily)) if std else np.nan,
+                            'n_dates': len(daily)})
+        ic = pd.DataFrame(ic_rows, index=pd.Index(horizons, name='horizon'))
+
+        n_thresholds = len(self.thresholds)
+        horizon_sums = sum((s['horizon_sums'] for s in stats), np.zeros((self.max_holding_days, 3, n_thresholds)))
+        exit_sums = sum((s['exit_sums'] for s in stats), np.zeros((3, n_thresholds)))
+        holding_sums = sum((s['holding_sums'] for s in stats), np.zeros(n_thresholds))
+
+        def rates(sums):
+            count, hits, total = sums
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return {'n_signals': count.astype(np.int64), 'hit_rate': hits / count, 'mean_return': total / count}
+
+        hit_rates = pd.concat([pd.DataFrame({'threshold': self.thresholds, 'horizon': h, **rates(horizon_sums[h - 1])})
+                               for h in horizons], ignore_index=True)
+        exit_rates = rates(exit_sums)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            exit_rates['mean_holding_days'] = holding_sums / exit_sums[0]
+        exit_table = pd.DataFrame({'threshold': self.thresholds, **exit_rates})
+
+        summary = {
+            'z_col': z_col,
+            **self._hyperparams(z_col),
+            'n_obs': sum(s['n_obs'] for s in stats),
+            'ic_1d': ic['ic'].iloc[0],
+            'ic': ic['ic'].iloc[-1],
+            'ic_tstat': ic['ic_tstat'].iloc[-1],
+        }
+        for row in exit_table.itertuples(index=False):
+            summary[f'n_signals_{row.threshold:g}'] = row.n_signals
+            summary[f'hit_rate_{row.threshold:g}'] = row.hit_rate
+            summary[f'mean_return_{row.threshold:g}'] = row.mean_return
+        return {'ic': ic, 'hit_rates': hit_rates, 'exit': exit_table, 'summary': summary}
+
+    def rank(self, z_cols=None, metric='ic'):
+        """
+        Summaries of many z-score columns (all of df_main's by default), best `metric` first.
+
+        Columns are evaluated on threads of a MemoryScheduler. The
+        ZSCORE_METHOD, HORIZON and LOOKBACK_PERIOD columns of the result
+        plug straight into a param_grid.
+        """
+        z_cols = zscore_columns(self.df_main.columns) if z_cols is None else list(z_cols)
+        # A task holds its per-row arrays, one quarter's two (date x permno) matrices and at most one
+        # signal per pair and group date
+        quarter_dates = max((q['dates'][1] - q['dates'][0] for q in self._quarters), default=0)
+        task_bytes = (len(self.df_main) * 32 + 2 * quarter_dates * (len(self.permnos) + 1) * 8
+                      + self._max_signals * 8 * 8)
+        scheduler = MemoryScheduler(memory_limit=self.memory_limit, max_workers=self.max_workers)
+        results = scheduler.map(lambda z_col: self.evaluate(z_col)['summary'], z_cols, [task_bytes] * len(z_cols))
+        ranking = pd.DataFrame(results)
+        if ranking.empty:
+            return ranking
+        return ranking.sort_values(metric, ascending=False, na_position='last').reset_index(drop=True)
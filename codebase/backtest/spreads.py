@@ -0,0 +1,194 @@
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .streaming import PARTITION_PREFIX, QuarterStore, _quarter_labels
+
+logger = logging.getLogger(__name__)
+
+# Spread observations (before the quarter) the OU parameters of a quarter are fitted on
+OU_WINDOW = 30
+
+# Pairs whose fitted half-life exceeds this (in trading days) get no OU parameters
+MAX_HALF_LIFE = 20
+
+OU_COLUMNS = ['group_id', 'permno_1', 'permno_2', 'quarter', 'theta', 'mu', 'half_life']
+
+
+def _trading_quarters(group_ids):
+    """Quarter each group trades in ('2022Q1' for '2021-Q4-00'): the one after its formation quarter"""
+    formation = pd.Series(np.asarray(group_ids)).astype(str).str.extract(r'^(\d{4})-(Q[1-4])')
+    return (pd.PeriodIndex(formation[0] + formation[1], freq='Q') + 1).astype(str).to_numpy()
+
+
+def pair_index(df_pairs):
+    """Unique (permno_1, permno_2) pairs of a pair table, as two int64 arrays"""
+    pairs = df_pairs[['permno_1', 'permno_2']].drop_duplicates()
+    return pairs['permno_1'].to_numpy(dtype=np.int64), pairs['permno_2'].to_numpy(dtype=np.int64)
+
+
+def price_matrix(df, value='adj_prc'):
+    """
+    Dense (date x permno) matrix of a long price frame.
+
+    Returns (dates, permnos, matrix) with sorted dates and permnos and NaN
+    where a stock has no price on a date.
+    """
+    dates, date_codes = np.unique(df['date'].to_numpy(), return_inverse=True)
+    permnos, permno_codes = np.unique(df['permno'].to_numpy(dtype=np.int64), return_inverse=True)
+    matrix = np.full((len(dates), len(permnos)), np.nan)
+    matrix[date_codes, permno_codes] = df[value].to_numpy(dtype=np.float64)
+    return dates, permnos, matrix
+
+
+def pair_columns(permnos, pair_permnos):
+    """Column of every pair leg in a (date x permno) matrix; len(permnos) for stocks not in it"""
+    codes = np.minimum(np.searchsorted(permnos, pair_permnos), len(permnos) - 1)
+    return np.where(permnos[codes] == pair_permnos, codes, len(permnos))
+
+
+def pair_spreads(permnos, prices, permnos_1, permnos_2):
+    """Spreads (price_1 - price_2) of every pair as a (date x pair) matrix, by column index arithmetic"""
+    # Stocks without prices this quarter map to an all-NaN column
+    padded = np.hstack([prices, np.full((len(prices), 1), np.nan)])
+    return padded[:, pair_columns(permnos, permnos_1)] - padded[:, pair_columns(permnos, permnos_2)]
+
+
+def fit_ou(windows, max_half_life=MAX_HALF_LIFE):
+    """
+    OU parameters of many spread windows at once (one window per row).
+
+    Fits x_t = c + beta * x_{t-1} by least squares on every row, as the
+    notebook's per-pair lstsq does, with closed-form centered sums. Rows
+    with a beta outside (0, 1), a constant lag or a half-life above
+    max_half_life get NaN.
+
+    Returns (theta, mu, half_life) arrays, with theta = -ln(beta),
+    mu = c / (1 - beta) and half_life = ln(2) / theta.
+    """
+    lag, current = windows[:, :-1], windows[:, 1:]
+    lag_dev = lag - lag.mean(axis=1, keepdims=True)
+    current_mean = current.mean(axis=1)
+    lag_var = (lag_dev ** 2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = (lag_dev * (current - current_mean[:, None])).sum(axis=1) / lag_var
+        c = current_mean - beta * lag.mean(axis=1)
+        valid = (lag_var > 0) & (beta > 0) & (beta < 1)
+        theta = np.where(valid, -np.log(beta), np.nan)
+        half_life = np.log(2) / theta
+        valid &= half_life <= max_half_life
+        mu = c / (1 - beta)
+    return np.where(valid, theta, np.nan), np.where(valid, mu, np.nan), np.where(valid, half_life, np.nan)
+
+
+def _last_valid(values, n):
+    """Last n non-NaN values of every column (oldest first, NaN-padded at the top when fewer)"""
+    valid = ~np.isnan(values)
+    # Invalid entries sort first, valid ones keep their row order
+    order = np.argsort(np.where(valid, np.arange(1, len(values) + 1)[:, None], 0), axis=0, kind='stable')
+    return np.take_along_axis(values, order, axis=0)[-n:]
+
+
+def _iter_price_quarters(prices):
+    """(label, frame) of every calendar quarter of a QuarterStore, store directory or long price frame"""
+    if isinstance(prices, pd.DataFrame):
+        prices = prices[['date', 'permno', 'adj_prc']].copy()
+        prices['date'] = pd.to_datetime(prices['date'])
+        yield from prices.groupby(_quarter_labels(prices['date']), sort=True)
+        return
+    store = prices if isinstance(prices, QuarterStore) else QuarterStore(prices)
+    yield from store.iter_quarters(columns=['date', 'permno', 'adj_prc'])
+
+
+def build_pair_spreads(prices, df_pairs, output_dir, window=OU_WINDOW, max_half_life=MAX_HALF_LIFE,
+                       overwrite=False):
+    """
+    Compute all pair spreads and per-quarter OU parameters in one pass over the quarters.
+
+    Every quarter's prices become a (date x permno) matrix and the spreads of
+    all pairs are taken at once by column index arithmetic. The spreads go
+    straight to a quarter-partitioned Parquet store (`output_dir/spreads`,
+    long format: date, permno_1, permno_2, spread; readable with
+    QuarterStore). The last `window` valid spreads of every pair are carried
+    from quarter to quarter, so the OU parameters of a quarter are fitted
+    (fit_ou) on the `window` spreads before it, like the notebook, without
+    re-reading earlier quarters.
+
+    Parameters:
+    -----------
+    prices : QuarterStore, str or pandas DataFrame
+        Daily prices (date, permno, adj_prc): a quarter store, its directory,
+        or a long frame such as df_merged
+    df_pairs : pandas DataFrame
+        Pair table with group_id, permno_1 and permno_2
+    output_dir : str
+        Receives the spreads store and ou_params.parquet
+    window : int
+        Spread observations the OU parameters are fitted on
+    max_half_life : float
+        Largest half-life (in days) kept
+    overwrite : bool
+        Replace an existing output_dir
+
+    Returns:
+    --------
+    pandas DataFrame : OU parameters (group_id, permno_1, permno_2, quarter,
+        theta, mu, half_life) of every pair table entry with spreads and a
+        valid fit in the quarter its group trades in (the quarter after the
+        group_id's formation quarter), also written to output_dir/ou_params.parquet
+    """
+    if os.path.exists(output_dir):
+        if not overwrite:
+            raise FileExistsError(f"Output {output_dir} already exists; pass overwrite=True to replace it")
+        shutil.rmtree(output_dir)
+    spreads_dir = os.path.join(output_dir, 'spreads')
+    os.makedirs(spreads_dir)
+
+    permnos_1, permnos_2 = pair_index(df_pairs)
+    # Last `window` valid spreads of every pair so far (oldest first, NaN-padded)
+    history = np.full((window, len(permnos_1)), np.nan)
+    ou_frames = []
+
+    for label, quarter_df in _iter_price_quarters(prices):
+        dates, permnos, matrix = price_matrix(quarter_df)
+        spreads = pair_spreads(permnos, matrix, permnos_1, permnos_2)
+        valid = ~np.isnan(spreads)
+
+        # OU parameters from the spreads before this quarter, for pairs trading in it
+        fitted = ~np.isnan(history).any(axis=0) & valid.any(axis=0)
+        if fitted.any():
+            theta, mu, half_life = fit_ou(history[:, fitted].T, max_half_life)
+            keep = ~np.isnan(theta)
+            ou_frames.append(pd.DataFrame({
+                'permno_1': permnos_1[fitted][keep],
+                'permno_2': permnos_2[fitted][keep],
+                'quarter': label,
+                'theta': theta[keep],
+                'mu': mu[keep],
+                'half_life': half_life[keep],
+            }))
+        history = _last_valid(np.vstack([history, spreads]), window)
+
+        rows, cols = np.nonzero(valid)
+        partition_dir = os.path.join(spreads_dir, f"{PARTITION_PREFIX}{label}")
+        os.makedirs(partition_dir)
+        pd.DataFrame({
+            'date': dates[rows],
+            'permno_1': permnos_1[cols],
+            'permno_2': permnos_2[cols],
+            'spread': spreads[rows, cols],
+        }).to_parquet(os.path.join(partition_dir, 'part-00000.parquet'), index=False)
+        logger.info("Quarter %s: %d spreads of %d pairs, %d OU fits kept", label, len(rows),
+                    int(valid.any(axis=0).sum()), len(ou_frames[-1]) if fitted.any() else 0)
+        del quarter_df, matrix, spreads
+
+    ou_params = pd.concat(ou_frames, ignore_index=True) if ou_frames else pd.DataFrame(columns=OU_COLUMNS[1:])
+    # One row per pair table entry, for the quarter its group trades in (like the notebook's output)
+    groups = df_pairs[['group_id', 'permno_1', 'permno_2']].assign(quarter=_trading_quarters(df_pairs['group_id']))
+    ou_params = groups.merge(ou_params, on=['permno_1', 'permno_2', 'quarter'])
+    ou_params = ou_params[OU_COLUMNS]
+    ou_params.to_parquet(os.path.join(output_dir, 'ou_params.parquet'), index=False)
+    return ou_params
@@ -0,0 +1,228 @@
+import gc
+import logging
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .backtest_engine import (BacktestEngine, _process_quarter_batch, combine_equity_curves, filter_pairs,
+                              simulation_config)
+from .pair_universe import PairUniverse
+from .performance import calculate_trade_based_metrics
+from .schema import quarter_code_from_label
+
+logger = logging.getLogger(__name__)
+
+# Partition directories are named like Hive partitions, e.g. quarter=2022Q1
+PARTITION_PREFIX = 'quarter='
+
+
+def _quarter_labels(dates):
+    """Calendar-quarter labels ('2022Q1') of a date column"""
+    return pd.to_datetime(dates).dt.to_period('Q').astype(str)
+
+
+def write_quarter_store(df_main, store_dir, part=0):
+    """Append a frame to a quarter-partitioned Parquet store (one part file per quarter touched)"""
+    os.makedirs(store_dir, exist_ok=True)
+    df_main = df_main.copy()
+    df_main['date'] = pd.to_datetime(df_main['date'])
+    for label, quarter_df in df_main.groupby(_quarter_labels(df_main['date']), sort=True):
+        partition_dir = os.path.join(store_dir, f"{PARTITION_PREFIX}{label}")
+        os.makedirs(partition_dir, exist_ok=True)
+        quarter_df.to_parquet(os.path.join(partition_dir, f"part-{part:05d}.parquet"), index=False)
+
+
+def convert_csv_to_store(csv_path, store_dir, chunksize=1_000_000, overwrite=False):
+    """
+    Convert a long (date x permno) CSV such as final_backtest_data.csv to a quarter store.
+
+    The CSV is read in chunks, so the conversion itself never holds the
+    whole file in memory.
+    """
+    if os.path.exists(store_dir):
+        if not overwrite:
+            raise FileExistsError(f"Store {store_dir} already exists; pass overwrite=True to replace it")
+        shutil.rmtree(store_dir)
+
+    n_rows = 0
+    for part, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize)):
+        write_quarter_store(chunk, store_dir, part=part)
+        n_rows += len(chunk)
+    logger.info("Converted %d rows of %s into quarter store %s", n_rows, csv_path, store_dir)
+    return QuarterStore(store_dir)
+
+
+class QuarterStore:
+    """Read access to a quarter-partitioned Parquet store"""
+
+    def __init__(self, store_dir):
+        if not os.path.isdir(store_dir):
+            raise FileNotFoundError(f"Quarter store {store_dir} does not exist")
+        self.store_dir = store_dir
+        self.quarters = sorted(
+            (name[len(PARTITION_PREFIX):] for name in os.listdir(store_dir) if name.startswith(PARTITION_PREFIX)),
+            key=quarter_code_from_label
+        )
+        # Column names of the stored frames, from the schema of the first part file
+        self.columns = []
+        if self.quarters:
+            partition_dir = self._partition_dir(self.quarters[0])
+            first_part = sorted(os.listdir(partition_dir))[0]
+            self.columns = pq.read_schema(os.path.join(partition_dir, first_part)).names
+
+    def _partition_dir(self, label):
+        return os.path.join(self.store_dir, f"{PARTITION_PREFIX}{label}")
+
+    def quarters_between(self, start_date, end_date):
+        """Quarter labels overlapping [start_date, end_date]"""
+        start = pd.Period(pd.Timestamp(start_date), freq='Q')
+        end = pd.Period(pd.Timestamp(end_date), freq='Q')
+        return [label for label in self.quarters if start <= pd.Period(label, freq='Q') <= end]
+
+    def read_quarter(self, label, columns=None):
+        """Load one quarter, optionally only some columns"""
+        if columns is not None:
+            columns = [col for col in columns if col in self.columns]
+        df = pd.read_parquet(self._partition_dir(label), columns=columns)
+        df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    def iter_quarters(self, quarters=None, columns=None, prefetch=1):
+        """
+        Yield (label, frame) one quarter at a time.
+
+        Up to `prefetch` following quarters are read on a background thread
+        while the current one is processed, so at most 1 + prefetch quarters
+        are in memory at once.
+        """
+        quarters = self.quarters if quarters is None else quarters
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = deque()
+            next_idx = 0
+            while next_idx < len(quarters) and len(pending) <= prefetch:
+                pending.append((quarters[next_idx], executor.submit(self.read_quarter, quarters[next_idx], columns)))
+                next_idx += 1
+            while pending:
+                label, future = pending.popleft()
+                frame = future.result()
+                if next_idx < len(quarters):
+                    pending.append((quarters[next_idx],
+                                    executor.submit(self.read_quarter, quarters[next_idx], columns)))
+                    next_idx += 1
+                yield label, frame
+                del frame
+
+
+def run_streaming_backtest(store, df_pairs, hyperparams, output_dir='streaming_trades', quarters=None,
+                           prefetch=1, quiet=True):
+    """
+    Run a backtest quarter by quarter from a QuarterStore.
+
+    Each quarter is loaded (with only the columns the run needs), its signals
+    are generated and it is simulated exactly as in BacktestEngine.run_backtest.
+    Then its closed trades are written to `output_dir` and its data released.
+    Peak memory is bounded by about one quarter (plus the prefetched one),
+    whatever the length of the period.
+
+    Parameters:
+    -----------
+    store : QuarterStore or str
+        Quarter store, or the directory of one
+    df_pairs : pandas DataFrame
+        Pair table (permno_black/permno_white), as for BacktestEngine
+    hyperparams : dict
+        Same keys as for BacktestEngine
+    output_dir : str
+        Directory receiving one trades_<quarter>.parquet file per quarter
+    quarters : list or None
+        Quarter labels to run (e.g. from store.quarters_between); all by default
+    prefetch : int
+        Number of quarters read ahead on a background thread
+    quiet : bool
+        Skip diagnostics and progress bars
+
+    Returns:
+    --------
+    dict : run_backtest-style results; 'trade_log' is read back from the
+        flushed files, which are listed under 'trade_log_files'
+    """
+    if isinstance(store, str):
+        store = QuarterStore(store)
+    os.makedirs(output_dir, exist_ok=True)
+    initial_capital = hyperparams['INITIAL_CAPITAL']
+
+    # Columns the engine selects; everything else stays on disk
+    horizon = hyperparams['HORIZON']
+    columns = ['date', 'permno', 'trading_start', 'group_id', 'adj_prc', 'fed_funds_rate', 'adv20', 'vwretd',
+               'garch_vol', f"z_{hyperparams['ZSCORE_METHOD']}_{horizon}d_lb{hyperparams['LOOKBACK_PERIOD']}",
+               f'future_cumret_{horizon}d']
+
+    pair_universe = PairUniverse(filter_pairs(df_pairs, hyperparams['CORRELATION_THRESHOLD'],
+                                              hyperparams['COINTEGRATION_THRESHOLD']))
+    sim_config = simulation_config(hyperparams)
+
+    trade_log_files = []
+    quarterly_results = {}
+    quarter_equity_curves = {}
+    market_frames = []
+
+    for label, quarter_df in store.iter_quarters(quarters, columns=columns, prefetch=prefetch):
+        engine = BacktestEngine(quarter_df, df_pairs, hyperparams, quiet=quiet, pair_universe=pair_universe)
+        del quarter_df
+
+        for quarter in engine.quarters:
+            signal_generator = engine.create_signal_generator()
+            result = _process_quarter_batch(quarter, engine.df_main, pair_universe, signal_generator,
+                                            [sim_config])[0]
+
+            # Flush the quarter's closed trades and keep only its (small) daily equity curve
+            trade_log_file = os.path.join(output_dir, f"trades_{result['quarter']}.parquet")
+            pd.DataFrame(result['trade_log']).to_parquet(trade_log_file, index=False)
+            trade_log_files.append(trade_log_file)
+            quarterly_results[result['quarter']] = {
+                'num_trades': len(result['trade_log']),
+                'equity_curve': result['equity_curve']
+            }
+            if result['equity_curve'] is not None:
+                quarter_equity_curves[result['quarter']] = result['equity_curve']
+            logger.info("Quarter %s: %d closed trades flushed to %s", result['quarter'],
+                        len(result['trade_log']), trade_log_file)
+            del signal_generator, result
+
+        market_frames.append(engine.df_main.drop_duplicates('date')[['date', 'vwretd', 'fed_funds_rate']])
+        del engine
+        gc.collect()
+
+    equity_curve = combine_equity_curves(
+        [quarter_equity_curves[q] for q in sorted(quarter_equity_curves, key=quarter_code_from_label)],
+        initial_capital)
+
+    trade_logs = [pd.read_parquet(path) for path in trade_log_files]
+    trade_logs = [log for log in trade_logs if not log.empty]
+    trade_df = pd.concat(trade_logs, ignore_index=True) if trade_logs else pd.DataFrame()
+
+    performance_metrics = {}
+    if len(trade_df) > 0:
+        market_data = pd.concat(market_frames).drop_duplicates('date').set_index('date')
+        performance_metrics = calculate_trade_based_metrics(
+            trade_df=trade_df.copy(),
+            market_returns=market_data['vwretd'].to_dict(),
+            ffr_lookup=market_data['fed_funds_rate'].to_dict(),
+            initial_capital=initial_capital,
+            equity_curve=equity_curve.set_index('date')['equity']
+        )
+    else:
+        logger.info("No closed trades found, using empty metrics")
+
+    return {
+        'trade_log': trade_df,
+        'performance': performance_metrics,
+        'hyperparams': hyperparams,
+        'quarterly_results': quarterly_results,
+        'equity_curve': equity_curve,
+        'trade_log_files': trade_log_files
+    }
@@ -0,0 +1,235 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# Preset universe sizes used by the benchmark suite
+SCALES = {
+    'small': {'n_stocks': 100, 'n_groups': 4, 'n_pairs': 150, 'n_days': 63},
+    'medium': {'n_stocks': 500, 'n_groups': 10, 'n_pairs': 1_000, 'n_days': 252},
+    'large': {'n_stocks': 2_000, 'n_groups': 40, 'n_pairs': 10_000, 'n_days': 504},
+}
+
+
+def _simulate_ou(rng, n_days, n_stocks, theta, sigma):
+    """Simulate mean-zero OU paths (days x stocks) with stationary start"""
+    paths = np.empty((n_days, n_stocks))
+    stationary_std = sigma / np.sqrt(2 * theta)
+    paths[0] = rng.normal(0, stationary_std, n_stocks)
+    decay = np.exp(-theta)
+    shock_std = stationary_std * np.sqrt(1 - decay ** 2)
+    shocks = rng.normal(0, 1, (n_days, n_stocks)) * shock_std
+    for t in range(1, n_days):
+        paths[t] = paths[t - 1] * decay + shocks[t]
+    return paths
+
+
+def generate_synthetic_market_data(n_stocks=100, n_groups=4, n_pairs=150, n_days=63,
+                                   start_date='2022-01-03', horizons=(5, 10, 20),
+                                   lookback_periods=(5, 10, 20), zscore_methods=('classical', 'ou'),
+                                   seed=0):
+    """
+    Generate a synthetic dataset shaped like the WRDS-derived backtest inputs.
+
+    Parameters:
+    -----------
+    n_stocks : int
+        Number of stocks (permnos) in the universe
+    n_groups : int
+        Number of peer groups formed each calendar quarter
+    n_pairs : int
+        Number of candidate pairs per calendar quarter, spread across groups
+    n_days : int
+        Number of business days to simulate
+    start_date : str
+        First trading date
+    horizons, lookback_periods, zscore_methods : iterables
+        Which `z_{method}_{h}d_lb{lb}` and `future_cumret_{h}d` columns to emit
+    seed : int
+        Random seed; the same arguments always produce the same frames
+
+    Returns:
+    --------
+    tuple : (df_main, df_pairs) shaped like `final_backtest_data.csv` and
+        `corr_coin.csv` (pairs keep the raw `permno_1`/`permno_2` names)
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start=start_date, periods=n_days)
+    permnos = np.arange(10001, 10001 + n_stocks)
+
+    # Daily returns: market factor plus idiosyncratic noise with per-stock volatility
+    market = rng.normal(0.0004, 0.01, n_days)
+    stock_vol = rng.uniform(0.01, 0.03, n_stocks)
+    betas = rng.uniform(0.6, 1.4, n_stocks)
+    retx = market[:, None] * betas[None, :] + rng.normal(0, 1, (n_days, n_stocks)) * stock_vol[None, :]
+    start_prices = rng.uniform(10, 200, n_stocks)
+    adj_prc = start_prices[None, :] * np.exp(np.cumsum(retx, axis=0))
+
+    # Volume and volatility features
+    base_volume = np.exp(rng.uniform(np.log(5e4), np.log(5e6), n_stocks))
+    volume = base_volume[None, :] * rng.lognormal(0, 0.3, (n_days, n_stocks))
+    adv20 = pd.DataFrame(volume).rolling(20, min_periods=1).mean().values
+    garch_vol = stock_vol[None, :] * np.exp(_simulate_ou(rng, n_days, n_stocks, 0.05, 0.05))
+
+    # Fed Funds Rate as a slowly drifting annual rate in decimals
+    fed_funds_rate = np.clip(0.02 + np.cumsum(rng.normal(0, 0.0005, n_days)), 0.0, 0.08)
+
+    # Peer groups are re-formed every quarter, labelled by the formation quarter
+    quarter_periods = dates.to_period('Q')
+    quarters = quarter_periods.unique()
+    group_assignments = np.empty((n_days, n_stocks), dtype=object)
+    pair_frames = []
+    for quarter in quarters:
+        formation = quarter - 1
+        prefix = f"{formation.year}-Q{formation.quarter}"
+        members = rng.integers(0, n_groups, n_stocks)
+        labels = np.array([f"{prefix}-{g:02d}" for g in range(n_groups)], dtype=object)
+        group_assignments[quarter_periods == quarter] = labels[members]
+
+        # Sample pairs within groups
+        pair_group = rng.integers(0, n_groups, n_pairs)
+        rows = []
+        for g in range(n_groups):
+            group_members = permnos[members == g]
+            if len(group_members) < 2:
+                continue
+            k = int((pair_group == g).sum())
+            if k == 0:
+                continue
+            first = rng.integers(0, len(group_members), k)
+            offset = rng.integers(1, len(group_members), k)
+            second = (first + offset) % len(group_members)
+            rows.append(pd.DataFrame({
+                'group_id': labels[g],
+                'permno_1': group_members[first],
+                'permno_2': group_members[second],
+            }))
+        if rows:
+            pair_frames.append(pd.concat(rows, ignore_index=True))
+
+    df_pairs = pd.concat(pair_frames, ignore_index=True).drop_duplicates(['group_id', 'permno_1', 'permno_2'])
+    n_obs = len(df_pairs)
+    df_pairs['correlation'] = rng.uniform(0.3, 0.99, n_obs)
+    df_pairs['adf_stat'] = rng.uniform(-6.0, -1.0, n_obs)
+    df_pairs['p_value'] = rng.uniform(0.0, 0.1, n_obs)
+    df_pairs['n_obs'] = rng.integers(30, n_days + 30, n_obs)
+    df_pairs['half_life'] = rng.uniform(1.0, 20.0, n_obs)
+    df_pairs = df_pairs.reset_index(drop=True)
+
+    # Assemble the long (date x permno) frame
+    df_main = pd.DataFrame({
+        'date': np.repeat(dates.values, n_stocks),
+        'permno': np.tile(permnos, n_days),
+        'trading_start': np.repeat(quarter_periods.start_time.values, n_stocks),
+        'group_id': group_assignments.ravel(),
+        'retx': retx.ravel(),
+        'adj_prc': adj_prc.ravel(),
+        'fed_funds_rate': np.repeat(fed_funds_rate, n_stocks),
+        'adv20': adv20.ravel(),
+        'vwretd': np.repeat(market, n_stocks),
+        'garch_vol': garch_vol.ravel(),
+    })
+
+    # Forward cumulative returns
+    for h in horizons:
+        forward = pd.DataFrame(retx).shift(-1).rolling(h).sum().shift(-(h - 1)).values
+        df_main[f'future_cumret_{h}d'] = forward.ravel()
+
+    # OU-like z-scores: a shared mean-reverting path per stock plus variant noise,
+    # scaled so that |z| >= 1 is common and pair z-diffs cross zero regularly
+    base_z = _simulate_ou(rng, n_days, n_stocks, 0.3, 0.9)
+    for method in zscore_methods:
+        for h in horizons:
+            for lb in lookback_periods:
+                noise = rng.normal(0, 0.25, (n_days, n_stocks))
+                df_main[f'z_{method}_{h}d_lb{lb}'] = (base_z + noise).ravel()
+
+    return df_main, df_pairs
+
+
+def generate_scaled_data(scale='small', seed=0, **overrides):
+    """Generate synthetic data for one of the preset SCALES"""
+    if scale not in SCALES:
+        raise ValueError(f"Invalid scale: {scale}. Use one of {list(SCALES)}.")
+    kwargs = dict(SCALES[scale])
+    kwargs.update(overrides)
+    return generate_synthetic_market_data(seed=seed, **kwargs)
+
+
+# Compustat fundq items of the fixture (those the fundamentals features use)
+FUNDQ_ITEMS = ['atq', 'saleq', 'cogsq', 'niq', 'oiadpq', 'xrdq', 'capxy', 'actq', 'cheq', 'lctq', 'dd1q',
+               'txpq', 'dpq']
+
+
+def write_wrds_fixture(directory, start_year=2014, end_year=2015, n_stocks=20, seed=0):
+    """
+    Write a small SQLite stand-in for the WRDS tables the data notebooks query.
+
+    Creates crsp.db (dsf, msenames, dsi), frb.db (rates_daily) and
+    comp_na_daily_all.db (fundq) in directory, with dates stored as
+    'YYYY-MM-DD' text; extraction.sqlite_source(directory) attaches them
+    under those schema names.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    dates = pd.bdate_range(f"{start_year}-01-01", f"{end_year}-12-31")
+    n_days = len(dates)
+    permnos = np.arange(10001, 10001 + n_stocks)
+    day_text = dates.strftime('%Y-%m-%d')
+
+    market = rng.normal(0.0004, 0.01, n_days)
+    retx = market[:, None] + rng.normal(0, 0.02, (n_days, n_stocks))
+    prc = rng.uniform(10, 200, n_stocks)[None, :] * np.exp(np.cumsum(retx, axis=0))
+    dsf = pd.DataFrame({
+        'date': np.repeat(day_text, n_stocks),
+        'permno': np.tile(permnos, n_days),
+        'prc': prc.ravel(),
+        'vol': rng.integers(10_000, 5_000_000, n_days * n_stocks),
+        'ret': retx.ravel(),
+        'retx': retx.ravel(),
+        'shrout': np.tile(rng.integers(1_000, 500_000, n_stocks), n_days),
+        'cfacpr': 1.0,
+        'cfacshr': 1.0,
+    })
+    dsf['bidlo'] = dsf['prc'] * 0.99
+    dsf['askhi'] = dsf['prc'] * 1.01
+    dsf['openprc'] = dsf['prc']
+    msenames = pd.DataFrame({
+        'permno': permnos,
+        'namedt': f"{start_year - 5}-01-01",
+        'nameendt': f"{end_year + 5}-12-31",
+        'ticker': [f"T{permno}" for permno in permnos],
+        'shrcd': 10,
+        'exchcd': 1,
+    })
+    dsi = pd.DataFrame({'date': day_text, 'vwretd': market, 'vwretx': market})
+
+    rates = np.clip(0.5 + np.cumsum(rng.normal(0, 0.02, n_days)), 0.0, 8.0)
+    rates_daily = pd.DataFrame({'date': day_text, 'dff': rates, 'effr': rates})
+
+    quarter_ends = pd.date_range(f"{start_year}-01-01", f"{end_year}-12-31", freq='QE')
+    n_rows = len(quarter_ends) * n_stocks
+    fundq = pd.DataFrame({
+        'gvkey': np.tile([f"{gvkey:06d}" for gvkey in range(1, n_stocks + 1)], len(quarter_ends)),
+        'datadate': np.repeat(quarter_ends.strftime('%Y-%m-%d'), n_stocks),
+        'fqtr': np.repeat(quarter_ends.quarter, n_stocks).astype(float),
+        'indfmt': 'INDL',
+        'datafmt': 'STD',
+        'popsrc': 'D',
+        'consol': 'C',
+    })
+    for item in FUNDQ_ITEMS:
+        fundq[item] = rng.lognormal(4, 1, n_rows)
+
+    tables = {
+        'crsp': {'dsf': dsf, 'msenames': msenames, 'dsi': dsi},
+        'frb': {'rates_daily': rates_daily},
+        'comp_na_daily_all': {'fundq': fundq},
+    }
+    for schema, frames in tables.items():
+        with sqlite3.connect(os.path.join(directory, f"{schema}.db")) as connection:
+            for table, frame in frames.items():
+                frame.to_sql(table, connection, if_exists='replace', index=False)
+        connection.close()
+    return directory
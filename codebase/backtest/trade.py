@@ -15,12 +15,22 @@ class Trade:
     DEFAULT_LONG_SPREAD = 0.015  # 150 bps over Fed Funds
     DAYS_PER_YEAR = 365
     
+    # Transaction cost per share traded, charged on entry and on exit
+    DEFAULT_COST_PER_SHARE = 0.01
+    
+    # Which limit set the share counts: 'liquidity' when the ADV cap bound both
+    # legs, 'capital' otherwise (sizing then depends on available capital)
+    SIZING_CONSTRAINTS = ['liquidity', 'capital']
+    
     def __init__(self, entry_date, permno_black, permno_white, side, z_diff_entry,
                  investment_black, investment_white, shares_black, shares_white,
                  entry_price_black, entry_price_white, entry_transaction_cost,
                  zscore_method, horizon, lookback, 
                  short_spread=DEFAULT_SHORT_SPREAD, 
-                 long_spread=DEFAULT_LONG_SPREAD):
+                 long_spread=DEFAULT_LONG_SPREAD,
+                 cost_per_share=DEFAULT_COST_PER_SHARE,
+                 sizing_constraint=None,
+                 group_id=None):
         """Initialize a new trade."""
         # Validate inputs
         self._validate_inputs(entry_date, side, investment_black, investment_white, 
@@ -34,6 +44,8 @@ class Trade:
         self.entry_date = entry_date
         self.permno_black = permno_black
         self.permno_white = permno_white
+        # Peer group of the signal; a pair re-formed in later quarters belongs to several
+        self.group_id = group_id
         self.side = side
         self.z_diff_entry = z_diff_entry
         self.investment_black = investment_black
@@ -49,9 +61,11 @@ class Trade:
         self.horizon = horizon
         self.lookback = lookback
         
-        # Financing parameters
+        # Financing and cost parameters
         self.short_spread = short_spread
         self.long_spread = long_spread
+        self.cost_per_share = cost_per_share
+        self.sizing_constraint = sizing_constraint
         
         # Status tracking
         self.status = 'open'
@@ -159,6 +173,12 @@ class Trade:
         
         return current_value
     
+    @property
+    def mark_to_market_pnl(self):
+        """PnL at the last market-value mark, less entry and accrued financing costs"""
+        invested = self.investment_black + self.investment_white
+        return self.current_value - invested - self.entry_transaction_cost - self.financing_cost
+    
     def close_trade(self, exit_date, exit_price_black, exit_price_white, exit_reason, z_diff_exit):
         """Close the trade and calculate PnL."""
         self.exit_date = exit_date
@@ -167,8 +187,8 @@ class Trade:
         self.exit_reason = exit_reason
         self.z_diff_exit = z_diff_exit
         
-        # Calculate transaction costs for exit (0.01 per share)
-        self.exit_transaction_cost = 0.01 * (self.shares_black + self.shares_white)
+        # Calculate transaction costs for exit (cost_per_share per share)
+        self.exit_transaction_cost = self.cost_per_share * (self.shares_black + self.shares_white)
         
         # Calculate PnL for each leg
         if self.side == 'short_black_long_white':
@@ -202,6 +222,18 @@ class Trade:
         
         return self.net_pnl
     
+    def set_transaction_costs(self, entry_transaction_cost=None, exit_transaction_cost=None):
+        """Replace entry and/or exit costs (e.g. once orders are netted across pairs), updating net PnL"""
+        if entry_transaction_cost is not None:
+            self.entry_transaction_cost = entry_transaction_cost
+        if exit_transaction_cost is not None:
+            self.exit_transaction_cost = exit_transaction_cost
+        if self.status == 'closed':
+            total_costs = self.entry_transaction_cost + self.exit_transaction_cost + self.financing_cost
+            self.net_pnl = self.gross_pnl - total_costs
+            self.daily_values[self.exit_date] = self.investment_black + self.investment_white + self.net_pnl
+            self.roi = self.net_pnl / (self.investment_black + self.investment_white)
+    
     def to_dict(self):
         """Convert trade object to dictionary for logging and analysis."""
         return {
@@ -210,6 +242,7 @@ class Trade:
             'exit_date': self.exit_date,
             'permno_black': self.permno_black,
             'permno_white': self.permno_white,
+            'group_id': self.group_id,
             'side': self.side,
             'z_diff_entry': self.z_diff_entry,
             'z_diff_exit': self.z_diff_exit,
@@ -233,5 +266,9 @@ class Trade:
             'max_drawdown': self.max_drawdown,
             'zscore_method': self.zscore_method,
             'horizon': self.horizon,
-            'lookback': self.lookback
+            'lookback': self.lookback,
+            'cost_per_share': self.cost_per_share,
+            'short_spread': self.short_spread,
+            'long_spread': self.long_spread,
+            'sizing_constraint': self.sizing_constraint
         }
\ No newline at end of file
@@ -0,0 +1,256 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+from .fundamentals import _group_starts
+from .scheduler import MemoryScheduler
+
+logger = logging.getLogger(__name__)
+
+# Horizons (trading days) of the realized volatility targets
+VOL_HORIZONS = (5, 10, 20)
+
+# Trailing windows of the rolling-volatility forecasters, which need 75% of the window, as in the GARCH notebook
+ROLLING_WINDOWS = (5, 10, 20)
+ROLLING_MIN_SHARE = 0.75
+
+# Decay factors of the EWMA (RiskMetrics) forecasters and the returns each needs before forecasting
+EWMA_LAMBDAS = (0.94,)
+EWMA_MIN_PERIODS = 20
+
+LOSSES = ('mse', 'mae', 'qlike')
+
+# Stock chunks per worker, so uneven chunks still balance
+CHUNKS_PER_WORKER = 4
+
+
+def rolling_column(window):
+    return f'rolling_vol_{window}d_daily'
+
+
+def ewma_column(lam):
+    return f'ewma_vol_{round(lam * 100):d}'
+
+
+def realized_column(horizon):
+    return f'realized_vol_{horizon}d'
+
+
+def _rolling_std(values, starts, window, min_periods):
+    """Trailing sample std over `window` rows of the same group, NaN with fewer than min_periods finite values"""
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    rows = np.arange(len(values))
+    in_group = rows[:, None] - (window - 1) + np.arange(window) >= starts[:, None]
+    windows = np.where(in_group, sliding_window_view(padded, window), np.nan)
+    finite = np.isfinite(windows)
+    count = finite.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(finite, windows, 0).sum(axis=1) / count
+        var = np.where(finite, (windows - mean[:, None]) ** 2, 0).sum(axis=1) / (count - 1)
+    return np.where(count >= max(min_periods, 2), np.sqrt(var), np.nan)
+
+
+def _realized_vol(values, starts, horizon):
+    """Sample std of the next `horizon` returns of the same group (t+1..t+horizon), NaN unless all are present"""
+    trailing = _rolling_std(values, starts, horizon, horizon)
+    realized = np.full(len(values), np.nan)
+    ahead = np.arange(horizon, len(values))
+    same_group = starts[ahead] == starts[ahead - horizon]
+    realized[ahead[same_group] - horizon] = trailing[ahead[same_group]]
+    return realized
+
+
+def _ewma_vol(values, starts, lam, min_periods):
+    """RiskMetrics volatility of every group: var_t = lam * var_t-1 + (1 - lam) * r_t^2, skipping missing returns"""
+    result = np.full(len(values), np.nan)
+    bounds = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1], True])
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        squared = values[start:stop] ** 2
+        observed = np.isfinite(squared)
+        if observed.sum() < max(min_periods, 1):
+            continue
+        x = squared[observed]
+        var = np.empty(len(squared))
+        var[observed] = lfilter([1 - lam], [1, -lam], x, zi=[lam * x[0]])[0]
+        # Days without a return carry the last variance
+        last = np.maximum.accumulate(np.where(observed, np.arange(len(squared)), 0))
+        var = var[last]
+        result[start:stop] = np.where(np.cumsum(observed) >= min_periods, np.sqrt(var), np.nan)
+    return result
+
+
+def _chunk_forecasts(returns, starts, rolling_windows, ewma_lambdas):
+    forecasts = {}
+    for window in rolling_windows:
+        forecasts[rolling_column(window)] = _rolling_std(returns, starts, window,
+                                                         int(window * ROLLING_MIN_SHARE))
+    for lam in ewma_lambdas:
+        forecasts[ewma_column(lam)] = _ewma_vol(returns, starts, lam, EWMA_MIN_PERIODS)
+    return forecasts
+
+
+def _losses(realized, forecast):
+    """Squared error and absolute error of the volatility, QLIKE of the variance (Patton's, zero when exact)"""
+    ratio = (realized / forecast) ** 2
+    return (realized - forecast) ** 2, np.abs(realized - forecast), ratio - np.log(ratio) - 1
+
+
+def _chunk_sums(returns, starts, codes, n_codes, given, horizons, rolling_windows, ewma_lambdas):
+    """
+    Per-stock loss sums of one chunk of whole stocks.
+
+    Returns (n_obs, sums) with n_obs (horizon, stock) and sums (horizon,
+    forecaster, loss, stock), over the rows where the target and every
+    forecaster are positive and finite.
+    """
+    forecasts = {**given, **_chunk_forecasts(returns, starts, rolling_windows, ewma_lambdas)}
+    forecast_matrix = np.array(list(forecasts.values()))
+    n_obs = np.zeros((len(horizons), n_codes))
+    sums = np.zeros((len(horizons), len(forecasts), len(LOSSES), n_codes))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        usable = np.all(np.isfinite(forecast_matrix) & (forecast_matrix > 0), axis=0)
+        for i, horizon in enumerate(horizons):
+            realized = _realized_vol(returns, starts, horizon)
+            rows = usable & np.isfinite(realized) & (realized > 0)
+            n_obs[i] = np.bincount(codes[rows], minlength=n_codes)
+            for j, forecast in enumerate(forecast_matrix):
+                for k, loss in enumerate(_losses(realized[rows], forecast[rows])):
+                    sums[i, j, k] = np.bincount(codes[rows], weights=loss, minlength=n_codes)
+    return n_obs, sums
+
+
+def vol_forecasts(df, rolling_windows=ROLLING_WINDOWS, ewma_lambdas=EWMA_LAMBDAS, horizons=VOL_HORIZONS,
+                  return_col='retx'):
+    """
+    Rolling and EWMA volatility forecasts and realized volatility targets of a (date, permno) return panel.
+
+    Returns a frame aligned with df holding rolling_vol_<w>d_daily,
+    ewma_vol_<lambda> and realized_vol_<h>d columns (daily units). Each
+    forecast on day t uses returns up to t; the realized volatility is the
+    std of the returns of t+1..t+h.
+    """
+    order = np.lexsort((df['date'].to_numpy(), df['permno'].to_numpy()))
+    returns = df[return_col].to_numpy(dtype=np.float64)[order]
+    starts = _group_starts(df['permno'].to_numpy()[order])
+    columns = _chunk_forecasts(returns, starts, rolling_windows, ewma_lambdas)
+    for horizon in horizons:
+        columns[realized_column(horizon)] = _realized_vol(returns, starts, horizon)
+    result = pd.DataFrame(index=df.index)
+    for name, values in columns.items():
+        unsorted = np.empty(len(values))
+        unsorted[order] = values
+        result[name] = unsorted
+    return result
+
+
+def evaluate_vol_forecasts(df, forecast_cols=('garch_vol',), horizons=VOL_HORIZONS, rolling_windows=ROLLING_WINDOWS,
+                           ewma_lambdas=EWMA_LAMBDAS, return_col='retx', memory_limit=None, max_workers=None):
+    """
+    Compare volatility forecasters against realized volatility, per stock and pooled, at several horizons.
+
+    The forecasters are the columns of df in `forecast_cols` (e.g. the
+    notebook's garch_vol) plus the rolling-window and EWMA forecasts built
+    from `return_col`. Each is scored against the realized volatility of the
+    next h returns (daily units) for every horizon h. All forecasters of a
+    horizon are scored on the same rows (target and every forecast positive
+    and finite), so their losses are comparable.
+
+    The panel is sorted by (permno, date) once and split into chunks of
+    whole stocks, which run on a MemoryScheduler. Every chunk builds its
+    forecasts and targets with array operations and reduces its losses per
+    stock with bincount, so there is no per-stock Python loop besides the
+    EWMA filter.
+
+    Parameters:
+    -----------
+    df : pandas DataFrame
+        Panel with date, permno, return_col and forecast_cols
+    forecast_cols : sequence of str
+        Forecast columns of df to evaluate next to the built ones (missing ones are skipped)
+    horizons : sequence of int
+        Realized-volatility horizons in trading days
+    rolling_windows, ewma_lambdas : sequence
+        Rolling-window and EWMA forecasters to build (empty to skip)
+    memory_limit, max_workers
+        MemoryScheduler settings
+
+    Returns:
+    --------
+    dict
+        'per_stock': one row per (permno, horizon, forecaster) with n_obs,
+        mse, mae and qlike; 'summary': one row per (horizon, forecaster)
+        with pooled n_obs, mse, mae and qlike, the mean of the per-stock
+        losses (stock_mse, ...) and win rates, the share of stocks for which
+        the forecaster has the lowest loss (ties go to the earlier forecaster,
+        given columns first).
+    """
+    forecast_cols = [col for col in forecast_cols if col in df.columns]
+    forecasters = (forecast_cols + [rolling_column(window) for window in rolling_windows]
+                   + [ewma_column(lam) for lam in ewma_lambdas])
+    if not forecasters:
+        raise ValueError("No forecasters to evaluate")
+    horizons = list(horizons)
+
+    order = np.lexsort((df['date'].to_numpy(), df['permno'].to_numpy()))
+    permnos, codes = np.unique(df['permno'].to_numpy()[order], return_inverse=True)
+    returns = df[return_col].to_numpy(dtype=np.float64)[order]
+    given = {col: df[col].to_numpy(dtype=np.float64)[order] for col in forecast_cols}
+
+    # Chunks of whole stocks with about the same number of rows
+    scheduler = MemoryScheduler(memory_limit=memory_limit, max_workers=max_workers)
+    n_chunks = min(len(permnos), scheduler.max_workers * CHUNKS_PER_WORKER)
+    stock_starts = np.searchsorted(codes, np.arange(len(permnos)))
+    cuts = np.minimum(np.searchsorted(stock_starts, np.linspace(0, len(codes), n_chunks + 1)[1:-1]),
+                      len(permnos) - 1)
+    bounds = np.unique(np.r_[0, stock_starts[cuts], len(codes)])
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+
+    def run_chunk(chunk):
+        start, stop = chunk
+        chunk_codes = codes[start:stop] - codes[start]
+        return _chunk_sums(returns[start:stop], _group_starts(chunk_codes), chunk_codes, int(chunk_codes[-1]) + 1,
+                           {col: values[start:stop] for col, values in given.items()}, horizons, rolling_windows,
+                           ewma_lambdas)
+
+    # Rolling windows dominate: rows x window floats per forecaster and target
+    widest = max(list(rolling_windows) + horizons)
+    estimates = [(stop - start) * widest * np.float64().itemsize * 2 for start, stop in chunks]
+    results = scheduler.map(run_chunk, chunks, estimates)
+    n_obs = np.concatenate([result[0] for result in results], axis=1)
+    sums = np.concatenate([result[1] for result in results], axis=3)
+    logger.info("Evaluated %d forecasters on %d stocks at horizons %s", len(forecasters), len(permnos), horizons)
+
+    per_stock_rows = []
+    summary_rows = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / n_obs[:, None, None, :]
+        for i, horizon in enumerate(horizons):
+            scored = n_obs[i] > 0
+            # Forecaster with the lowest loss per stock; argmin takes the first of ties
+            winners = np.argmin(means[i][:, :, scored], axis=0) if scored.any() else np.empty((len(LOSSES), 0))
+            for j, forecaster in enumerate(forecasters):
+                per_stock = pd.DataFrame({'permno': permnos[scored], 'horizon': horizon, 'forecaster': forecaster,
+                                          'n_obs': n_obs[i, scored].astype(np.int64),
+                                          **{loss: means[i, j, k, scored] for k, loss in enumerate(LOSSES)}})
+                per_stock_rows.append(per_stock)
+                total = n_obs[i].sum()
+                summary = {'horizon': horizon, 'forecaster': forecaster, 'n_obs': int(total),
+                           'n_stocks': int(scored.sum())}
+                for k, loss in enumerate(LOSSES):
+                    summary[loss] = sums[i, j, k].sum() / total if total else np.nan
+                for k, loss in enumerate(LOSSES):
+                    summary[f'stock_{loss}'] = means[i, j, k, scored].mean() if scored.any() else np.nan
+                for k, loss in enumerate(LOSSES):
+                    summary[f'win_rate_{loss}'] = (winners[k] == j).mean() if scored.any() else np.nan
+                summary_rows.append(summary)
+
+    return {'per_stock': pd.concat(per_stock_rows, ignore_index=True), 'summary': pd.DataFrame(summary_rows)}
+
+
+def best_forecasters(summary, loss='qlike'):
+    """Forecaster with the lowest pooled loss at every horizon of an evaluate_vol_forecasts summary"""
+    best = summary.loc[summary.groupby('horizon')[loss].idxmin()]
+    return best[['horizon', 'forecaster', loss, f'win_rate_{loss}']].reset_index(drop=True)